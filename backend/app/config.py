@@ -46,6 +46,12 @@ class Settings:
     
     # Prioritize Docker secret, fall back to environment variable for development
     ELASTIC_PASSWORD: str = get_secret("elastic_password") or os.getenv("ELASTIC_PASSWORD")
+    # Connection pool size per ES node (shared by all concurrent requests) and
+    # the default per-request timeout in seconds.
+    ES_CONNECTIONS_PER_NODE: int = int(os.getenv("ES_CONNECTIONS_PER_NODE", 25))
+    ES_REQUEST_TIMEOUT: int = int(os.getenv("ES_REQUEST_TIMEOUT", 60))
+    # How long index/alias existence checks are cached (see services/es_index_cache.py).
+    ES_INDEX_CACHE_TTL_SECONDS: int = int(os.getenv("ES_INDEX_CACHE_TTL_SECONDS", 60))
     
     #if not all([ELASTICSEARCH_URI, ELASTIC_USER, ELASTIC_PASSWORD, ELASTICSEARCH_SSL_CA_CERTS]):
         #raise ValueError("❌ Missing required Elasticsearch configuration.")
@@ -70,4 +76,74 @@ class Settings:
 
 
     TRUSTED_SCANNER_IPS: list[str] = list(set(["127.0.0.1", _host_ip]))
-settings = Settings()
+
+    # --- Packet ingest pipeline ---
+    # The packet writer flushes a batch when it reaches this many rows or when
+    # the oldest packet in it has waited this long, whichever comes first.
+    PACKET_BATCH_MAX_ROWS: int = int(os.getenv("PACKET_BATCH_MAX_ROWS", 5000))
+    PACKET_BATCH_MAX_LATENCY_MS: int = int(os.getenv("PACKET_BATCH_MAX_LATENCY_MS", 250))
+    # Number of processes decoding the tshark EK stream. 1 keeps the single
+    # json_sniffer_process; 0 means one worker per CPU core.
+    PACKET_DECODER_WORKERS: int = int(os.getenv("PACKET_DECODER_WORKERS", 1)) or (os.cpu_count() or 1)
+    # Slots in each decoder's shared-memory packet ring (40 bytes per packet).
+    # Packets arriving while a ring is full are dropped and counted.
+    PACKET_RING_CAPACITY: int = int(os.getenv("PACKET_RING_CAPACITY", 262144))
+
+    # --- WebSocket fan-out ---
+    # Messages are coalesced into one frame per interval; packets beyond the
+    # per-frame cap are sampled. Each client buffers at most this many frames
+    # before its oldest ones are dropped.
+    WS_FRAME_INTERVAL_MS: int = int(os.getenv("WS_FRAME_INTERVAL_MS", 100))
+    WS_MAX_MESSAGES_PER_FRAME: int = int(os.getenv("WS_MAX_MESSAGES_PER_FRAME", 500))
+    WS_CLIENT_QUEUE_FRAMES: int = int(os.getenv("WS_CLIENT_QUEUE_FRAMES", 50))
+
+    # --- Zeek rollups (see services/zeek_rollup.py) ---
+    # A background job keeps per-minute and per-hour summaries of Zeek conn logs
+    # so timeline/conn-state/bandwidth widgets don't re-aggregate raw documents.
+    # Minutes are rolled up once they are SETTLE_SECONDS old, and the last
+    # LATE_MINUTES are recomputed on every pass to pick up late-shipped logs.
+    ZEEK_ROLLUP_ENABLED: bool = os.getenv("ZEEK_ROLLUP_ENABLED", "true").lower() == "true"
+    ZEEK_ROLLUP_INTERVAL_SECONDS: int = int(os.getenv("ZEEK_ROLLUP_INTERVAL_SECONDS", 60))
+    ZEEK_ROLLUP_SETTLE_SECONDS: int = int(os.getenv("ZEEK_ROLLUP_SETTLE_SECONDS", 60))
+    ZEEK_ROLLUP_LATE_MINUTES: int = int(os.getenv("ZEEK_ROLLUP_LATE_MINUTES", 5))
+    # Zeek logs a connection when it ends but stamps it with its start time, so the
+    # late window also grows to the longest connection duration seen recently, up to
+    # this many minutes. Connections that last longer are only counted in raw queries.
+    ZEEK_ROLLUP_MAX_CONN_AGE_MINUTES: int = int(os.getenv("ZEEK_ROLLUP_MAX_CONN_AGE_MINUTES", 120))
+    # How far back rollups are backfilled and kept (the detailed view goes up to 168 h).
+    ZEEK_ROLLUP_RETENTION_HOURS: int = int(os.getenv("ZEEK_ROLLUP_RETENTION_HOURS", 169))
+
+    # --- Suricata alert ingestion (see services/log_parser.py) ---
+    # eve.json is read in blocks; alerts are inserted and broadcast in batches of at most this many.
+    ALERT_BATCH_MAX_ROWS: int = int(os.getenv("ALERT_BATCH_MAX_ROWS", 500))
+    # Where the log tailers keep their (inode, offset) checkpoints; must be writable.
+    LOG_TAILER_CHECKPOINT_DIR: str = os.getenv("LOG_TAILER_CHECKPOINT_DIR", "/var/lib/netguard/tailer")
+
+    # Rows in the in-memory Zeek connection store (~60 bytes each, see
+    # services/zeek_conn_store.py). 0 disables the store and the conn.log tailer.
+    ZEEK_CONN_STORE_CAPACITY: int = int(os.getenv("ZEEK_CONN_STORE_CAPACITY", 1_000_000))
+    # The conn.log it is fed from: local.zeek writes to Log::default_logdir (/opt/zeek/logs).
+    ZEEK_CONN_LOG_FILE: str = os.getenv("ZEEK_CONN_LOG_FILE", "/opt/zeek/logs/conn.log")
+
+    # --- Live traffic aggregator (see services/traffic_aggregator.py) ---
+    # Seconds of per-second history kept in memory (the bandwidth widget asks for
+    # at most 300) and the networks whose outgoing packets count as egress.
+    TRAFFIC_WHEEL_SECONDS: int = int(os.getenv("TRAFFIC_WHEEL_SECONDS", 600))
+    LOCAL_NETWORKS: str = os.getenv("LOCAL_NETWORKS", "10.0.0.0/8,172.16.0.0/12,192.168.0.0/16,fc00::/7")
+
+    # --- PostgreSQL partitions (see services/db_partitions.py) ---
+    # network_packets and security_alerts are split into daily partitions; expired
+    # days are dropped whole. 0 keeps every partition (alerts are kept by default).
+    PACKET_RETENTION_DAYS: int = int(os.getenv("PACKET_RETENTION_DAYS", 7))
+    ALERT_RETENTION_DAYS: int = int(os.getenv("ALERT_RETENTION_DAYS", 0))
+    # Daily partitions are created this many days in advance.
+    PARTITION_PREMAKE_DAYS: int = int(os.getenv("PARTITION_PREMAKE_DAYS", 3))
+    # Rows of the per-minute packet summary (packet_stats_minute) are kept this long.
+    PACKET_STATS_RETENTION_DAYS: int = int(os.getenv("PACKET_STATS_RETENTION_DAYS", 90))
+
+    # --- GeoIP (see services/geoip_service.py) ---
+    # GeoLite2 country database, opened on first lookup, and the number of
+    # IP -> country results kept in its LRU cache.
+    GEOIP_DB_PATH: str = os.getenv("GEOIP_DB_PATH", str(Path(__file__).resolve().parent / "data" / "GeoLite2-Country.mmdb"))
+    GEOIP_CACHE_SIZE: int = int(os.getenv("GEOIP_CACHE_SIZE", 65536))
+settings = Settings()
\ No newline at end of file
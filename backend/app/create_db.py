@@ -5,8 +5,7 @@ import time
 from sqlalchemy.exc import OperationalError
 
 # Import your core database objects and models
-from app.database import engine, Base
-from app import models
+from app.database import create_db_and_tables
 
 # --- Configuration for the retry logic ---
 # Total number of times we will try to connect
@@ -27,7 +26,7 @@ def initialize_database():
             # Attempt to connect to the database. The 'create_all' command
             # requires a successful connection to proceed.
             print(f"Attempting to connect to database... (Attempt {attempt}/{MAX_RETRIES})")
-            Base.metadata.create_all(bind=engine)
+            create_db_and_tables()
             
             # If we reach this line, the connection was successful.
             print("✅ Database connection successful. Tables are verified/created.")
@@ -35,8 +35,18 @@ try:
 
     def create_db_and_tables():
         from app import models
+        from app.services import db_partitions, packet_stats
         logger.info("--- Creating database tables if they do not exist... ---")
-        Base.metadata.create_all(bind=engine)
+        # network_packets and security_alerts are partitioned by day: plain tables from
+        # older installs are converted first, and the current partitions are created.
+        with engine.begin() as conn:
+            legacy_tables = db_partitions.rename_legacy_tables(conn)
+            Base.metadata.create_all(bind=conn)
+            db_partitions.widen_id_columns(conn)
+            db_partitions.attach_legacy_tables(conn, legacy_tables)
+            db_partitions.migrate_indexes(conn, Base.metadata)
+            db_partitions.ensure_partitions(conn)
+            packet_stats.backfill_packet_stats(conn)
         logger.info("✅ Database tables are ready.")
 
 except Exception as e:
@@ -7,7 +7,7 @@ from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from typing import Generator
 from sqlalchemy.orm import Session
-from elasticsearch import Elasticsearch
+from elasticsearch import Elasticsearch, AsyncElasticsearch
 
 from .database import SessionLocal
 from .schemas import UserSchema
@@ -48,10 +48,13 @@ es_ca_certs = settings.ELASTICSEARCH_SSL_CA_CERTS
 
 # Create the connection options dictionary
 client_options = {
-    "timeout": 60,
+    "request_timeout": settings.ES_REQUEST_TIMEOUT,
     "retry_on_timeout": True,
     "max_retries": 3,
-    "basic_auth": (es_user, es_password)
+    "basic_auth": (es_user, es_password),
+    # Upper bound on concurrent HTTP connections to each ES node. Dashboard
+    # widgets run their queries concurrently, so this caps the fan-out.
+    "connections_per_node": settings.ES_CONNECTIONS_PER_NODE,
 }
 
 # If the path to a CA certificate is provided, configure the client for secure TLS.
@@ -65,12 +68,28 @@ else:
     client_options['verify_certs'] = False
     urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
-# Create the SINGLE, SHARED client instance for the entire application
+# Create the SINGLE, SHARED client instances for the entire application.
+# Request handlers must use the async client so a slow query never blocks the
+# event loop; the sync client is kept for background threads and scripts.
 es_client = Elasticsearch(hosts=[es_host], **client_options)
+async_es_client = AsyncElasticsearch(hosts=[es_host], **client_options)
 
 
 def get_es_client() -> Elasticsearch:
     """
     FastAPI dependency that returns the single, shared Elasticsearch client instance.
     """
-    return es_client
\ No newline at end of file
+    return es_client
+
+
+def get_async_es_client() -> AsyncElasticsearch:
+    """
+    FastAPI dependency that returns the single, shared async Elasticsearch client.
+    """
+    return async_es_client
+
+
+async def close_es_clients():
+    """Closes the shared Elasticsearch clients on application shutdown."""
+    await async_es_client.close()
+    es_client.close()
\ No newline at end of file
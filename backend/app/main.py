@@ -2,6 +2,7 @@
 
 import logging
 import asyncio
+import json
 import multiprocessing
 import threading
 from contextlib import asynccontextmanager
@@ -9,7 +10,7 @@ from contextlib import asynccontextmanager
 from fastapi import FastAPI, APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from app.dependencies import es_client
+from app.dependencies import async_es_client, close_es_clients
 
 
 from fastapi_cache import FastAPICache
@@ -20,13 +21,15 @@ from app.routers import (
     zeek, packets, alerts, live_cockpit, investigation
 )
 from app.routers.connection_manager import manager
+from app.services.ws_subscriptions import SubscriptionError
 from app.services import (
-    packet_capture, db_cleanup, health_score_service
+    packet_capture, ek_decoder, db_cleanup, zeek_rollup, zeek_parser, log_parser
 )
 from app.database import create_db_and_tables, SessionLocal
 from app.models import Vulnerability
 from app.config import settings
 from app.state import app_state
+from app.services.packet_ring import PacketRing, ensure_shm_fits
 from elasticsearch import Elasticsearch
 
 # --- Configure Logging ---
@@ -61,24 +64,46 @@ async def lifespan(app: FastAPI):
     # Health check using the shared client
     while True:
         try:
-            if es_client.ping():
+            if await async_es_client.ping():
                 logger.info("✅ Elasticsearch is connected and healthy."); break
         except Exception as e:
             logger.error(f"❌ Ping failed with an exception: {e}")
         logger.warning("🟡 Elasticsearch not ready, waiting 5 seconds..."); await asyncio.sleep(5)
     
     app_state.main_event_loop = asyncio.get_running_loop()
+    manager.start()
     logger.info("Starting background services...")
+    if settings.ZEEK_ROLLUP_ENABLED:
+        zeek_rollup.rollup_job.start()
     threading.Thread(target=db_cleanup.db_cleanup_loop, daemon=True).start()
+    # Shared by the log tailers so they finish their current batch and checkpoint on shutdown.
+    tailer_stop_event = threading.Event()
+    app.state.tailer_stop_event = tailer_stop_event
+    # Writes Suricata alerts from eve.json to security_alerts and the live WebSocket.
+    threading.Thread(target=log_parser.start_log_monitoring, args=(tailer_stop_event,), daemon=True).start()
+    if settings.ZEEK_CONN_STORE_CAPACITY > 0:
+        # Feeds app_state.zeek_conn_store from conn.log for the in-memory cockpit widgets.
+        threading.Thread(target=zeek_parser.start_log_monitoring, args=(tailer_stop_event,), daemon=True).start()
     try:
         pipe_path_in_container = "/stream/scapy.pcap"
         logger.info(f"✅ Scapy analysis service will read from shared stream: '{pipe_path_in_container}'")
-        packet_queue = multiprocessing.Queue()
         stop_event = multiprocessing.Event()
         app.state.packet_capture_stop_event = stop_event
-        sniffer_process = multiprocessing.Process(target=packet_capture.json_sniffer_process, args=(packet_queue, pipe_path_in_container, stop_event), daemon=True)
-        handler_thread = threading.Thread(target=packet_capture.data_handler_thread, args=(packet_queue, stop_event), daemon=True)
-        sniffer_process.start(); handler_thread.start()
+        ensure_shm_fits(settings.PACKET_DECODER_WORKERS, settings.PACKET_RING_CAPACITY)
+        if settings.PACKET_DECODER_WORKERS > 1:
+            logger.info(f"Starting EK decoder pool with {settings.PACKET_DECODER_WORKERS} worker processes.")
+            packet_rings = [PacketRing(settings.PACKET_RING_CAPACITY) for _ in range(settings.PACKET_DECODER_WORKERS)]
+            chunk_queue = multiprocessing.Queue(maxsize=settings.PACKET_DECODER_WORKERS * 4)
+            multiprocessing.Process(target=ek_decoder.ek_chunk_reader_process, args=(chunk_queue, pipe_path_in_container, stop_event), daemon=True).start()
+            for packet_ring in packet_rings:
+                multiprocessing.Process(target=ek_decoder.ek_decoder_worker_process, args=(chunk_queue, packet_ring, stop_event), daemon=True).start()
+        else:
+            packet_rings = [PacketRing(settings.PACKET_RING_CAPACITY)]
+            sniffer_process = multiprocessing.Process(target=packet_capture.json_sniffer_process, args=(packet_rings[0], pipe_path_in_container, stop_event), daemon=True)
+            sniffer_process.start()
+        app.state.packet_rings = packet_rings
+        handler_thread = threading.Thread(target=packet_capture.data_handler_thread, args=(packet_rings, stop_event), daemon=True)
+        handler_thread.start()
         logger.info("✅ Scapy analysis service started successfully.")
     except Exception as e: logger.error(f"❌ FATAL: Failed to start Scapy analysis service: {e}", exc_info=True)
     logger.info("✅ Application startup sequence complete. CybReon is running.")
@@ -87,9 +112,13 @@ async def lifespan(app: FastAPI):
     
     # --- Shutdown Logic ---
     logger.info("--- Shutting Down ---")
-    logger.info("Closing async Elasticsearch client for health score service...")
-    await health_score_service.close_es_client()
+    await manager.stop()
+    await zeek_rollup.rollup_job.stop()
+    logger.info("Closing shared Elasticsearch clients...")
+    await close_es_clients()
+    if hasattr(app.state, 'tailer_stop_event'): app.state.tailer_stop_event.set()
     if hasattr(app.state, 'packet_capture_stop_event'): app.state.packet_capture_stop_event.set()
+    for packet_ring in getattr(app.state, 'packet_rings', []): packet_ring.close()
     logger.info("✅ Shutdown complete.")
 
 
@@ -130,13 +159,32 @@ api_router.include_router(investigation.router, prefix="/investigation", tags=["
 
 @api_router.websocket("/ws/ws")
 async def websocket_endpoint(websocket: WebSocket):
+    """
+    Live packet/alert feed. Clients may send a subscribe message at any time to
+    filter it server-side, e.g. {"type": "subscribe", "topics": ["alerts"],
+    "filters": {"ips": ["10.0.0.0/8"], "severities": [1]}, "max_rate": 20}.
+    """
     await manager.connect(websocket)
     try:
         while True:
-            await websocket.receive_text()
+            text_message = await websocket.receive_text()
+            try:
+                payload = json.loads(text_message)
+                if not isinstance(payload, dict) or payload.get("type") != "subscribe":
+                    continue
+                subscription = manager.subscribe(websocket, payload)
+                manager.send_direct(websocket, json.dumps({"type": "subscribed", "subscription": subscription}))
+            except (json.JSONDecodeError, SubscriptionError) as e:
+                manager.send_direct(websocket, json.dumps({"type": "subscription_error", "detail": str(e)}))
     except WebSocketDisconnect:
         manager.disconnect(websocket)
 
+@api_router.get("/ws/stats", tags=["WebSocket"])
+def get_websocket_stats():
+    """Per-client lag/drop counters of the WebSocket fan-out and the packet/alert ingest counters."""
+    return {"websocket": manager.stats(), "packet_writer": app_state.packet_writer_stats,
+            "alert_ingest": app_state.alert_ingest_stats}
+
 app.include_router(api_router, prefix="/api")
 
 # --- Serve Frontend ---
@@ -1,7 +1,7 @@
 # backend/app/models.py
 
 from app.database import Base
-from sqlalchemy import Column, Integer, String, DateTime, Index, Text, ForeignKey, JSON, Float, func
+from sqlalchemy import Column, Integer, BigInteger, String, DateTime, Index, Text, ForeignKey, JSON, Float, func
 from sqlalchemy.orm import relationship
 from datetime import datetime, timezone
 
@@ -29,10 +29,23 @@ class Vulnerability(Base):
 
 # --- Original & Raw Data Models (We keep these) ---
 
+# network_packets and security_alerts are partitioned by day on 'timestamp' (see
+# services/db_partitions.py); PostgreSQL requires the partition column in the primary key.
 class NetworkPacket(Base):
     __tablename__ = "network_packets"
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, nullable=False)
+    __table_args__ = (
+        # Every reader sorts by timestamp: latest packets and keyset pages use
+        # (timestamp, id); IP drill-downs use one (ip, timestamp) index per direction
+        # (see services/packet_queries.py). The primary key already covers 'id'.
+        Index("ix_network_packets_timestamp_id", "timestamp", "id"),
+        Index("ix_network_packets_source_ip_timestamp", "source_ip", "timestamp"),
+        Index("ix_network_packets_destination_ip_timestamp", "destination_ip", "timestamp"),
+        {"postgresql_partition_by": "RANGE (timestamp)"},
+    )
+    # bigint: at thousands of packets per second an int4 sequence runs out within
+    # days, and dropping expired partitions doesn't reset it.
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    timestamp = Column(DateTime, primary_key=True, nullable=False)
     source_ip = Column(String(45), nullable=False)
     destination_ip = Column(String(45), nullable=False)
     source_mac = Column(String(17), nullable=True)
@@ -44,6 +57,15 @@ class NetworkPacket(Base):
     ttl = Column(Integer, nullable=True)
     flags = Column(String(10), nullable=True)
 
+# Per-minute totals of network_packets, maintained by the packet writer (see
+# services/packet_stats.py) so the protocol distribution doesn't scan the packets.
+class PacketStatsMinute(Base):
+    __tablename__ = "packet_stats_minute"
+    minute = Column(DateTime, primary_key=True)
+    protocol = Column(String(10), primary_key=True)
+    packets = Column(BigInteger, nullable=False, default=0)
+    bytes = Column(BigInteger, nullable=False, default=0)
+
 class NetworkPort(Base):
     __tablename__ = "network_ports"
     id = Column(Integer, primary_key=True, index=True)
@@ -55,6 +77,16 @@ class NetworkPort(Base):
     host_id = Column(Integer, ForeignKey('hosts.id'), nullable=True)
     host = relationship("Host", back_populates="ports")
 
+# What the scanner last saw on a host, so unchanged hosts skip the expensive
+# version/OS/vuln stages (see scanner/scanner.py).
+class HostScanState(Base):
+    __tablename__ = "host_scan_state"
+    host_id = Column(Integer, ForeignKey('hosts.id', ondelete="CASCADE"), primary_key=True)
+    port_fingerprint = Column(String(64), nullable=True)  # sha256 of the sorted open "proto/port" list
+    services = Column(JSON, nullable=True)  # {"tcp/22": "OpenSSH 9.6p1", ...} from the last deep scan
+    last_port_check = Column(DateTime(timezone=True), nullable=True)
+    last_deep_scan = Column(DateTime(timezone=True), nullable=True)
+
 class User(Base):
     __tablename__ = "users"
     id = Column(Integer, primary_key=True, index=True)
@@ -66,8 +98,9 @@ class User(Base):
 
 class SecurityAlert(Base):
     __tablename__ = "security_alerts"
-    id = Column(Integer, primary_key=True, index=True)
-    timestamp = Column(DateTime, nullable=False, index=True)
+    __table_args__ = {"postgresql_partition_by": "RANGE (timestamp)"}
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
+    timestamp = Column(DateTime, primary_key=True, nullable=False, index=True)
     source_ip = Column(String(45), index=True) 
     source_port = Column(Integer)
     destination_ip = Column(String(45), index=True) 
@@ -8,15 +8,15 @@ router = APIRouter()
 
 # This is the existing endpoint
 @router.get("/alerts")
-def read_alerts():
-    alerts = alert_service.get_latest_alerts()
+async def read_alerts():
+    alerts = await alert_service.get_latest_alerts()
     return {"alerts": alerts}
 
 # This is the new endpoint for Suricata flow data
 @router.get("/api/suricata/flows", response_model=List[schemas.SuricataFlowSchema], tags=["Suricata"])
-def get_suricata_flows():
+async def get_suricata_flows():
     """
     Returns the most recent flow logs captured by Suricata from Elasticsearch.
     """
-    flows = ids_query_service.get_latest_suricata_flows(limit=200)
+    flows = await ids_query_service.get_latest_suricata_flows(limit=200)
     return flows
\ No newline at end of file
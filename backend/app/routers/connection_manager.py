@@ -1,55 +1,264 @@
 # app/routers/connection_manager.py
-# (FINAL, WORKING VERSION)
 from fastapi import WebSocket
+from collections import deque
 import logging
 import asyncio
+import time
+
+from app.config import settings
+from app.services.ws_subscriptions import Subscription, DEFAULT_SUBSCRIPTION
 
 logger = logging.getLogger(__name__)
 
+
+class ClientConnection:
+    """
+    One connected browser: its socket, its subscription, a bounded queue of
+    outbound frames and the lag/drop counters reported by ConnectionManager.stats().
+    """
+    def __init__(self, websocket: WebSocket, max_queued_frames: int):
+        self.websocket = websocket
+        self.subscription: Subscription = DEFAULT_SUBSCRIPTION
+        self.frames: asyncio.Queue = asyncio.Queue(maxsize=max_queued_frames)
+        self.sender_task: asyncio.Task | None = None
+        self.connected_at = time.time()
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.last_lag_ms = 0.0
+        self.max_lag_ms = 0.0
+
+    def offer(self, frame: str):
+        """Queues a frame without ever blocking; a slow client loses its oldest frame."""
+        if self.frames.full():
+            self.frames.get_nowait()
+            self.frames_dropped += 1
+        self.frames.put_nowait((frame, time.monotonic()))
+
+    def stats(self) -> dict:
+        client = self.websocket.client
+        return {
+            "client": f"{client.host}:{client.port}" if client else "unknown",
+            "connected_at": self.connected_at,
+            "queued_frames": self.frames.qsize(),
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "last_lag_ms": round(self.last_lag_ms, 2),
+            "max_lag_ms": round(self.max_lag_ms, 2),
+            "subscription": self.subscription.describe(),
+        }
+
+
 class ConnectionManager:
     """
-    Manages active WebSocket connections and provides a simple way to broadcast
-    messages to all connected clients.
+    Manages active WebSocket connections and fans messages out to them.
+
+    Producers (the packet writer thread, the alert parser) call publish() or
+    broadcast(), which only append to an in-memory buffer. A flusher task on the
+    main event loop coalesces the buffer into frames every WS_FRAME_INTERVAL_MS
+    and hands them to every client's bounded queue; each client has its own
+    sender task, so one slow browser never stalls the others.
+
+    Clients may narrow what they receive with a subscribe message (see
+    app.services.ws_subscriptions). One frame is built per distinct
+    subscription, so filter cost grows with the number of different filters,
+    not with the number of clients.
+
+    Frames have the shape {"type": "batch", "messages": [<message>, ...]}.
     """
     def __init__(self):
-        # A list to hold all active WebSocket connections
-        self.active_connections: list[WebSocket] = []
+        # Maps each active WebSocket to its ClientConnection
+        self.active_connections: dict[WebSocket, ClientConnection] = {}
+        # High-volume messages (packets) that may be sampled down when a frame
+        # would exceed WS_MAX_MESSAGES_PER_FRAME, and low-volume messages
+        # (alerts) that are always delivered. deque appends are thread-safe.
+        # Entries are (message, meta) pairs; meta comes from ws_subscriptions.message_meta().
+        self._pending_droppable: deque[tuple] = deque(maxlen=settings.WS_MAX_MESSAGES_PER_FRAME * 20)
+        self._pending_priority: deque[tuple] = deque()
+        # Token buckets enforcing 'max_rate': subscription key -> (tokens, refilled at)
+        self._rate_tokens: dict[tuple, tuple[float, float]] = {}
+        self._flusher_task: asyncio.Task | None = None
+        self.messages_published = 0
+        self.messages_sampled_out = 0
+        self.frames_built = 0
 
     async def connect(self, websocket: WebSocket):
-        """Accepts a new WebSocket connection and adds it to our list."""
+        """Accepts a new WebSocket connection and starts its sender task."""
         await websocket.accept()
-        self.active_connections.append(websocket)
+        client = ClientConnection(websocket, settings.WS_CLIENT_QUEUE_FRAMES)
+        client.sender_task = asyncio.create_task(self._sender(client))
+        self.active_connections[websocket] = client
         logger.info(f"New WebSocket client connected. Total clients: {len(self.active_connections)}")
 
     def disconnect(self, websocket: WebSocket):
-        """Removes a WebSocket connection from our list when a client disconnects."""
-        self.active_connections.remove(websocket)
+        """Removes a WebSocket connection when a client disconnects. Safe to call twice."""
+        client = self.active_connections.pop(websocket, None)
+        if client is None:
+            return
+        if client.sender_task and client.sender_task is not asyncio.current_task():
+            client.sender_task.cancel()
         logger.info(f"WebSocket client disconnected. Total clients: {len(self.active_connections)}")
 
-    async def broadcast(self, message: str):
+    def subscribe(self, websocket: WebSocket, payload: dict) -> dict:
+        """
+        Replaces the client's subscription. Raises SubscriptionError for an invalid
+        payload; returns the normalized subscription otherwise.
+        """
+        client = self.active_connections.get(websocket)
+        subscription = Subscription.from_message(payload)
+        if client is not None:
+            client.subscription = subscription
+        return subscription.describe()
+
+    def send_direct(self, websocket: WebSocket, message: str):
+        """Queues a control message (e.g. a subscription ack) for a single client."""
+        client = self.active_connections.get(websocket)
+        if client is not None:
+            client.offer(message)
+
+    def publish(self, message: str, droppable: bool = True, meta: tuple | None = None):
         """
-        Broadcasts a text message to all currently connected WebSocket clients.
-        
-        This is an 'async' function, making it directly compatible with the
-        'asyncio.run()' call from our background log-parsing thread.
+        Queues an already JSON-encoded message for the next frame. Non-blocking
+        and safe to call from any thread. 'meta' is what subscription filters are
+        evaluated against; messages without it reach every client.
+        """
+        self.messages_published += 1
+        if droppable:
+            if len(self._pending_droppable) == self._pending_droppable.maxlen:
+                # The append evicts the oldest pending packet; count it like a sampled-out one.
+                self.messages_sampled_out += 1
+            self._pending_droppable.append((message, meta))
+        else:
+            self._pending_priority.append((message, meta))
+
+    async def broadcast(self, message: str, meta: tuple | None = None):
         """
-        # We don't want a single disconnected client to stop the broadcast to others,
-        # so we iterate safely.
-        
-        disconnected_clients = []
-        for connection in self.active_connections:
+        Queues a message that must not be sampled away (e.g. alerts). Kept as a
+        coroutine so existing 'asyncio.run(manager.broadcast(...))' callers work.
+        """
+        self.publish(message, droppable=False, meta=meta)
+
+    def start(self):
+        """Starts the frame flusher on the running event loop (called from the app lifespan)."""
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self):
+        if self._flusher_task:
+            self._flusher_task.cancel()
+            self._flusher_task = None
+        for websocket in list(self.active_connections):
+            self.disconnect(websocket)
+
+    def _drain(self, pending: deque) -> list[tuple]:
+        messages = []
+        while True:
+            try:
+                messages.append(pending.popleft())
+            except IndexError:
+                return messages
+
+    @staticmethod
+    def _sample(messages: list, budget: int) -> list:
+        """Keeps an evenly spaced sample so the live view still spans the whole interval."""
+        if budget <= 0:
+            return []
+        if len(messages) <= budget:
+            return messages
+        return [messages[int(i * len(messages) / budget)] for i in range(budget)]
+
+    def _collect(self) -> tuple[list[tuple], list[tuple]]:
+        """
+        Drains everything published since the last frame as (priority, droppable)
+        messages, sampling the droppable ones (packets) if needed.
+        """
+        priority = self._drain(self._pending_priority)
+        droppable = self._drain(self._pending_droppable)
+        budget = max(settings.WS_MAX_MESSAGES_PER_FRAME - len(priority), 0)
+        sampled = self._sample(droppable, budget)
+        self.messages_sampled_out += len(droppable) - len(sampled)
+        return priority, sampled
+
+    def _rate_limit(self, subscription: Subscription, messages: list[str]) -> list[str]:
+        """
+        Applies the subscription's 'max_rate' to droppable messages only; alerts are
+        never rate limited and don't use up tokens.
+        """
+        if subscription.max_rate is None:
+            return messages
+        # Token bucket allowing bursts of up to one second's worth of messages. It is
+        # refilled by the time elapsed since its last use, so ticks without messages
+        # (which build no frames) still count towards the rate.
+        now = time.monotonic()
+        tokens, refilled_at = self._rate_tokens.get(subscription.key, (subscription.max_rate, now))
+        tokens = min(tokens + subscription.max_rate * (now - refilled_at), subscription.max_rate)
+        allowed = self._sample(messages, int(tokens))
+        self._rate_tokens[subscription.key] = (tokens - len(allowed), now)
+        return allowed
+
+    def build_frames(self) -> dict[tuple, str]:
+        """Builds one frame per distinct subscription among the connected clients."""
+        priority, droppable = self._collect()
+        subscriptions = {client.subscription.key: client.subscription for client in self.active_connections.values()}
+        for key in list(self._rate_tokens):
+            if key not in subscriptions:
+                del self._rate_tokens[key]
+        if not priority and not droppable:
+            return {}
+        frames = {}
+        for key, subscription in subscriptions.items():
+            if subscription is DEFAULT_SUBSCRIPTION:
+                selected = [message for message, _ in priority]
+                selected += [message for message, _ in droppable]
+            else:
+                selected = [message for message, meta in priority if subscription.matches(meta)]
+                selected += self._rate_limit(
+                    subscription, [message for message, meta in droppable if subscription.matches(meta)])
+            if selected:
+                # Messages are already JSON, so the frame is assembled without re-encoding them.
+                frames[key] = '{"type": "batch", "messages": [' + ",".join(selected) + "]}"
+        self.frames_built += len(frames)
+        return frames
+
+    async def _flush_loop(self):
+        interval = settings.WS_FRAME_INTERVAL_MS / 1000
+        while True:
+            await asyncio.sleep(interval)
             try:
-                # The 'await' is crucial. It sends the message.
-                await connection.send_text(message)
+                if not self.active_connections:
+                    # Nobody is listening: discard instead of building frames.
+                    self._collect()
+                    continue
+                frames = self.build_frames()
+                for client in list(self.active_connections.values()):
+                    frame = frames.get(client.subscription.key)
+                    if frame is not None:
+                        client.offer(frame)
             except Exception as e:
-                # This typically happens if a client closed their browser tab.
-                # We can't send a message to a closed connection.
-                logger.warning(f"Failed to send message to a client (will disconnect): {e}")
-                disconnected_clients.append(connection)
-
-        # Clean up any connections that broke during the broadcast.
-        for client in disconnected_clients:
-            self.active_connections.remove(client)
+                logger.error(f"WebSocket frame flusher error: {e}", exc_info=True)
+
+    async def _sender(self, client: ClientConnection):
+        try:
+            while True:
+                frame, enqueued_at = await client.frames.get()
+                await client.websocket.send_text(frame)
+                client.frames_sent += 1
+                client.last_lag_ms = (time.monotonic() - enqueued_at) * 1000
+                client.max_lag_ms = max(client.max_lag_ms, client.last_lag_ms)
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            # This typically happens if a client closed their browser tab.
+            logger.warning(f"Failed to send message to a client (will disconnect): {e}")
+            self.disconnect(client.websocket)
+
+    def stats(self) -> dict:
+        return {
+            "clients": [client.stats() for client in self.active_connections.values()],
+            "messages_published": self.messages_published,
+            "messages_sampled_out": self.messages_sampled_out,
+            "frames_built": self.frames_built,
+            "pending_messages": len(self._pending_droppable) + len(self._pending_priority),
+        }
 
 
 # Create a single, global instance of the manager that will be imported
@@ -1,12 +1,12 @@
 # backend/app/routers/investigation.py (CORRECTED)
 
 from fastapi import APIRouter, Depends, HTTPException, Body
-from elasticsearch import Elasticsearch, ConnectionError as ESConnectionError, RequestError
+from elasticsearch import AsyncElasticsearch, ConnectionError as ESConnectionError, RequestError
 from pydantic import BaseModel, Field
 from typing import List, Dict, Any
 
 # Import the corrected, centralized dependency function
-from app.dependencies import get_es_client
+from app.dependencies import get_async_es_client
 from app.config import settings
 
 router = APIRouter(
@@ -24,9 +24,9 @@ class SearchQuery(BaseModel):
     index: str = Field(default="netguard-packets", description="Elasticsearch index to search.")
 
 @router.post("/query", response_model=List[Dict[str, Any]])
-def search_network_data(
+async def search_network_data(
     query: SearchQuery = Body(...),
-    es: Elasticsearch = Depends(get_es_client) # This now uses the centralized function
+    es: AsyncElasticsearch = Depends(get_async_es_client) # This now uses the centralized function
 ):
     """
     Perform a flexible search query against stored network data in Elasticsearch.
@@ -56,7 +56,7 @@ def search_network_data(
                 {"@timestamp": {"order": "desc", "unmapped_type": "boolean"}}
             ]
         }
-        response = es.search(index=query.index, body=es_query, size=query.size)
+        response = await es.search(index=query.index, body=es_query, size=query.size)
         return [hit['_source'] for hit in response['hits']['hits']]
     except RequestError as e:
         raise HTTPException(status_code=400, detail=f"Invalid search query syntax: {e.info['error']['root_cause'][0]['reason']}")
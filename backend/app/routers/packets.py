@@ -3,54 +3,73 @@
 # ### --- START OF CHANGES --- ###
 # We no longer need Elasticsearch in this file.
 # We DO need dependencies and models for PostgreSQL.
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+import csv
+import io
+import json
+import logging
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Literal, Optional
+from datetime import datetime, timedelta, timezone
 from sqlalchemy.orm import Session
-from .. import schemas, dependencies, models
+from .. import schemas, dependencies
+from ..database import SessionLocal
+from ..config import settings
+from ..services import packet_queries, packet_stats
 # ### --- END OF CHANGES --- ###
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
 # ### --- START OF CHANGES --- ###
 # The Elasticsearch client dependency is no longer needed and has been removed.
 # We will use the existing get_db dependency.
 
+# Rows fetched per round trip (and per streamed chunk) by the export endpoint.
+EXPORT_BATCH_ROWS = 5000
+
+
+def _api_packet(row) -> dict:
+    """A packet row in the shape of schemas.PacketSchema (plus id and flags), ready for JSON."""
+    packet = row._asdict()
+    packet["@timestamp"] = packet.pop("timestamp").isoformat()
+    return packet
+
+
 @router.get("", response_model=List[schemas.PacketSchema])
-def get_all_packets(db: Session = Depends(dependencies.get_db), limit: int = 100):
+def get_all_packets(
+    db: Session = Depends(dependencies.get_db),
+    limit: int = Query(100, ge=1, le=5000),
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[str] = None,
+):
     """
-    Retrieves the most recent captured packets from PostgreSQL.
+    Retrieves captured packets from PostgreSQL, newest first, optionally filtered
+    by time range (UTC), IP (either direction), port (either direction) and protocol.
+    When more packets may follow, the 'X-Next-Cursor' response header holds the
+    value to pass as 'cursor' to get the next page.
     """
     try:
-        # Query the NetworkPacket table in PostgreSQL
-        # Order by timestamp descending to get the latest packets first
-        packets = (
-            db.query(models.NetworkPacket)
-            .order_by(models.NetworkPacket.timestamp.desc())
-            .limit(limit)
-            .all()
+        page_cursor = packet_queries.decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        rows = packet_queries.packet_page(
+            db, limit, cursor=page_cursor,
+            start=packet_queries.to_db_time(start) if start else None,
+            end=packet_queries.to_db_time(end) if end else None,
+            ip=ip, port=port, protocol=protocol,
         )
-        
-        # We need to manually convert the @timestamp field name
-        # to match the schema expected by the frontend.
-        # Your schema likely expects "@timestamp", but the DB model uses "timestamp".
-        packet_dicts = []
-        for packet in packets:
-            packet_dict = {
-                "@timestamp": packet.timestamp,
-                "source_ip": packet.source_ip,
-                "destination_ip": packet.destination_ip,
-                "length": packet.length,
-                "ttl": packet.ttl,
-                "protocol": packet.protocol,
-                "source_mac": packet.source_mac,
-                "destination_mac": packet.destination_mac,
-                "source_port": packet.source_port,
-                "destination_port": packet.destination_port,
-                "flags": packet.flags,
-            }
-            packet_dicts.append(packet_dict)
-        
-        return packet_dicts
+        headers = {}
+        if len(rows) == limit:
+            headers["X-Next-Cursor"] = packet_queries.encode_cursor(rows[-1].timestamp, rows[-1].id)
+        # The rows are serialized directly; validating them through PacketSchema
+        # again would only double the per-row cost.
+        return JSONResponse(content=[_api_packet(row) for row in rows], headers=headers)
 
     except Exception as e:
         # Log the actual error for debugging
@@ -60,6 +79,64 @@ def get_all_packets(db: Session = Depends(dependencies.get_db), limit: int = 100
             detail="An unexpected server error occurred while querying the database."
         )
 
+
+def _export_chunks(export_format: str, filters: dict):
+    """
+    Streams the export in chunks of EXPORT_BATCH_ROWS rows. The generator owns its
+    session: the request's session may be closed before the response is streamed.
+    """
+    db = SessionLocal()
+    try:
+        if export_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer).writerow(packet_queries.PACKET_FIELDS)
+            yield buffer.getvalue()
+        for batch in packet_queries.iter_packet_batches(db, EXPORT_BATCH_ROWS, **filters):
+            buffer = io.StringIO()
+            if export_format == "csv":
+                writer = csv.writer(buffer)
+                for row in batch:
+                    writer.writerow((row.id, row.timestamp.isoformat(), *row[2:]))
+            else:
+                for row in batch:
+                    packet = row._asdict()
+                    packet["timestamp"] = packet["timestamp"].isoformat()
+                    buffer.write(json.dumps(packet))
+                    buffer.write("\n")
+            yield buffer.getvalue()
+    except Exception as e:
+        # Headers are already sent; the truncated download is all the client can see.
+        logger.error(f"Packet export aborted: {e}", exc_info=True)
+    finally:
+        db.close()
+
+
+@router.get("/export")
+def export_packets(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    ip: Optional[str] = None,
+    port: Optional[int] = None,
+    protocol: Optional[str] = None,
+):
+    """
+    Streams every packet matching the filters, oldest first, as NDJSON or CSV.
+    Rows are read through a server-side cursor and sent as they arrive, so the
+    size of the export doesn't affect the API's memory use.
+    """
+    filters = {
+        "start": packet_queries.to_db_time(start) if start else None,
+        "end": packet_queries.to_db_time(end) if end else None,
+        "ip": ip, "port": port, "protocol": protocol,
+    }
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    filename = f"packets-{datetime.now(timezone.utc):%Y%m%dT%H%M%SZ}.{export_format}"
+    return StreamingResponse(
+        _export_chunks(export_format, filters), media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
 # ### --- END OF CHANGES --- ###
 
 
@@ -67,25 +144,22 @@ def get_all_packets(db: Session = Depends(dependencies.get_db), limit: int = 100
 # as the packet data is being written to PostgreSQL where this query runs.
 # The warning comment can be removed.
 
-from sqlalchemy import func
-
 @router.get("/protocol-distribution", response_model=List[schemas.ProtocolDistribution])
-def get_protocol_distribution(db: Session = Depends(dependencies.get_db)):
+def get_protocol_distribution(
+    db: Session = Depends(dependencies.get_db),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
     """
     Calculates the distribution of network traffic volume (in bytes)
-    for each protocol (TCP, UDP, ICMP, etc.) from the PostgreSQL database.
+    for each protocol (TCP, UDP, ICMP, etc.) between 'start' and 'end' (UTC,
+    minute resolution). Defaults to the whole packet retention period.
+    Reads the per-minute summary table instead of the packets themselves.
     """
     try:
-        protocol_bytes = (
-            db.query(
-                models.NetworkPacket.protocol,
-                func.sum(models.NetworkPacket.length).label("count")
-            )
-            .group_by(models.NetworkPacket.protocol)
-            .order_by(func.sum(models.NetworkPacket.length).desc())
-            .all()
-        )
-        return [{"protocol": protocol, "count": count} for protocol, count in protocol_bytes]
+        end = packet_queries.to_db_time(end or datetime.now(timezone.utc))
+        start = packet_queries.to_db_time(start) if start else end - timedelta(days=settings.PACKET_RETENTION_DAYS + 1)
+        return packet_stats.protocol_distribution(db, start, end)
 
     except Exception as e:
         print(f"An unexpected error occurred while fetching protocol distribution: {e}")
@@ -4,19 +4,12 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from typing import List, Dict, Any
 from collections import Counter
-import geoip2.database
-import os
 # --- ADDITION 1: Import datetime and timedelta for time-based filtering ---
 from datetime import datetime, timedelta
 
 from app import models
 from app.dependencies import get_db
-
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'GeoLite2-Country.mmdb')
-try:
-    geoip_reader = geoip2.database.Reader(DB_PATH)
-except FileNotFoundError:
-    geoip_reader = None
+from app.services.geoip_service import geoip
 
 router = APIRouter(
     tags=["Threat Intelligence"]
@@ -28,7 +21,7 @@ def get_threat_origins(db: Session = Depends(get_db)):
     Finds source IPs from security alerts IN THE LAST 24 HOURS, translates them
     to country codes, and returns the top 5 countries by alert count.
     """
-    if not geoip_reader:
+    if not geoip.available:
         raise HTTPException(status_code=503, detail="GeoIP database is not available.")
 
     # --- ADDITION 2: Define the time window for the query ---
@@ -44,18 +37,15 @@ def get_threat_origins(db: Session = Depends(get_db)):
     
     source_ips = [item[0] for item in results]
 
-    # The rest of the function remains the same...
-    country_codes = []
-    for ip in source_ips:
-        try:
-            response = geoip_reader.country(ip)
-            country_codes.append(response.country.iso_code)
-        except geoip2.errors.AddressNotFoundError:
-            continue
-        except Exception:
-            continue
-            
-    country_counts = Counter(country_codes)
+    # Each distinct IP is resolved once; alerts are then counted per country.
+    countries = geoip.lookup_many(source_ips)
+    country_counts = Counter(countries[ip] for ip in source_ips if countries[ip])
     top_countries = country_counts.most_common(5)
     chart_data = [{"country": country, "risk": count} for country, count in top_countries]
-    return chart_data
\ No newline at end of file
+    return chart_data
+
+
+@router.get("/geoip-stats", response_model=Dict[str, Any])
+def get_geoip_stats():
+    """Hit/miss counters of the shared GeoIP lookup cache."""
+    return geoip.stats()
\ No newline at end of file
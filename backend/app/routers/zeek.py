@@ -4,24 +4,15 @@ from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session # Keep Session import for models in other routers, but not used in new function
 from typing import List, Dict, Any
 from collections import Counter
-import geoip2.database
-import os
 from collections import Counter, defaultdict
 
 from app import models 
 from app.dependencies import get_db # Keep get_db if other functions in this router use Postgres
 from app.services import ids_query_service
 from app import schemas
+from app.services.geoip_service import geoip
 from fastapi_cache.decorator import cache
 
-# --- SETUP: GeoIP Database Reader ---
-DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'GeoLite2-Country.mmdb')
-try:
-    geoip_reader = geoip2.database.Reader(DB_PATH)
-except FileNotFoundError:
-    print(f"FATAL ERROR: GeoIP database not found at {DB_PATH}. Country lookups will fail.")
-    geoip_reader = None
-
 router = APIRouter(
     tags=["Zeek Data"] # More descriptive tag for this router
 )
@@ -32,25 +23,20 @@ async def get_top_countries_by_traffic():
     """
     Finds the top countries by connection count from Zeek logs IN THE LAST 24 HOURS.
     """
-    if not geoip_reader:
+    if not geoip.available:
         raise HTTPException(status_code=503, detail="GeoIP database is unavailable.")
 
     # --- CHANGE 1: Call the new, efficient aggregation service ---
     # This gets a list of IPs and their counts, e.g., [{'ip': '8.8.8.8', 'count': 500}]
-    top_ips_with_counts = ids_query_service.get_top_ips_by_traffic(time_range="24h", top_n=200)
+    top_ips_with_counts = await ids_query_service.get_top_ips_by_traffic(time_range="24h", top_n=200)
 
     # --- CHANGE 2: Sum the counts for each country ---
+    countries = geoip.lookup_many(item['ip'] for item in top_ips_with_counts)
     country_counts = defaultdict(int)
     for item in top_ips_with_counts:
-        ip = item['ip']
-        count = item['count']
-        try:
-            response = geoip_reader.country(ip)
-            country_code = response.country.iso_code
-            if country_code:
-                country_counts[country_code] += count
-        except (geoip2.errors.AddressNotFoundError, ValueError):
-            continue
+        country_code = countries[item['ip']]
+        if country_code:
+            country_counts[country_code] += item['count']
 
     # Sort the dictionary by count and get the top 5
     sorted_countries = sorted(country_counts.items(), key=lambda x: x[1], reverse=True)[:5]
@@ -65,7 +51,7 @@ async def get_zeek_connections():
     """
     Returns the most recent connection logs captured by Zeek from Elasticsearch.
     """
-    connections = ids_query_service.get_latest_zeek_connections(limit=1000)
+    connections = await ids_query_service.get_latest_zeek_connections(limit=1000)
     return connections
 
 
@@ -75,7 +61,7 @@ async def get_zeek_protocol_distribution():
     """
     Returns the top 10 most used protocols by traffic volume from Zeek data in Elasticsearch.
     """
-    protocol_distribution = ids_query_service.get_zeek_protocol_distribution(limit=5)
+    protocol_distribution = await ids_query_service.get_zeek_protocol_distribution(limit=5)
     return protocol_distribution
 
 
@@ -86,7 +72,7 @@ async def get_traffic_timeline():
     Returns time-bucketed data for the 'Traffic Over Time' chart.
     """
     # Gets data for the last 1 hour in 1-minute intervals.
-    timeline_data = ids_query_service.get_zeek_traffic_timeline(time_range_hours=1, interval_minutes=1)
+    timeline_data = await ids_query_service.get_zeek_traffic_timeline(time_range_hours=1, interval_minutes=1)
     return timeline_data
 
 
@@ -98,7 +84,7 @@ async def get_conn_state_distribution():
     """
     Returns the distribution of Zeek connection states from the last hour.
     """
-    distribution_data = ids_query_service.get_zeek_conn_state_distribution(time_range_hours=1)
+    distribution_data = await ids_query_service.get_zeek_conn_state_distribution(time_range_hours=1)
     return distribution_data
 
 
@@ -119,7 +105,7 @@ async def get_detailed_conn_state_timeline_endpoint(
     else: 
         interval_minutes = 60 # 1 hour interval
 
-    timeline_data = ids_query_service.get_detailed_zeek_conn_state_timeline(
+    timeline_data = await ids_query_service.get_detailed_zeek_conn_state_timeline(
         time_range_hours=hours, 
         interval_minutes=interval_minutes
     )
@@ -3,16 +3,17 @@ from datetime import datetime
 from elasticsearch import RequestError
 
 # Use the single, shared client from the dependencies file
-from app.dependencies import es_client
+from app.dependencies import async_es_client
+from app.services.es_index_cache import index_cache
 
 
-def get_latest_alerts(limit: int = 500):
+async def get_latest_alerts(limit: int = 500):
     """
     Queries Elasticsearch for the latest Suricata alerts.
     """
     index_name = "netguard-suricata-*"
 
-    if not es_client.indices.exists(index=index_name):
+    if not await index_cache.index_exists(async_es_client, index_name):
         print(f"Index {index_name} does not exist.")
         return []
 
@@ -30,8 +31,9 @@ def get_latest_alerts(limit: int = 500):
             ],
             "size": limit
         }
-        res = es_client.search(index=index_name, body=query)
+        res = await async_es_client.search(index=index_name, body=query)
         return [hit['_source'] for hit in res['hits']['hits']]
     except Exception as e:
+        index_cache.invalidate_on_error(e, index_name)
         print(f"ERROR: Alert Service failed to query Elasticsearch: {e}")
         return []
\ No newline at end of file
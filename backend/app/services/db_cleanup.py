@@ -3,36 +3,39 @@
 import logging
 import time
 from datetime import datetime, timedelta, timezone
-from app.database import SessionLocal
-from app.models import NetworkPacket
+from app.config import settings
+from app.database import engine, SessionLocal
+from app.services.db_partitions import maintain_partitions
+from app.services.packet_stats import delete_old_packet_stats
 
 logger = logging.getLogger(__name__)
 
 # --- CONFIGURATION ---
-RETENTION_DAYS = 7  # Keep 7 days of packet data
-CLEANUP_INTERVAL_SECONDS = 86400  # Run once every 24 hours
+# Retention is configured per table (PACKET_RETENTION_DAYS, ALERT_RETENTION_DAYS)
+# and applied by dropping whole daily partitions, so running often is cheap.
+CLEANUP_INTERVAL_SECONDS = 3600  # Run once every hour
 
 def delete_old_packets():
     """
-    Connects to the database and deletes records from the network_packets table
-    that are older than the specified retention period.
+    Creates the upcoming daily partitions of network_packets and security_alerts,
+    drops the partitions that are older than the retention period and trims the
+    per-minute packet summary.
     """
+    try:
+        logger.info("Running partition maintenance...")
+        created, dropped = maintain_partitions(engine)
+        logger.info(f"Partition maintenance complete. Created {len(created)} partitions, dropped {dropped or 'none'}.")
+    except Exception as e:
+        logger.error(f"An error occurred during partition maintenance: {e}", exc_info=True)
+
     db = None
     try:
         db = SessionLocal()
-        retention_period = datetime.now(timezone.utc) - timedelta(days=RETENTION_DAYS)
-        
-        logger.info(f"Running cleanup task. Deleting packets older than {retention_period.isoformat()}...")
-        
-        rows_deleted = db.query(NetworkPacket).filter(
-            NetworkPacket.timestamp < retention_period
-        ).delete(synchronize_session=False)
-
-        db.commit()
-        logger.info(f"Cleanup complete. Deleted {rows_deleted} old packet records.")
-
+        retention_period = datetime.now(timezone.utc).replace(tzinfo=None) - timedelta(days=settings.PACKET_STATS_RETENTION_DAYS)
+        rows_deleted = delete_old_packet_stats(db, retention_period)
+        logger.info(f"Deleted {rows_deleted} packet summary rows older than {retention_period.isoformat()}.")
     except Exception as e:
-        logger.error(f"An error occurred during database cleanup: {e}", exc_info=True)
+        logger.error(f"An error occurred while trimming the packet summary: {e}", exc_info=True)
         if db:
             db.rollback()
     finally:
@@ -49,4 +52,4 @@ def db_cleanup_loop():
     time.sleep(60) # Initial delay to let the app fully start up
     while True:
         delete_old_packets()
-        time.sleep(CLEANUP_INTERVAL_SECONDS)
\ No newline at end of file
+        time.sleep(CLEANUP_INTERVAL_SECONDS)
@@ -0,0 +1,230 @@
+# backend/app/services/db_partitions.py
+#
+# Daily range partitioning of the append-only tables (network_packets and
+# security_alerts). Retention drops whole days with DROP TABLE instead of running
+# a DELETE that scans the table, and every day keeps its own small indexes.
+#
+# Partitions of <table>:
+#   <table>_pYYYYMMDD  one per UTC day, created PARTITION_PREMAKE_DAYS ahead
+#   <table>_legacy     the table as it was before partitioning, attached as-is for
+#                      [MINVALUE, day after its newest row) and dropped once expired
+#   <table>_default    rows outside every daily range (clock skew); normally empty
+import logging
+import re
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateIndex
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Partitioned table -> retention in days (0 keeps every partition).
+PARTITIONED_TABLES = {
+    "network_packets": settings.PACKET_RETENTION_DAYS,
+    "security_alerts": settings.ALERT_RETENTION_DAYS,
+}
+# Tables whose int4 'id' an older model created and the current one declares as bigint.
+BIGINT_ID_TABLES = ("network_packets",)
+# Indexes that an older model created and the current one no longer declares.
+OBSOLETE_INDEXES = ("ix_network_packets_id",)
+# pg_advisory_xact_lock key, so two starting workers don't migrate at the same time.
+MIGRATION_LOCK_KEY = 0x4E475054
+_BOUNDS_RE = re.compile(r"FROM \((.+?)\) TO \((.+?)\)")
+
+
+def _utc_today() -> datetime:
+    # Timestamps are stored as 'timestamp without time zone' in UTC.
+    return datetime.now(timezone.utc).replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _parse_bound(value: str) -> datetime | None:
+    """A range bound from pg_get_expr(); None for MINVALUE / MAXVALUE."""
+    value = value.strip()
+    if value in ("MINVALUE", "MAXVALUE"):
+        return None
+    return datetime.fromisoformat(value.strip("'"))
+
+
+def _id_type(conn, table: str) -> str | None:
+    """SQL type of the table's 'id' column ('integer', 'bigint'), None if it doesn't exist."""
+    return conn.execute(text(
+        "SELECT data_type FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :table AND column_name = 'id'"
+    ), {"table": table}).scalar()
+
+
+def _relkind(conn, table: str) -> str | None:
+    """'r' for a plain table, 'p' for a partitioned one, None if it doesn't exist."""
+    return conn.execute(text(
+        "SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+        "WHERE c.relname = :table AND n.nspname = current_schema()"
+    ), {"table": table}).scalar()
+
+
+def list_partitions(conn, table: str) -> list[dict]:
+    """Partitions of 'table' as {"name", "lower", "upper", "default"} (bounds None when unbounded)."""
+    rows = conn.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+    ), {"table": table}).all()
+    partitions = []
+    for name, bound in rows:
+        match = _BOUNDS_RE.search(bound or "")
+        partitions.append({
+            "name": name, "default": match is None,
+            "lower": _parse_bound(match.group(1)) if match else None,
+            "upper": _parse_bound(match.group(2)) if match else None,
+        })
+    return partitions
+
+
+# --- Migration of pre-partitioning tables ---------------------------------------
+def rename_legacy_tables(conn) -> list[str]:
+    """
+    Runs before create_all(). Renames every table of PARTITIONED_TABLES that is
+    still a plain table (with its indexes and id sequence) to <table>_legacy, so
+    create_all() can create the partitioned parent under the original name.
+    Returns the renamed tables, for attach_legacy_tables().
+    """
+    conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+    renamed = []
+    for table in PARTITIONED_TABLES:
+        if _relkind(conn, table) != "r":
+            continue
+        legacy = f"{table}_legacy"
+        logger.warning(f"Table '{table}' is not partitioned yet; its rows are kept as partition '{legacy}'.")
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+        primary_key = conn.execute(text(
+            "SELECT conname FROM pg_constraint WHERE conrelid = CAST(:table AS regclass) AND contype = 'p'"
+        ), {"table": table}).scalar()
+        indexes = conn.execute(text(
+            "SELECT indexname FROM pg_indexes WHERE tablename = :table AND schemaname = current_schema()"
+        ), {"table": table}).scalars().all()
+        conn.execute(text(f"ALTER TABLE {table} RENAME TO {legacy}"))
+        # The partitioned primary key must include the partition column; ATTACH
+        # builds the (id, timestamp) key on the legacy table.
+        if primary_key:
+            conn.execute(text(f'ALTER TABLE {legacy} DROP CONSTRAINT "{primary_key}"'))
+        for index in indexes:
+            if index != primary_key:
+                conn.execute(text(f'ALTER INDEX "{index}" RENAME TO "{index}_legacy"'))
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} RENAME TO {legacy}_id_seq"))
+        renamed.append(table)
+    return renamed
+
+
+def attach_legacy_tables(conn, tables: list[str]):
+    """Runs after create_all(). Attaches each renamed table as the oldest partition of its parent."""
+    for table in tables:
+        legacy = f"{table}_legacy"
+        newest, max_id = conn.execute(text(f"SELECT max(timestamp), max(id) FROM {legacy}")).one()
+        if newest is None:
+            conn.execute(text(f"DROP TABLE {legacy}"))
+            continue
+        upper = newest.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
+        # A partition's columns must match the parent's (an old int4 id becomes bigint).
+        id_type = _id_type(conn, table)
+        if _id_type(conn, legacy) != id_type:
+            logger.info(f"Converting '{legacy}.id' to {id_type} (one-time table rewrite)...")
+            conn.execute(text(f"ALTER TABLE {legacy} ALTER COLUMN id TYPE {id_type}"))
+        logger.info(f"Attaching '{legacy}' to '{table}' for rows before {upper.date()} (one-time index build)...")
+        conn.execute(text(f"ALTER TABLE {table} ATTACH PARTITION {legacy} FOR VALUES FROM (MINVALUE) TO ('{upper}')"))
+        # New rows continue after the legacy ids.
+        conn.execute(text(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), {int(max_id)})"))
+
+
+def widen_id_columns(conn):
+    """
+    Runs after create_all(). Converts the int4 'id' of a BIGINT_ID_TABLES table
+    that was already partitioned by an older model, and its sequence, to bigint.
+    Rewrites every partition once.
+    """
+    for table in BIGINT_ID_TABLES:
+        if _id_type(conn, table) != "integer":
+            continue
+        logger.warning(f"Converting '{table}.id' to bigint (one-time rewrite of every partition)...")
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN id TYPE bigint"))
+        sequence = conn.execute(text("SELECT pg_get_serial_sequence(:table, 'id')"), {"table": table}).scalar()
+        if sequence:
+            conn.execute(text(f"ALTER SEQUENCE {sequence} AS bigint"))
+
+
+def migrate_indexes(conn, metadata):
+    """
+    create_all() doesn't touch tables that already exist, so indexes added to the
+    models of PARTITIONED_TABLES are created here (once; a build on a large
+    table blocks writes to it while it runs) and obsolete ones are dropped.
+    """
+    for name in OBSOLETE_INDEXES:
+        # Dropping the parent index drops its partitions' indexes; the legacy copy may be standalone.
+        conn.execute(text(f'DROP INDEX IF EXISTS "{name}"'))
+        conn.execute(text(f'DROP INDEX IF EXISTS "{name}_legacy"'))
+    for table in PARTITIONED_TABLES:
+        for index in metadata.tables[table].indexes:
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+# --- Maintenance ------------------------------------------------------------------
+def ensure_partitions(conn, days_ahead: int = settings.PARTITION_PREMAKE_DAYS) -> list[str]:
+    """
+    Creates the daily partitions from yesterday to today + days_ahead that don't
+    exist yet, plus the default partition. Returns the names of the new partitions.
+    """
+    created = []
+    today = _utc_today()
+    for table in PARTITIONED_TABLES:
+        partitions = list_partitions(conn, table)
+        ranges = [p for p in partitions if not p["default"]]
+        for offset in range(-1, days_ahead + 1):
+            day = today + timedelta(days=offset)
+            next_day = day + timedelta(days=1)
+            if any((p["lower"] is None or p["lower"] < next_day) and (p["upper"] is None or p["upper"] > day) for p in ranges):
+                continue
+            name = f"{table}_p{day:%Y%m%d}"
+            try:
+                # A savepoint, so one failure (e.g. the default partition already holds
+                # rows of that day) doesn't abort the surrounding transaction.
+                with conn.begin_nested():
+                    conn.execute(text(f"CREATE TABLE {name} PARTITION OF {table} FOR VALUES FROM ('{day}') TO ('{next_day}')"))
+                created.append(name)
+            except DBAPIError as e:
+                logger.error(f"Could not create partition '{name}': {e}")
+        if not any(p["default"] for p in partitions):
+            conn.execute(text(f"CREATE TABLE {table}_default PARTITION OF {table} DEFAULT"))
+            created.append(f"{table}_default")
+    return created
+
+
+def drop_expired_partitions(conn) -> list[str]:
+    """
+    Drops the partitions whose whole range is older than the table's retention
+    (so between N and N+1 days are kept) and deletes expired rows that ended up
+    in the default partition. Returns the names of the dropped partitions.
+    """
+    dropped = []
+    for table, retention_days in PARTITIONED_TABLES.items():
+        if retention_days <= 0:
+            continue
+        cutoff = _utc_today() - timedelta(days=retention_days)
+        for partition in list_partitions(conn, table):
+            if partition["default"]:
+                conn.execute(text(f"DELETE FROM {partition['name']} WHERE timestamp < :cutoff"), {"cutoff": cutoff})
+            elif partition["upper"] is not None and partition["upper"] <= cutoff:
+                conn.execute(text(f"DROP TABLE {partition['name']}"))
+                dropped.append(partition["name"])
+    return dropped
+
+
+def maintain_partitions(engine) -> tuple[list[str], list[str]]:
+    """Pre-creates upcoming partitions and drops expired ones in one short transaction."""
+    with engine.begin() as conn:
+        # Creating or dropping a partition briefly locks the parent; don't queue
+        # behind a long-running query and stall the packet writer meanwhile.
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        created = ensure_partitions(conn)
+        dropped = drop_expired_partitions(conn)
+    return created, dropped
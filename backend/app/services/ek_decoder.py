@@ -0,0 +1,124 @@
+# backend/app/services/ek_decoder.py
+#
+# Decoding of tshark "-T ek" (Elasticsearch bulk) JSON lines into the packet dicts
+# used by the packet pipeline, plus the reader/worker processes of the parallel
+# decoder pool. This module deliberately has no database imports so it can be
+# loaded by worker processes and by the benchmark scripts without any settings.
+import logging
+import multiprocessing
+import queue
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+from app.services.packet_ring import PacketRing
+
+logger = logging.getLogger(__name__)
+
+# tshark emits a bulk "index" action line before every document. Those lines never
+# carry packet layers, so we skip them before paying for json.loads.
+EK_INDEX_LINE_PREFIX = b'{"index"'
+READ_BLOCK_BYTES = 1024 * 1024
+
+
+def decode_ek_line(line) -> dict | None:
+    """
+    Decodes one EK JSON line (str or bytes) into a packet dict, or returns None
+    if the line is not a packet document or lacks source/destination IPs.
+    """
+    try:
+        ek_doc = json.loads(line)
+        layers = ek_doc.get("layers")
+        if not layers: return None
+        ip_layer = layers.get("ip", {})
+        eth_layer = layers.get("eth", {})
+        timestamp_str = ek_doc.get("timestamp")
+        packet_data = {
+            "@timestamp": datetime.fromtimestamp(float(timestamp_str)/1000, tz=timezone.utc).isoformat(),
+            "source_ip": ip_layer.get("ip_ip_src"), "destination_ip": ip_layer.get("ip_ip_dst"),
+            "length": int(layers.get("frame", {}).get("frame_frame_len", 0)), "ttl": int(ip_layer.get("ip_ip_ttl", 0)),
+            "protocol": "UNKNOWN", "source_mac": eth_layer.get("eth_eth_src"), "destination_mac": eth_layer.get("eth_eth_dst"),
+            "source_port": None, "destination_port": None, "flags": None
+        }
+        if "tcp" in layers:
+            packet_data["protocol"] = "TCP"; packet_data["source_port"] = int(layers["tcp"].get("tcp_tcp_srcport", 0)); packet_data["destination_port"] = int(layers["tcp"].get("tcp_tcp_dstport", 0))
+        elif "udp" in layers:
+            packet_data["protocol"] = "UDP"; packet_data["source_port"] = int(layers["udp"].get("udp_udp_srcport", 0)); packet_data["destination_port"] = int(layers["udp"].get("udp_udp_dstport", 0))
+        elif "icmp" in layers: packet_data["protocol"] = "ICMP"
+        if packet_data["source_ip"] and packet_data["destination_ip"]:
+            return packet_data
+    except (json.JSONDecodeError, KeyError, AttributeError, TypeError, ValueError):
+        pass
+    return None
+
+
+def decode_ek_chunk(chunk: bytes) -> list[dict]:
+    """Decodes a block of complete EK lines. The result keeps the stream order."""
+    packets = []
+    for line in chunk.split(b"\n"):
+        if not line or line.startswith(EK_INDEX_LINE_PREFIX):
+            continue
+        packet_data = decode_ek_line(line)
+        if packet_data:
+            packets.append(packet_data)
+    return packets
+
+
+def iter_ek_chunks(fd: int, block_bytes: int = READ_BLOCK_BYTES):
+    """
+    Yields chunks of complete lines read from a file descriptor. A read on a pipe
+    returns whatever is currently buffered, so chunks are small when traffic is
+    light (low latency) and large when it is heavy (high throughput).
+    """
+    remainder = b""
+    while True:
+        data = os.read(fd, block_bytes)
+        if not data:
+            return
+        data = remainder + data
+        cut = data.rfind(b"\n")
+        if cut == -1:
+            remainder = data
+            continue
+        remainder = data[cut + 1:]
+        yield data[:cut]
+
+
+def ek_chunk_reader_process(chunk_queue: multiprocessing.Queue, pipe_path: str, stop_event: multiprocessing.Event):
+    """Reads the tshark stream and fans out line-chunks to the decoder workers."""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [ek_chunk_reader] - %(levelname)s - %(message)s')
+    proc_logger = logging.getLogger(__name__)
+    proc_logger.info(f"EK chunk reader started. Monitoring pipe: '{pipe_path}'.")
+    while not stop_event.is_set():
+        try:
+            proc_logger.info(f"Opening pipe '{pipe_path}'. Waiting for data stream...")
+            fd = os.open(pipe_path, os.O_RDONLY)
+            try:
+                for chunk in iter_ek_chunks(fd):
+                    if stop_event.is_set(): break
+                    chunk_queue.put(chunk)
+            finally:
+                os.close(fd)
+            proc_logger.warning("Stream ended. Will attempt to reopen in 2 seconds."); time.sleep(2)
+        except Exception as e:
+            proc_logger.error(f"An unexpected error occurred in the EK chunk reader: {e}", exc_info=True); time.sleep(5)
+    proc_logger.info("EK chunk reader received stop signal and is shutting down.")
+
+
+def ek_decoder_worker_process(chunk_queue: multiprocessing.Queue, packet_ring: PacketRing, stop_event: multiprocessing.Event):
+    """
+    Decodes chunks from the reader and writes the packets into this worker's own
+    shared-memory PacketRing (see app.services.packet_ring).
+    """
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - [ek_decoder_worker] - %(levelname)s - %(message)s')
+    proc_logger = logging.getLogger(__name__)
+    proc_logger.info(f"EK decoder worker started [PID: {os.getpid()}].")
+    while not stop_event.is_set():
+        try:
+            chunk = chunk_queue.get(timeout=1.0)
+        except queue.Empty:
+            continue
+        for packet_data in decode_ek_chunk(chunk):
+            packet_ring.put(packet_data)
+    proc_logger.info("EK decoder worker received stop signal and is shutting down.")
@@ -0,0 +1,81 @@
+# backend/app/services/es_index_cache.py
+#
+# Small TTL cache for Elasticsearch index/alias existence checks, shared by all
+# query services. Without it every dashboard widget paid one extra round trip
+# (indices.exists / indices.exists_alias) before its real query.
+import asyncio
+import time
+from elasticsearch import AsyncElasticsearch, NotFoundError
+
+from app.config import settings
+
+
+class IndexMetadataCache:
+    """
+    Remembers whether an index or alias exists. Positive answers live for
+    ES_INDEX_CACHE_TTL_SECONDS; negative answers expire sooner so a freshly
+    bootstrapped index shows up quickly. Concurrent misses for the same name
+    share a single request.
+    """
+    def __init__(self, ttl_seconds: float, negative_ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self._entries: dict[tuple[str, str], tuple[bool, float]] = {}
+        self._in_flight: dict[tuple[str, str], asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def _exists(self, kind: str, name: str, lookup) -> bool:
+        key = (kind, name)
+        entry = self._entries.get(key)
+        if entry and entry[1] > time.monotonic():
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+        pending = self._in_flight.get(key)
+        if pending:
+            return await pending
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        try:
+            exists = bool(await lookup())
+            ttl = self.ttl_seconds if exists else self.negative_ttl_seconds
+            self._entries[key] = (exists, time.monotonic() + ttl)
+            future.set_result(exists)
+            return exists
+        except Exception as e:
+            future.set_exception(e)
+            # Retrieve it so waiters-less futures don't log "exception never retrieved".
+            future.exception()
+            raise
+        finally:
+            del self._in_flight[key]
+
+    async def alias_exists(self, client: AsyncElasticsearch, name: str) -> bool:
+        return await self._exists("alias", name, lambda: client.indices.exists_alias(name=name))
+
+    async def index_exists(self, client: AsyncElasticsearch, name: str) -> bool:
+        return await self._exists("index", name, lambda: client.indices.exists(index=name))
+
+    def invalidate(self, name: str | None = None):
+        """Drops the cached answers for one name, or everything when name is None."""
+        if name is None:
+            self._entries.clear()
+            return
+        for key in [key for key in self._entries if key[1] == name]:
+            del self._entries[key]
+
+    def invalidate_on_error(self, error: Exception, name: str):
+        """Call from a query's error handler: an 'index not found' means our entry is stale."""
+        if isinstance(error, NotFoundError):
+            self.invalidate(name)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# A single, shared instance used by every Elasticsearch-backed service.
+index_cache = IndexMetadataCache(
+    ttl_seconds=settings.ES_INDEX_CACHE_TTL_SECONDS,
+    negative_ttl_seconds=min(settings.ES_INDEX_CACHE_TTL_SECONDS, 10),
+)
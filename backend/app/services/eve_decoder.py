@@ -0,0 +1,69 @@
+# backend/app/services/eve_decoder.py
+#
+# Decoding of Suricata eve.json lines into security_alerts rows. Like
+# ek_decoder, this module has no database imports so the benchmark scripts can
+# load it without any settings.
+#
+# Flow, dns, http, tls and stats events outnumber alerts by orders of magnitude,
+# so lines are first screened on their raw bytes for the event_type token and
+# only the candidates are decoded. The JSON backend is picked at import time:
+# orjson, then simdjson, then the standard library.
+import json
+from datetime import datetime
+
+try:
+    import orjson
+    json_loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import simdjson
+        json_loads = simdjson.loads
+        JSON_BACKEND = "simdjson"
+    except ImportError:
+        json_loads = json.loads
+        JSON_BACKEND = "json"
+
+# Suricata writes compact JSON; the spaced form covers re-serialized test files.
+EVE_ALERT_TOKEN = b'"event_type":"alert"'
+EVE_ALERT_TOKEN_SPACED = b'"event_type": "alert"'
+
+
+def is_alert_candidate(line: bytes) -> bool:
+    """Cheap byte-level check; a False answer means the line is certainly not an alert."""
+    return EVE_ALERT_TOKEN in line or EVE_ALERT_TOKEN_SPACED in line
+
+
+def filter_alert_candidates(lines: list[bytes]) -> list[bytes]:
+    """is_alert_candidate over a whole batch, without a Python call per line."""
+    return [line for line in lines if EVE_ALERT_TOKEN in line or EVE_ALERT_TOKEN_SPACED in line]
+
+
+def parse_alert_line(line: bytes | str) -> dict | None:
+    """
+    Parses one eve.json line into a security_alerts row, or returns None if it is
+    not an 'alert' event. Raises on malformed JSON or timestamps.
+    """
+    if isinstance(line, str):
+        line = line.encode("utf-8")
+    if not is_alert_candidate(line):
+        return None
+    log = json_loads(line)
+
+    # We are only interested in 'alert' events.
+    if log.get('event_type') != 'alert':
+        return None
+
+    alert_data = log.get('alert', {})
+    return {
+        "timestamp": datetime.fromisoformat(log.get('timestamp').replace("Z", "+00:00")),
+        "source_ip": log.get('src_ip'),
+        "source_port": log.get('src_port'),
+        "destination_ip": log.get('dest_ip'),
+        "destination_port": log.get('dest_port'),
+        "protocol": log.get('proto'),
+        "severity": alert_data.get('severity', 3),
+        "signature": alert_data.get('signature'),
+        "event_type": log.get('event_type'),
+        "raw_log": line.decode("utf-8", errors="replace"),
+    }
@@ -0,0 +1,99 @@
+# backend/app/services/geoip_service.py
+#
+# IP -> country lookups shared by every router and service. The GeoLite2
+# database is opened once, on first use, as a memory-mapped reader, and results
+# are kept in an LRU cache: the dashboards resolve the same few hundred
+# attacker/talker IPs on every refresh.
+import ipaddress
+import logging
+import threading
+from collections import OrderedDict
+
+import geoip2.database
+from geoip2.errors import AddressNotFoundError
+from maxminddb import InvalidDatabaseError
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def is_local(ip: str) -> bool:
+    """True for private, loopback, link-local and other non-global addresses (never in the mmdb)."""
+    try:
+        return not ipaddress.ip_address(ip).is_global
+    except ValueError:
+        return False
+
+
+class GeoIPService:
+    """
+    Country ISO code lookups with an LRU cache of 'cache_size' IPs. Local and
+    unknown addresses resolve to None without (or after one) mmdb lookup. Safe
+    to use from the event loop and from threadpool endpoints alike.
+    """
+    def __init__(self, db_path: str, cache_size: int):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self._reader = None
+        self._open_failed = False
+        self._cache: OrderedDict[str, str | None] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.local = 0
+
+    def _get_reader(self):
+        if self._reader is None and not self._open_failed:
+            with self._lock:
+                if self._reader is None and not self._open_failed:
+                    try:
+                        # MODE_AUTO memory-maps the file (through the C extension when installed).
+                        self._reader = geoip2.database.Reader(self.db_path)
+                    except (OSError, InvalidDatabaseError) as e:
+                        logger.error(f"GeoIP database not available at {self.db_path}; country lookups are disabled. Error: {e}")
+                        self._open_failed = True
+        return self._reader
+
+    @property
+    def available(self) -> bool:
+        return self._get_reader() is not None
+
+    @staticmethod
+    def _resolve(reader, ip: str) -> str | None:
+        try:
+            return reader.country(ip).country.iso_code
+        except (AddressNotFoundError, ValueError):
+            return None
+
+    def country(self, ip: str) -> str | None:
+        """ISO code of the IP's country; None when local, unknown, malformed or the database is missing."""
+        reader = self._get_reader()
+        if reader is None or not ip:
+            return None
+        with self._lock:
+            if ip in self._cache:
+                self._cache.move_to_end(ip)
+                self.hits += 1
+                return self._cache[ip]
+            self.misses += 1
+        local = is_local(ip)
+        code = None if local else self._resolve(reader, ip)
+        with self._lock:
+            self.local += local
+            self._cache[ip] = code
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return code
+
+    def lookup_many(self, ips) -> dict[str, str | None]:
+        """{ip: country} for the distinct IPs in 'ips'."""
+        return {ip: self.country(ip) for ip in dict.fromkeys(ips)}
+
+    def stats(self) -> dict:
+        return {"available": self._reader is not None, "entries": len(self._cache),
+                "hits": self.hits, "misses": self.misses, "local": self.local}
+
+
+# A single, shared instance used by every GeoIP consumer.
+geoip = GeoIPService(settings.GEOIP_DB_PATH, settings.GEOIP_CACHE_SIZE)
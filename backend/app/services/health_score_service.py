@@ -1,27 +1,21 @@
 # backend/app/services/health_score_service.py (CORRECTED)
 
-from elasticsearch import Elasticsearch
+import asyncio
+from elasticsearch import AsyncElasticsearch
 from ..config import settings
 
 # <--- ALL OLD CLIENT LOGIC (get_es_client, close_es_client) IS REMOVED FROM THIS FILE --->
 
-def get_health_score_details(client: Elasticsearch) -> dict:
+async def get_health_score_details(client: AsyncElasticsearch) -> dict:
     """
-    Calculates the health score using a provided, authenticated Elasticsearch client.
+    Calculates the health score using a provided, authenticated async Elasticsearch client.
+    The alert and scanner aggregations are independent, so they run concurrently.
     """
     try:
         # The 'client' is now passed in from the router, already authenticated.
         time_filter = {"range": {"@timestamp": {"gte": "now-1h", "lt": "now"}}}
         
         alert_query = { "size": 0, "query": {"bool": {"must": [time_filter, {"term": {"event_type": "alert"}}]}}, "aggs": {"alerts_by_severity": {"terms": {"field": "alert.severity"}}} }
-        alert_response = client.search(index="netguard-suricata-*", body=alert_query)
-        
-        buckets = alert_response.get('aggregations', {}).get('alerts_by_severity', {}).get('buckets', [])
-        critical_alerts_count, high_alerts_count = 0, 0
-        for bucket in buckets:
-            if bucket.get('key') == 1: critical_alerts_count = bucket.get('doc_count', 0)
-            elif bucket.get('key') == 2: high_alerts_count = bucket.get('doc_count', 0)
-
         scan_query = {
             "size": 0,
             "query": { "bool": { "must": [time_filter, {"term": {"conn_state": "S0"}}], "must_not": [{"terms": {"id_orig_h": settings.TRUSTED_SCANNER_IPS}}] } },
@@ -30,7 +24,16 @@ def get_health_score_details(client: Elasticsearch) -> dict:
                 "top_scanners": { "terms": { "field": "id_orig_h", "size": 5 } } 
             }
         }
-        scan_response = client.search(index="netguard-zeek-*", body=scan_query)
+        alert_response, scan_response = await asyncio.gather(
+            client.search(index="netguard-suricata-*", body=alert_query),
+            client.search(index="netguard-zeek-*", body=scan_query),
+        )
+
+        buckets = alert_response.get('aggregations', {}).get('alerts_by_severity', {}).get('buckets', [])
+        critical_alerts_count, high_alerts_count = 0, 0
+        for bucket in buckets:
+            if bucket.get('key') == 1: critical_alerts_count = bucket.get('doc_count', 0)
+            elif bucket.get('key') == 2: high_alerts_count = bucket.get('doc_count', 0)
         
         aggs = scan_response.get('aggregations', {})
         unique_scanners_count = aggs.get('unique_scanner_count', {}).get('value', 0)
@@ -1,12 +1,14 @@
 # backend/app/services/ids_query_service.py
 
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import asyncio
 import json
-from elasticsearch import Elasticsearch
-from sqlalchemy import or_
+import time
+from elasticsearch import AsyncElasticsearch
 from sqlalchemy.orm import Session
-from app import models
-from app.dependencies import es_client
+from app.dependencies import async_es_client
+from app.services.es_index_cache import index_cache
+from app.services import zeek_rollup, packet_queries
 
 
 
@@ -14,12 +16,17 @@ from app.dependencies import es_client
 ZEEK_INDEX_ALIAS = "netguard-zeek-*"
 SURICATA_INDEX_ALIAS = "netguard-suricata-*"
 
-def get_latest_zeek_connections(limit: int = 100):
+# query_alerts_by_ip_and_time polls (0.5 s, 1 s, 2 s, ...) for at most this long
+# while waiting for Filebeat to ship alerts for a window that just closed.
+INGEST_WAIT_MAX_SECONDS = 10
+INGEST_WAIT_INITIAL_DELAY_SECONDS = 0.5
+
+async def get_latest_zeek_connections(limit: int = 100):
     """
     Queries Elasticsearch for the latest Zeek connection logs.
     NOW USES THE CORRECT ROLLOVER ALIAS.
     """
-    if not es_client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, ZEEK_INDEX_ALIAS):
         print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
         return []
     try:
@@ -34,18 +41,19 @@ def get_latest_zeek_connections(limit: int = 100):
                 }
             }
         }
-        res = es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
+        res = await async_es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
         return [hit['_source'] for hit in res['hits']['hits']]
     except Exception as e:
+        index_cache.invalidate_on_error(e, ZEEK_INDEX_ALIAS)
         print(f"ERROR: Failed to query Zeek connections: {e}")
         return []
 
-def get_latest_suricata_flows(limit: int = 100):
+async def get_latest_suricata_flows(limit: int = 100):
     """
     Queries Elasticsearch for the latest Suricata flow logs.
     NOW USES THE CORRECT ROLLOVER ALIAS.
     """
-    if not es_client.indices.exists_alias(name=SURICATA_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, SURICATA_INDEX_ALIAS):
         print(f"WARNING: Suricata alias '{SURICATA_INDEX_ALIAS}' not found.")
         return []
     try:
@@ -60,18 +68,19 @@ def get_latest_suricata_flows(limit: int = 100):
             "sort": [{"@timestamp": {"order": "desc"}}],
             "size": limit
         }
-        res = es_client.search(index=SURICATA_INDEX_ALIAS, body=query)
+        res = await async_es_client.search(index=SURICATA_INDEX_ALIAS, body=query)
         return [hit['_source'] for hit in res['hits']['hits']]
     except Exception as e:
+        index_cache.invalidate_on_error(e, SURICATA_INDEX_ALIAS)
         print(f"ERROR: Failed to query Suricata flows: {e}")
         return []
 
-def get_zeek_protocol_distribution(limit: int = 10):
+async def get_zeek_protocol_distribution(limit: int = 10):
     """
     Queries Elasticsearch for the top protocols by total bytes transferred.
     NOW USES THE CORRECT ROLLOVER ALIAS and a time range filter.
     """
-    if not es_client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, ZEEK_INDEX_ALIAS):
         print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found for protocol distribution.")
         return []
     try:
@@ -85,55 +94,29 @@ def get_zeek_protocol_distribution(limit: int = 10):
             "size": 0,
             "query": {
                 "bool": {
-                    "must": [
-                        { "exists": { "field": "proto" } },
-                        { "exists": { "field": "orig_ip_bytes" } },
-                        { "exists": { "field": "resp_ip_bytes" } },
+                    "filter": [
+                        { "exists": { "field": "total_bytes" } },
                         { "range": { "@timestamp": { "gte": time_window_start, "lte": time_window_end } } }
                     ]
                 }
             },
             "aggs": {
                 "protocol_traffic": {
+                    # app_protocol and total_bytes are precomputed by the
+                    # 'netguard-zeek-enrich' ingest pipeline (see setup-elastic.sh).
                     "terms": {
-                        "script": {
-                            "lang": "painless",
-                            "source": """
-                                def final_protocol = "UNKNOWN";
-                                if (doc.containsKey('proto') && !doc['proto'].empty) {
-                                    final_protocol = doc['proto'].value.toUpperCase();
-                                }
-                                int port = 0;
-                                if (doc.containsKey('id_orig_p') && !doc['id_orig_p'].empty) {
-                                    port = (int) doc['id_orig_p'].value;
-                                } else if (doc.containsKey('id_resp_p') && !doc['id_resp_p'].empty) {
-                                    port = (int) doc['id_resp_p'].value;
-                                }
-                                if (port == 80) return "HTTP"; if (port == 443) return "HTTPS"; if (port == 21) return "FTP";
-                                if (port == 22) return "SSH"; if (port == 23) return "TELNET"; if (port == 25) return "SMTP";
-                                if (port == 53) return "DNS"; if (port == 110) return "POP3"; if (port == 143) return "IMAP";
-                                if (port == 3389) return "RDP"; if (port == 445) return "SMB";
-                                return final_protocol;
-                            """
-                        },
+                        "field": "app_protocol",
                         "size": limit,
                         "order": { "total_bytes": "desc" }
                     },
                     "aggs": {
-                        "total_bytes": {
-                            "sum": {
-                                "script": {
-                                    "source": "doc['orig_ip_bytes'].value + doc['resp_ip_bytes'].value",
-                                    "lang": "painless"
-                                }
-                            }
-                        }
+                        "total_bytes": { "sum": { "field": "total_bytes" } }
                     }
                 }
             }
         }
 
-        res = es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
+        res = await async_es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
         distribution_data = []
         if 'aggregations' in res and 'protocol_traffic' in res['aggregations'] and 'buckets' in res['aggregations']['protocol_traffic']:
             for bucket in res['aggregations']['protocol_traffic']['buckets']:
@@ -143,23 +126,34 @@ def get_zeek_protocol_distribution(limit: int = 10):
                 })
         return distribution_data
     except Exception as e:
+        index_cache.invalidate_on_error(e, ZEEK_INDEX_ALIAS)
         print(f"ERROR: An unexpected error occurred during protocol distribution: {e}")
         return []
 
-def query_alerts_by_ip_and_time(target_ip: str, start_time: datetime, end_time: datetime):
+async def query_alerts_by_ip_and_time(target_ip: str, start_time: datetime, end_time: datetime,
+                                      max_wait_seconds: float = INGEST_WAIT_MAX_SECONDS):
     """
-    Queries Elasticsearch for Suricata alerts.
-    NOW USES THE CORRECT ROLLOVER ALIAS.
+    Queries Elasticsearch for Suricata alerts involving target_ip in [start_time, end_time]
+    (naive UTC datetimes).
+
+    Alerts for a window that just closed may still be on their way through
+    Filebeat. Instead of sleeping a fixed 10 seconds, every attempt also asks ES
+    for the newest indexed @timestamp: once ingestion has moved past end_time
+    (so nothing more can arrive for the window) the result is returned. Alerts
+    found earlier may be incomplete, so we keep polling with backoff until then
+    or until max_wait_seconds, and return the last result.
+
+    Nothing in this repo calls it (nor did it call the sleeping version); it is
+    kept as part of this service's query API.
     """
-    if not es_client.indices.exists_alias(name=SURICATA_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, SURICATA_INDEX_ALIAS):
         print(f"WARNING: Suricata alias '{SURICATA_INDEX_ALIAS}' not found.")
         return []
 
     try:
-        import time
-        time.sleep(10)
         time_window_start = start_time.isoformat() + 'Z'
         time_window_end = end_time.isoformat() + 'Z'
+        end_time_ms = end_time.replace(tzinfo=timezone.utc).timestamp() * 1000
 
         query = {
             "query": {
@@ -177,20 +171,32 @@ def query_alerts_by_ip_and_time(target_ip: str, start_time: datetime, end_time:
                         ], "minimum_should_match": 1 } }
                     ]
                 }
-            }
+            },
+            # Newest document searchable in the whole index, independent of the query above.
+            "aggs": { "ingest": { "global": {}, "aggs": { "indexed_up_to": { "max": { "field": "@timestamp" } } } } }
         }
-        res = es_client.search(index=SURICATA_INDEX_ALIAS, body=query, size=100)
-        return [hit['_source'] for hit in res['hits']['hits']]
+        deadline = time.monotonic() + max_wait_seconds
+        delay = INGEST_WAIT_INITIAL_DELAY_SECONDS
+        while True:
+            res = await async_es_client.search(index=SURICATA_INDEX_ALIAS, body=query, size=100)
+            alerts = [hit['_source'] for hit in res['hits']['hits']]
+            indexed_up_to = res.get('aggregations', {}).get('ingest', {}).get('indexed_up_to', {}).get('value') or 0
+            remaining = deadline - time.monotonic()
+            if indexed_up_to >= end_time_ms or remaining <= 0:
+                return alerts
+            await asyncio.sleep(min(delay, remaining))
+            delay *= 2
     except Exception as e:
+        index_cache.invalidate_on_error(e, SURICATA_INDEX_ALIAS)
         print(f"ERROR: IDS Query Service failed to query Elasticsearch: {e}")
         return []
 
-def get_top_ips_by_traffic(time_range="24h", top_n=100):
+async def get_top_ips_by_traffic(time_range="24h", top_n=100):
     """
     Gets the top N destination IPs from Zeek logs.
     NOW USES THE CORRECT ROLLOVER ALIAS.
     """
-    if not es_client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, ZEEK_INDEX_ALIAS):
         print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
         return []
 
@@ -218,151 +224,197 @@ def get_top_ips_by_traffic(time_range="24h", top_n=100):
         }
     }
     try:
-        response = es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
+        response = await async_es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
         buckets = response.get('aggregations', {}).get('top_ips', {}).get('buckets', [])
         return [{"ip": bucket['key'], "count": bucket['doc_count']} for bucket in buckets]
     except Exception as e:
+        index_cache.invalidate_on_error(e, ZEEK_INDEX_ALIAS)
         print(f"Error querying Elasticsearch for top IPs: {e}")
         return []
 
-def get_zeek_traffic_timeline(time_range_hours=1, interval_minutes=1):
+async def _raw_zeek_histogram(client: AsyncElasticsearch, start_ms: int, interval_minutes: int, filters: list,
+                              terms_field: str, terms_size: int, sum_field: str | None = None) -> dict:
     """
-    Creates a time-bucketed aggregation of traffic volume per protocol.
-    NOW USES THE CORRECT ROLLOVER ALIAS.
+    Aggregates raw Zeek docs since start_ms into {bucket_ms: {key: value}}. Used
+    for the live tail after the rollup watermark, or for the whole range when
+    rollups don't cover it.
     """
-    if not es_client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
-        print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
-        return []
-
+    by_key = {"terms": {"field": terms_field, "size": terms_size}}
+    if sum_field:
+        by_key["aggs"] = {"value": {"sum": {"field": sum_field}}}
     query = {
         "size": 0,
-        "query": {
-            # FIXED: Added the 'bool' and 'filter' clauses back from the old file.
-            # This prevents errors by ensuring the fields exist before aggregation.
-            "bool": {
-                "filter": [
-                    {"range": {"@timestamp": {"gte": f"now-{time_range_hours}h"}}},
-                    {"exists": {"field": "proto"}},
-                    {"exists": {"field": "orig_ip_bytes"}},
-                    {"exists": {"field": "resp_ip_bytes"}}
-                ]
-            }
-        },
+        "query": {"bool": {"filter": [{"range": {"@timestamp": {"gte": start_ms, "format": "epoch_millis"}}}, *filters]}},
         "aggs": {
-            "traffic_over_time": {
-                "date_histogram": {
-                    "field": "@timestamp",
-                    "fixed_interval": f"{interval_minutes}m"
-                },
-                "aggs": {
-                    "by_protocol": {
-                        "terms": {"field": "proto"},
-                        "aggs": {
-                            "total_bytes": {
-                                "sum": {
-                                    # FIXED: Restored the full script definition with explicit language.
-                                    "script": {
-                                        "source": "doc['orig_ip_bytes'].value + doc['resp_ip_bytes'].value",
-                                        "lang": "painless"
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
+            "over_time": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": f"{interval_minutes}m", "min_doc_count": 1},
+                "aggs": {"by_key": by_key}
             }
         }
     }
+    response = await client.search(index=ZEEK_INDEX_ALIAS, body=query)
+    return {
+        bucket['key']: {b['key']: (b['value']['value'] if sum_field else b['doc_count']) for b in bucket['by_key']['buckets']}
+        for bucket in response.get('aggregations', {}).get('over_time', {}).get('buckets', [])
+    }
+
+async def _zeek_histogram(kind: str, time_range_hours: int, interval_minutes: int, filters: list,
+                          terms_field: str, terms_size: int, sum_field: str | None = None):
+    """
+    Reads [now - time_range_hours, watermark) from the rollups and only the tail
+    from raw data, then merges the two. Falls back to raw data for the whole
+    range when the rollups don't reach back far enough.
+    """
+    # Minute-aligned, so the first minute is either wholly in the rollups or wholly raw.
+    start_ms = zeek_rollup.floor_to(zeek_rollup.now_ms() - time_range_hours * 3600 * 1000, zeek_rollup.MINUTE_MS)
+    watermark = zeek_rollup.split_range(start_ms)
+    if watermark is None:
+        buckets = await _raw_zeek_histogram(async_es_client, start_ms, interval_minutes, filters, terms_field, terms_size, sum_field)
+    else:
+        rolled, tail = await asyncio.gather(
+            zeek_rollup.rollup_histogram(async_es_client, kind, start_ms, watermark, interval_minutes, terms_size),
+            _raw_zeek_histogram(async_es_client, watermark, interval_minutes, filters, terms_field, terms_size, sum_field),
+        )
+        buckets = zeek_rollup.merge_buckets(rolled, tail)
+    return zeek_rollup.fill_buckets(buckets, interval_minutes)
+
+async def get_zeek_traffic_timeline(time_range_hours=1, interval_minutes=1):
+    """
+    Creates a time-bucketed aggregation of traffic volume per protocol.
+    Completed minutes come from the Zeek rollups (see services/zeek_rollup.py).
+    """
+    if not await index_cache.alias_exists(async_es_client, ZEEK_INDEX_ALIAS):
+        print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
+        return []
 
     try:
-        response = es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
-        buckets = response.get('aggregations', {}).get('traffic_over_time', {}).get('buckets', [])
+        # 'total_bytes' is precomputed at ingest time by 'netguard-zeek-enrich'.
+        buckets = await _zeek_histogram("protocol_bytes", time_range_hours, interval_minutes,
+                                        zeek_rollup.PROTOCOL_FILTER, "proto", 10, sum_field="total_bytes")
         timeline_data = []
-        for bucket in buckets:
-            time_point = {"time": bucket['key']}
-            for proto_bucket in bucket.get('by_protocol', {}).get('buckets', []):
-                time_point[proto_bucket['key'].upper()] = proto_bucket['total_bytes']['value']
+        for key, protocols in buckets:
+            time_point = {"time": key}
+            for protocol, total_bytes in protocols.items():
+                time_point[protocol.upper()] = total_bytes
             timeline_data.append(time_point)
         return timeline_data
     except Exception as e:
+        index_cache.invalidate_on_error(e, ZEEK_INDEX_ALIAS)
         print(f"Error querying Elasticsearch for traffic timeline: {e}")
         return []
 
-def get_zeek_conn_state_distribution(client: Elasticsearch, time_range_hours: int = 1):
+async def get_zeek_conn_state_distribution(client: AsyncElasticsearch | None = None, time_range_hours: int = 1):
     """
-    Aggregates Zeek connection logs by connection state using a provided client.
+    Aggregates Zeek connection logs by connection state using a provided client
+    (defaults to the shared async client). Completed minutes come from the rollups.
     """
-    if not client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
+    client = client or async_es_client
+    if not await index_cache.alias_exists(client, ZEEK_INDEX_ALIAS):
         print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
         return []
-    
+
+    # Same window as "now-{time_range_hours}h/h": from the start of that hour until now.
+    start_ms = zeek_rollup.floor_to(zeek_rollup.now_ms() - time_range_hours * 3600 * 1000, zeek_rollup.HOUR_MS)
+    watermark = zeek_rollup.split_range(start_ms)
     query = {
         "size": 0,
         "query": {
             "bool": {
                 "filter": [
-                    {"range": {"@timestamp": {"gte": f"now-{time_range_hours}h/h", "lte": "now/h"}}},
+                    {"range": {"@timestamp": {"gte": watermark or start_ms, "format": "epoch_millis"}}},
                     {"exists": {"field": "conn_state"}}
                 ]
             }
         },
         "aggs": { "conn_state_breakdown": { "terms": { "field": "conn_state", "size": 20 }}}
     }
-    
-    response = client.search(index=ZEEK_INDEX_ALIAS, body=query)
+
+    if watermark is None:
+        response, rolled = await client.search(index=ZEEK_INDEX_ALIAS, body=query), {}
+    else:
+        response, rolled = await asyncio.gather(
+            client.search(index=ZEEK_INDEX_ALIAS, body=query),
+            zeek_rollup.rollup_terms(client, "conn_state", start_ms, watermark, size=20),
+        )
     buckets = response.get('aggregations', {}).get('conn_state_breakdown', {}).get('buckets', [])
-    return [{"name": bucket['key'], "value": bucket['doc_count']} for bucket in buckets]
+    counts = zeek_rollup.merge_buckets({0: rolled}, {0: {bucket['key']: bucket['doc_count'] for bucket in buckets}}).get(0, {})
+    return [{"name": state, "value": int(count)} for state, count in sorted(counts.items(), key=lambda item: -item[1])]
 
 
 
-def get_detailed_zeek_conn_state_timeline(time_range_hours: int = 24, interval_minutes: int = 30):
+async def get_detailed_zeek_conn_state_timeline(time_range_hours: int = 24, interval_minutes: int = 30):
     """
     Creates a time-bucketed aggregation of connection states for a detailed modal view.
-    NOW USES THE CORRECT ROLLOVER ALIAS.
+    Reads the Zeek rollups (hourly docs for hour-sized intervals), so week-long
+    ranges no longer scan every raw connection.
     """
-    if not es_client.indices.exists_alias(name=ZEEK_INDEX_ALIAS):
+    if not await index_cache.alias_exists(async_es_client, ZEEK_INDEX_ALIAS):
         print(f"WARNING: Zeek alias '{ZEEK_INDEX_ALIAS}' not found.")
         return []
-    query = {
-        "size": 0,
-        "query": { "range": {"@timestamp": {"gte": f"now-{time_range_hours}h"}}},
-        "aggs": {
-            "states_over_time": {
-                "date_histogram": {
-                    "field": "@timestamp",
-                    "fixed_interval": f"{interval_minutes}m"
-                },
-                "aggs": { "by_state": { "terms": {"field": "conn_state", "size": 10}}}
-            }
-        }
-    }
     try:
-        response = es_client.search(index=ZEEK_INDEX_ALIAS, body=query)
-        buckets = response.get('aggregations', {}).get('states_over_time', {}).get('buckets', [])
+        buckets = await _zeek_histogram("conn_state", time_range_hours, interval_minutes,
+                                        [{"exists": {"field": "conn_state"}}], "conn_state", 10)
         timeline_data = []
-        for bucket in buckets:
-            time_point = {"time": bucket['key_as_string']}
-            for state_bucket in bucket.get('by_state', {}).get('buckets', []):
-                time_point[state_bucket['key']] = state_bucket['doc_count']
+        for key, states in buckets:
+            time_point = {"time": datetime.fromtimestamp(key / 1000, tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.000Z")}
+            for state, count in states.items():
+                time_point[state] = int(count)
             timeline_data.append(time_point)
         return timeline_data
     except Exception as e:
+        index_cache.invalidate_on_error(e, ZEEK_INDEX_ALIAS)
         print(f"Error querying Elasticsearch for detailed connection state timeline: {e}")
         return []
 
 
+async def get_zeek_bandwidth(client: AsyncElasticsearch, window_seconds: int = 60):
+    """
+    Per-second ingress/egress bytes for the last window_seconds (egress = sent by
+    a host in LOCAL_NETWORKS, as in the traffic aggregator). Seconds before
+    the rollup watermark come from the per-minute rollup docs; only the tail is
+    aggregated from raw Zeek data. Raises on Elasticsearch errors.
+    """
+    end_ms = zeek_rollup.now_ms()
+    start_ms = zeek_rollup.floor_to(end_ms - window_seconds * 1000, 1000)
+    watermark = zeek_rollup.split_range(start_ms)
+    query = {
+        "size": 0,
+        "query": {
+            "bool": {
+                "filter": [
+                    *zeek_rollup.BANDWIDTH_FILTER,
+                    {"range": {"@timestamp": {"gte": watermark or start_ms, "lte": end_ms, "format": "epoch_millis"}}}
+                ]
+            }
+        },
+        "aggs": {
+            "bandwidth_over_time": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": "1s", "min_doc_count": 1},
+                "aggs": zeek_rollup.BANDWIDTH_SUMS
+            }
+        }
+    }
+    if watermark is None:
+        response, seconds = await client.search(index=ZEEK_INDEX_ALIAS, body=query), {}
+    else:
+        response, seconds = await asyncio.gather(
+            client.search(index=ZEEK_INDEX_ALIAS, body=query),
+            zeek_rollup.rollup_bandwidth_seconds(client, start_ms, watermark),
+        )
+    for b in response.get('aggregations', {}).get('bandwidth_over_time', {}).get('buckets', []):
+        seconds[b['key']] = zeek_rollup.bandwidth_values(b)
+    return [
+        {"time": second // 1000, "in": seconds.get(second, (0, 0))[0], "out": seconds.get(second, (0, 0))[1]}
+        for second in range(start_ms, zeek_rollup.floor_to(end_ms, 1000) + 1000, 1000)
+    ]
+
+
 def get_packetstreamer_details_for_ip(db: Session, ip_address: str, limit: int = 200):
     """
     Queries PostgreSQL for Packet-Streamer logs related to a specific IP address.
     """
     try:
-        # Assumes your SQLAlchemy model for the 'network_packets' table is named 'NetworkPacket' in app/models.py
-        results = db.query(models.NetworkPacket).filter(
-            or_(
-                models.NetworkPacket.source_ip == ip_address,
-                models.NetworkPacket.destination_ip == ip_address
-            )
-        ).order_by(models.NetworkPacket.timestamp.desc()).limit(limit).all()
+        results = packet_queries.packets_for_ip(db, ip_address, limit)
 
         # Convert SQLAlchemy objects to a list of dictionaries to be JSON serializable
         packet_logs = []
@@ -2,16 +2,20 @@
 import logging
 import json
 import time
-import os
-import asyncio
 import psutil  # Used to get the server's own IP addresses
 import socket  # Used for the address family constant
 
-from datetime import datetime
+from sqlalchemy import insert
+from sqlalchemy.exc import DBAPIError, OperationalError, InterfaceError
 from sqlalchemy.orm import Session
 from app.database import SessionLocal
 from app import models
+from app.config import settings
+from app.state import app_state
 from app.routers.connection_manager import manager
+from app.services.ws_subscriptions import message_meta
+from app.services.log_tailer import LogTailer
+from app.services.eve_decoder import JSON_BACKEND, filter_alert_candidates, parse_alert_line
 
 logger = logging.getLogger(__name__)
 SURICATA_LOG_FILE = "/var/log/suricata/eve.json"
@@ -44,103 +48,149 @@ SERVER_IPS = get_server_ips()
 # --------------------------------------------------------------------------------
 
 
-def process_log_entry(line: str):
-    """Parse a single JSON log line and save it to the DB, ignoring self-generated alerts."""
-    try:
-        log = json.loads(line)
-
-        # We are only interested in 'alert' events.
-        if log.get('event_type') != 'alert':
-            return
-
-        # --- NEW: FILTERING LOGIC ---
-        # Get the source IP from the alert
-        source_ip = log.get('src_ip')
-
-        # If the alert was generated by one of the server's own IPs, ignore it.
-        #if source_ip in SERVER_IPS:
-            # We use a DEBUG log level here so we can see what's being ignored if we need to,
-            # without cluttering the main log.
-            #logger.debug(f"Ignoring self-generated alert from {source_ip}: {log.get('alert', {}).get('signature')}")
-            #return # Exit the function immediately
-        # --- END OF FILTERING LOGIC ---
-
-
-        alert_data = log.get('alert', {})
-        timestamp_obj = datetime.fromisoformat(log.get('timestamp').replace("Z", "+00:00"))
-
-        new_alert = models.SecurityAlert(
-            timestamp=timestamp_obj,
-            source_ip=source_ip, # We already have it from above
-            source_port=log.get('src_port'),
-            destination_ip=log.get('dest_ip'),
-            destination_port=log.get('dest_port'),
-            protocol=log.get('proto'),
-            severity=alert_data.get('severity', 3),
-            signature=alert_data.get('signature'),
-            event_type=log.get('event_type'),
-            raw_log=line
-        )
+STATS_LOG_INTERVAL_SECONDS = 60
+
 
-        with SessionLocal() as db:
-            db.add(new_alert)
-            db.commit()
-            logger.info(f"✅ Real-Time Alert: '{new_alert.signature}' saved to database.")
-
-            alert_payload = {
-                "type": "new_alert",
-                "data": {
-                    "timestamp": new_alert.timestamp.isoformat(),
-                    "signature": new_alert.signature,
-                    "severity": new_alert.severity,
-                    "source_ip": new_alert.source_ip,
-                    "destination_ip": new_alert.destination_ip,
-                    "destination_port": new_alert.destination_port
-                }
+def publish_alerts(rows: list[dict]):
+    """
+    Hands the alerts to the WebSocket manager. publish() only appends to a
+    thread-safe buffer; the frames are built and sent on the main event loop.
+    """
+    for row in rows:
+        alert_payload = {
+            "type": "new_alert",
+            "data": {
+                "timestamp": row["timestamp"].isoformat(),
+                "signature": row["signature"],
+                "severity": row["severity"],
+                "source_ip": row["source_ip"],
+                "destination_ip": row["destination_ip"],
+                "destination_port": row["destination_port"]
             }
-            # This broadcast now only happens for external alerts
-            asyncio.run(manager.broadcast(json.dumps(alert_payload)))
+        }
+        manager.publish(
+            json.dumps(alert_payload), droppable=False,
+            meta=message_meta("new_alert", row["source_ip"], row["destination_ip"], row["source_port"],
+                              row["destination_port"], row["protocol"], row["severity"]),
+        )
 
-    except Exception as e:
-        logger.error(f"Failed to process/save alert: '{line[:100]}...'. Error: {e}", exc_info=True)
-        if 'db' in locals() and db.in_transaction():
-            db.rollback()
 
+def insert_alert_rows(db: Session, rows: list[dict]):
+    """
+    Multi-row INSERTs built with .values(); passing the rows as execute()
+    parameters instead would make pg8000 run one INSERT per alert.
+    """
+    chunk_rows = 65535 // len(rows[0])  # PostgreSQL's bind-parameter limit per statement
+    for start in range(0, len(rows), chunk_rows):
+        db.execute(insert(models.SecurityAlert).values(rows[start:start + chunk_rows]))
 
-def start_log_monitoring():
-    """Main entry point for the log parsing background thread."""
-    logger.info("Log monitoring service starting (Real-Time Dynamic Mode).")
-    # Log the IPs that will be ignored, so you can confirm it's working as expected.
-    logger.info(f"Self-filtering is active. Alerts originating from the following server IPs will be ignored: {list(SERVER_IPS)}")
-    
-    time.sleep(5) 
-    
-    try:
-        # Jump to the end of the file so we only process new alerts.
-        with open(SURICATA_LOG_FILE, 'r') as f:
-            f.seek(0, os.SEEK_END)
-            last_pos = f.tell()
-    except FileNotFoundError:
-        last_pos = 0
-        logger.warning(f"Log file not found at startup: {SURICATA_LOG_FILE}. Will keep trying.")
-
-    while True:
+
+def insert_rows_one_by_one(db: Session, rows: list[dict]) -> list[dict]:
+    """
+    Fallback after a batch INSERT failed on bad data: inserts every alert in its
+    own savepoint, so only the offending rows are skipped. Returns the rows written.
+    """
+    stats = app_state.alert_ingest_stats
+    written = []
+    for row in rows:
         try:
-            with open(SURICATA_LOG_FILE, 'r') as f:
-                current_size = os.fstat(f.fileno()).st_size
-                if current_size < last_pos:
-                    last_pos = 0 # Log file was rotated or truncated
-                
-                f.seek(last_pos)
-                for line in f:
-                    if line.strip():
-                        process_log_entry(line.strip())
-                last_pos = f.tell()
-        except FileNotFoundError:
-            last_pos = 0
-            time.sleep(2)
-            continue
+            with db.begin_nested():
+                db.execute(insert(models.SecurityAlert).values(row))
+            written.append(row)
+        except (OperationalError, InterfaceError):
+            raise
+        except DBAPIError as e:
+            logger.error(f"Dropping alert '{row.get('signature')}' from {row.get('source_ip')}: {e}")
+            stats["alerts_dropped"] += 1
+    return written
+
+
+def process_log_lines(db: Session, lines: list[bytes]) -> int:
+    """
+    Parses a batch of raw eve.json lines, inserts all alerts among them with one
+    multi-row INSERT and broadcasts them. Returns the number of alerts written.
+    If the INSERT fails on a bad row (e.g. an over-long signature) the batch is
+    retried row by row and only the bad rows are dropped. Connection errors
+    propagate so the caller can retry the batch.
+    """
+    stats = app_state.alert_ingest_stats
+    rows = []
+    # Byte-level pre-filter: non-alert events are never JSON-decoded.
+    candidates = filter_alert_candidates(lines)
+    stats["alert_candidates"] += len(candidates)
+    for line in candidates:
+        try:
+            row = parse_alert_line(line)
         except Exception as e:
-            logger.error(f"Error in main log monitoring loop: {e}. Retrying...", exc_info=True)
+            logger.error(f"Failed to parse alert: '{line[:100]!r}...'. Error: {e}")
+            stats["alerts_dropped"] += 1
+            continue
+        if row:
+            rows.append(row)
+    stats["lines_processed"] += len(lines)
+    if not rows:
+        return 0
 
-        time.sleep(1)
+    flush_started = time.perf_counter()
+    try:
+        insert_alert_rows(db, rows)
+        db.commit()
+    except (OperationalError, InterfaceError):
+        raise
+    except DBAPIError as e:
+        db.rollback()
+        logger.warning(f"Batch INSERT of {len(rows)} alerts failed, retrying them one by one: {e}")
+        rows = insert_rows_one_by_one(db, rows)
+        db.commit()
+        if not rows:
+            return 0
+    stats["batches_flushed"] += 1
+    stats["alerts_written"] += len(rows)
+    stats["last_batch_size"] = len(rows)
+    stats["last_flush_ms"] = round((time.perf_counter() - flush_started) * 1000, 2)
+    logger.info(f"✅ Real-Time Alerts: {len(rows)} saved to database.")
+    publish_alerts(rows)
+    return len(rows)
+
+
+def start_log_monitoring(stop_event=None):
+    """Main entry point for the log parsing background thread."""
+    logger.info("Log monitoring service starting (Real-Time Dynamic Mode).")
+    logger.info(f"eve.json lines are pre-filtered on raw bytes and decoded with '{JSON_BACKEND}'.")
+    logger.info(f"Self-filtering is disabled. Alerts originating from this server's IPs are stored like any other: {list(SERVER_IPS)}")
+
+    # Starts at the end of eve.json the first time; afterwards resumes from its checkpoint.
+    # Lines stay raw bytes so the pre-filter runs before any decoding.
+    tailer = LogTailer(SURICATA_LOG_FILE, "suricata-eve", max_lines=settings.ALERT_BATCH_MAX_ROWS, decode=False)
+    stats = app_state.alert_ingest_stats
+    db = None
+    last_stats_log = time.monotonic()
+    for lines in tailer.batches(stop_event):
+        while True:
+            try:
+                if db is None:
+                    # One long-lived session for the whole tailer instead of one per alert.
+                    db = SessionLocal()
+                process_log_lines(db, lines)
+                break
+            except (OperationalError, InterfaceError) as e:
+                # The batch is retried on a fresh connection; the tailer waits for us.
+                logger.error(f"Lost PostgreSQL connection in log monitoring, will reconnect and retry: {e}")
+                if db: db.close()
+                db = None
+                time.sleep(5)
+            except Exception as e:
+                logger.error(f"Failed to save a batch of {len(lines)} eve.json lines: {e}", exc_info=True)
+                if db: db.rollback()
+                break
+        tailer.commit()
+        tailer_stats = tailer.stats()
+        stats["file_size"] = tailer_stats["file_size"]
+        stats["processed_offset"] = tailer_stats["processed_offset"]
+        stats["lag_bytes"] = tailer_stats["lag_bytes"]
+
+        if time.monotonic() - last_stats_log >= STATS_LOG_INTERVAL_SECONDS:
+            last_stats_log = time.monotonic()
+            logger.info(f"Alert ingest stats: {stats}")
+    if db:
+        db.close()
@@ -0,0 +1,241 @@
+# backend/app/services/log_tailer.py
+#
+# Rotation-aware tailer for append-only log files (Suricata eve.json, Zeek
+# conn.log), shared by log_parser and zeek_parser.
+#
+# - Wakes up on inotify events through watchdog, falling back to polling when
+#   watchdog or inotify is unavailable, so new lines arrive within milliseconds.
+# - Keeps the file open and tracks (inode, offset). A new inode at the path
+#   (rename/create rotation, including rotate-then-grow) is picked up after the
+#   old file has been drained; a shrinking file (copytruncate) restarts at 0.
+# - Persists the last committed (inode, offset) to a small JSON checkpoint, so a
+#   restart resumes where processing stopped instead of skipping to EOF.
+import json
+import logging
+import os
+import threading
+import time
+
+from app.config import settings
+
+try:
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # Polling still works without watchdog.
+    FileSystemEventHandler = object
+    Observer = None
+
+logger = logging.getLogger(__name__)
+
+READ_BLOCK_BYTES = 1024 * 1024
+CHECKPOINT_INTERVAL_SECONDS = 1.0
+
+
+class _WakeupHandler(FileSystemEventHandler):
+    """Sets the tailer's wakeup event for any change to the watched file's path."""
+    def __init__(self, path: str, wakeup: threading.Event):
+        self.path = path
+        self.wakeup = wakeup
+
+    def on_any_event(self, event):
+        if event.src_path == self.path or getattr(event, "dest_path", None) == self.path:
+            self.wakeup.set()
+
+
+class LogTailer:
+    """
+    Yields batches of complete lines appended to 'path'. After a batch has been
+    processed, call commit() so the checkpoint can move past it; uncommitted
+    lines are read again after a restart (at-least-once delivery).
+
+        tailer = LogTailer(SURICATA_LOG_FILE, "suricata-eve")
+        for lines in tailer.batches():
+            handle(lines)
+            tailer.commit()
+    """
+    def __init__(self, path: str, name: str, max_lines: int = 500, start_at_end: bool = True,
+                 poll_interval: float = 1.0, checkpoint_dir: str | None = settings.LOG_TAILER_CHECKPOINT_DIR,
+                 decode: bool = True):
+        self.path = path
+        self.name = name
+        self.max_lines = max_lines
+        self.start_at_end = start_at_end
+        # decode=False yields raw bytes lines, for consumers that filter before decoding.
+        self.decode = decode
+        self.poll_interval = poll_interval
+        self.checkpoint_path = os.path.join(checkpoint_dir, f"{name}.json") if checkpoint_dir else None
+        self._file = None
+        self.inode: int | None = None
+        self.offset = 0            # position right after the last yielded batch
+        self.committed_offset = 0  # position right after the last processed batch
+        self._last_checkpoint = 0.0
+        self._wakeup = threading.Event()
+        self._observer = None
+        self.mode = "polling"
+        self.rotations = 0
+        self.truncations = 0
+
+    # --- Public API -------------------------------------------------------------
+    def batches(self, stop_event: threading.Event | None = None):
+        """Blocking generator of line batches; returns when stop_event is set."""
+        self._start_watching()
+        try:
+            while not (stop_event and stop_event.is_set()):
+                if self._file is None and not self._open():
+                    self._wait()
+                    continue
+                for lines, end_offset in self._read_batches():
+                    self.offset = end_offset
+                    yield lines
+                if not self._handle_rotation():
+                    self._wait()
+        finally:
+            self.close()
+
+    def commit(self):
+        """Marks everything yielded so far as processed and checkpoints it (throttled)."""
+        self.committed_offset = self.offset
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL_SECONDS:
+            self._save_checkpoint()
+
+    def close(self):
+        if self._observer:
+            self._observer.stop()
+            self._observer = None
+        if self._file:
+            self._save_checkpoint()
+            self._file.close()
+            self._file = None
+
+    def stats(self) -> dict:
+        try:
+            file_size = os.stat(self.path).st_size if self._file is None else os.fstat(self._file.fileno()).st_size
+        except OSError:
+            file_size = 0
+        return {
+            "path": self.path, "mode": self.mode, "inode": self.inode,
+            "file_size": file_size, "processed_offset": self.committed_offset,
+            "lag_bytes": max(file_size - self.committed_offset, 0),
+            "rotations": self.rotations, "truncations": self.truncations,
+        }
+
+    # --- Internals --------------------------------------------------------------
+    def _start_watching(self):
+        if Observer is None or self._observer is not None:
+            return
+        try:
+            observer = Observer()
+            observer.schedule(_WakeupHandler(self.path, self._wakeup), os.path.dirname(self.path) or ".", recursive=False)
+            observer.daemon = True
+            observer.start()
+            self._observer = observer
+            self.mode = "inotify"
+        except Exception as e:
+            # Typically the directory doesn't exist yet or the inotify watch limit is reached.
+            logger.warning(f"Tailer '{self.name}' cannot watch {self.path} ({e}); polling every {self.poll_interval}s.")
+
+    def _wait(self):
+        self._wakeup.wait(self.poll_interval)
+        self._wakeup.clear()
+        if self._observer is None:
+            self._start_watching()
+
+    def _open(self, from_start: bool = False) -> bool:
+        """Opens the file at 'path' and positions it. Returns False if it doesn't exist yet."""
+        try:
+            f = open(self.path, "rb")
+        except FileNotFoundError:
+            return False
+        stat = os.fstat(f.fileno())
+        offset = 0 if from_start else self._initial_offset(stat)
+        f.seek(offset)
+        self._file, self.inode = f, stat.st_ino
+        self.offset = self.committed_offset = offset
+        self._save_checkpoint()
+        logger.info(f"Tailer '{self.name}' following {self.path} (inode {stat.st_ino}) from offset {offset} [{self.mode}].")
+        return True
+
+    def _initial_offset(self, stat: os.stat_result) -> int:
+        checkpoint = self._load_checkpoint()
+        if checkpoint and checkpoint.get("inode") == stat.st_ino and checkpoint.get("offset", 0) <= stat.st_size:
+            return checkpoint["offset"]
+        if checkpoint:
+            # The file was rotated while we were down: the current one is entirely new to us.
+            logger.warning(f"Tailer '{self.name}': checkpoint is for another file (rotated); reading {self.path} from the start.")
+            return 0
+        return stat.st_size if self.start_at_end else 0
+
+    def _handle_rotation(self) -> bool:
+        """Called at EOF. Switches to a new file or rewinds a truncated one; returns True if it did."""
+        try:
+            path_stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False  # Rotated away and not recreated yet: keep draining the old file.
+        if path_stat.st_ino != self.inode:
+            self.rotations += 1
+            self._file.close()
+            self._file = None
+            return self._open(from_start=True)
+        if path_stat.st_size < self.offset:
+            self.truncations += 1
+            self._file.seek(0)
+            self.offset = self.committed_offset = 0
+            self._save_checkpoint()
+            return True
+        return False
+
+    def _read_batches(self):
+        """Yields (lines, end_offset) for the complete lines between the current offset and EOF."""
+        offset = self.offset
+        while True:
+            self._file.seek(offset)
+            block = self._file.read(READ_BLOCK_BYTES)
+            cut = block.rfind(b"\n")
+            if cut == -1:
+                # Nothing new, or a line still being written.
+                if len(block) < READ_BLOCK_BYTES:
+                    return
+                cut = len(block) - 1
+            batch, position = [], offset
+            for raw_line in block[:cut + 1].splitlines(keepends=True):
+                position += len(raw_line)
+                line = raw_line.strip()
+                if self.decode:
+                    line = line.decode("utf-8", errors="replace")
+                if line:
+                    batch.append(line)
+                if len(batch) >= self.max_lines:
+                    yield batch, position
+                    batch = []
+            offset += cut + 1
+            if batch:
+                yield batch, offset
+            else:
+                self.offset = offset
+
+    def _load_checkpoint(self) -> dict | None:
+        if not self.checkpoint_path:
+            return None
+        try:
+            with open(self.checkpoint_path) as f:
+                checkpoint = json.load(f)
+            return checkpoint if checkpoint.get("path") == self.path else None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable tailer checkpoint {self.checkpoint_path}: {e}")
+            return None
+
+    def _save_checkpoint(self):
+        self._last_checkpoint = time.monotonic()
+        if not self.checkpoint_path or self.inode is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.checkpoint_path), exist_ok=True)
+            temp_path = f"{self.checkpoint_path}.tmp"
+            with open(temp_path, "w") as f:
+                json.dump({"path": self.path, "inode": self.inode, "offset": self.committed_offset}, f)
+            os.replace(temp_path, self.checkpoint_path)
+        except OSError as e:
+            logger.warning(f"Could not write tailer checkpoint {self.checkpoint_path}: {e}; continuing without one.")
+            self.checkpoint_path = None
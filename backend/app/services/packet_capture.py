@@ -1,27 +1,34 @@
 # backend/app/services/packet_capture.py
 import logging
 import multiprocessing
-import queue
 import json
-import asyncio
+import io
 import os
 import time
-from datetime import datetime, timezone
+from operator import itemgetter
+from datetime import datetime
 
 # --- START OF FINAL FIX: Import 'text' from SQLAlchemy ---
-from sqlalchemy import text
+from sqlalchemy import text, insert
 from sqlalchemy.exc import OperationalError, InterfaceError
 from app.database import SessionLocal
 from app.models import NetworkPacket
 # --- END OF FINAL FIX ---
 
 from app.routers.connection_manager import manager
+from app.services.ek_decoder import decode_ek_line
+from app.services.packet_ring import PacketRing
+from app.services.ws_subscriptions import message_meta
+from app.services.traffic_aggregator import traffic_aggregator
+from app.services import packet_stats
 from app.state import app_state
+from app.config import settings
 
 logger = logging.getLogger(__name__)
 
-# No changes to the sniffer process
-def json_sniffer_process(packet_queue: multiprocessing.Queue, pipe_path: str, stop_event: multiprocessing.Event):
+# Single-process decoder, used when PACKET_DECODER_WORKERS <= 1.
+# See app.services.ek_decoder for the parallel decoder pool.
+def json_sniffer_process(packet_ring: PacketRing, pipe_path: str, stop_event: multiprocessing.Event):
     logging.basicConfig(level=logging.INFO, format='%(asctime)s - [json_sniffer_process] - %(levelname)s - %(message)s')
     proc_logger = logging.getLogger(__name__)
     proc_logger.info(f"JSON sniffer process started. Monitoring pipe: '{pipe_path}'.")
@@ -31,34 +38,115 @@ def json_sniffer_process(packet_queue: multiprocessing.Queue, pipe_path: str, st
             with open(pipe_path, 'r') as f:
                 for line in f:
                     if stop_event.is_set(): break
-                    try:
-                        ek_doc = json.loads(line)
-                        layers = ek_doc.get("layers")
-                        if not layers: continue
-                        timestamp_str = ek_doc.get("timestamp")
-                        packet_data = {
-                            "@timestamp": datetime.fromtimestamp(float(timestamp_str)/1000, tz=timezone.utc).isoformat(),
-                            "source_ip": layers.get("ip", {}).get("ip_ip_src"), "destination_ip": layers.get("ip", {}).get("ip_ip_dst"),
-                            "length": int(layers.get("frame", {}).get("frame_frame_len", 0)), "ttl": int(layers.get("ip", {}).get("ip_ip_ttl", 0)),
-                            "protocol": "UNKNOWN", "source_mac": layers.get("eth", {}).get("eth_eth_src"), "destination_mac": layers.get("eth", {}).get("eth_eth_dst"),
-                            "source_port": None, "destination_port": None, "flags": None
-                        }
-                        if "tcp" in layers:
-                            packet_data["protocol"] = "TCP"; packet_data["source_port"] = int(layers["tcp"].get("tcp_tcp_srcport", 0)); packet_data["destination_port"] = int(layers["tcp"].get("tcp_tcp_dstport", 0))
-                        elif "udp" in layers:
-                            packet_data["protocol"] = "UDP"; packet_data["source_port"] = int(layers["udp"].get("udp_udp_srcport", 0)); packet_data["destination_port"] = int(layers["udp"].get("udp_udp_dstport", 0))
-                        elif "icmp" in layers: packet_data["protocol"] = "ICMP"
-                        if packet_data["source_ip"] and packet_data["destination_ip"]: packet_queue.put(packet_data)
-                    except (json.JSONDecodeError, KeyError, AttributeError): continue
+                    packet_data = decode_ek_line(line)
+                    if packet_data: packet_ring.put(packet_data)
             proc_logger.warning("Stream ended. Will attempt to reopen in 2 seconds."); time.sleep(2)
         except Exception as e:
             proc_logger.error(f"An unexpected error occurred in the JSON sniffer loop: {e}", exc_info=True); proc_logger.info("Restarting sniffer loop after a 5 second delay..."); time.sleep(5)
     proc_logger.info("Sniffer process received stop signal and is shutting down.")
 
 
-def data_handler_thread(packet_queue: multiprocessing.Queue, stop_event: multiprocessing.Event):
-    logger.info("PostgreSQL Writer & Broadcaster thread started.")
+# Column order used for both the COPY payload and the multi-row INSERT fallback.
+PACKET_COLUMNS = (
+    "timestamp", "source_ip", "destination_ip", "source_mac", "destination_mac",
+    "protocol", "length", "source_port", "destination_port", "ttl", "flags",
+)
+STATS_LOG_INTERVAL_SECONDS = 60
+RING_POLL_INTERVAL_SECONDS = 0.005
+
+
+def _packet_to_row(packet_data: dict) -> tuple:
+    """Converts a sniffer packet dict into a tuple ordered like PACKET_COLUMNS."""
+    return (
+        datetime.fromisoformat(packet_data["@timestamp"]),
+        packet_data.get("source_ip"), packet_data.get("destination_ip"),
+        packet_data.get("source_mac"), packet_data.get("destination_mac"),
+        packet_data.get("protocol"), packet_data.get("length"),
+        packet_data.get("source_port"), packet_data.get("destination_port"),
+        packet_data.get("ttl"), packet_data.get("flags"),
+    )
+
+
+def _copy_escape(value) -> str:
+    """Formats a single value for PostgreSQL's COPY text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+def copy_packet_rows(db_session, rows: list[tuple]):
+    """
+    Bulk-loads rows into network_packets with a single COPY ... FROM STDIN and
+    adds them to packet_stats_minute in the same transaction.
+    """
+    buffer = io.StringIO()
+    for row in rows:
+        buffer.write("\t".join(_copy_escape(value) for value in row))
+        buffer.write("\n")
+    buffer.seek(0)
+    # COPY is not exposed by the ORM, so we go through the raw pg8000 cursor
+    # of the session's connection. The session still owns the transaction.
+    cursor = db_session.connection().connection.cursor()
+    cursor.execute(f"COPY network_packets ({', '.join(PACKET_COLUMNS)}) FROM STDIN", stream=buffer)
+    packet_stats.add_packet_rows(db_session, rows)
+    db_session.commit()
+
+
+# PostgreSQL allows at most 65535 bind parameters per statement (11 per packet row).
+INSERT_CHUNK_ROWS = 65535 // len(PACKET_COLUMNS)
+
+
+def insert_packet_rows(db_session, rows: list[tuple]):
+    """
+    Fallback writer: multi-row INSERTs built with .values(). Passing the rows as
+    execute() parameters instead would make pg8000 run one INSERT per packet.
+    """
+    for start in range(0, len(rows), INSERT_CHUNK_ROWS):
+        chunk = rows[start:start + INSERT_CHUNK_ROWS]
+        db_session.execute(insert(NetworkPacket).values([dict(zip(PACKET_COLUMNS, row)) for row in chunk]))
+    packet_stats.add_packet_rows(db_session, rows)
+    db_session.commit()
+
+
+def drain_packet_batch(packet_rings: list[PacketRing], max_rows: int, max_latency_seconds: float) -> list[dict]:
+    """
+    Waits up to 1 second for the first packets, then keeps draining the rings
+    until either max_rows packets are collected or max_latency_seconds have passed
+    since the first ones arrived. Returns an empty list if nothing arrived at all.
+    The rings are lock-free, so an empty ring is polled rather than waited on.
+    """
+    batch = []
+    idle_deadline = time.monotonic() + 1.0
+    deadline = None
+    while len(batch) < max_rows:
+        for packet_ring in packet_rings:
+            batch.extend(packet_ring.get_batch(max_rows - len(batch)))
+        now = time.monotonic()
+        if batch and deadline is None:
+            deadline = now + max_latency_seconds
+        if len(batch) >= max_rows or (deadline and now >= deadline) or (not batch and now >= idle_deadline):
+            break
+        time.sleep(RING_POLL_INTERVAL_SECONDS)
+    return batch
+
+
+def data_handler_thread(packet_rings: list[PacketRing], stop_event: multiprocessing.Event):
+    """
+    Drains the decoder rings (one per decoder process) in size/time-bounded batches, broadcasts each packet
+    to the WebSocket clients and bulk-loads the batch into PostgreSQL.
+    Writer counters are published on app_state.packet_writer_stats.
+    """
+    max_rows = settings.PACKET_BATCH_MAX_ROWS
+    restore_order = settings.PACKET_DECODER_WORKERS > 1
+    max_latency_seconds = settings.PACKET_BATCH_MAX_LATENCY_MS / 1000
+    logger.info(f"PostgreSQL Writer & Broadcaster thread started (batch: {max_rows} rows / {settings.PACKET_BATCH_MAX_LATENCY_MS} ms).")
+    stats = app_state.packet_writer_stats
     db_session = None
+    use_copy = True
+    pending_rows: list[tuple] = []
+    last_stats_log = time.monotonic()
     while not stop_event.is_set():
         try:
             if db_session is None:
@@ -75,31 +163,71 @@ def data_handler_thread(packet_queue: multiprocessing.Queue, stop_event: multipr
                     db_session = None
                     time.sleep(5)
                     continue
-            packet_data = packet_queue.get(timeout=1.0)
-            broadcast_message = {"type": "packet_data", "data": packet_data}
-            json_string_message = json.dumps(broadcast_message, default=str)
-            main_loop = app_state.main_event_loop
-            if main_loop and main_loop.is_running():
-                asyncio.run_coroutine_threadsafe(manager.broadcast(json_string_message), main_loop)
-            try:
-                db_packet_data = packet_data.copy()
-                iso_timestamp = db_packet_data.pop("@timestamp")
-                db_packet_data["timestamp"] = datetime.fromisoformat(iso_timestamp)
-                new_packet = NetworkPacket(**db_packet_data)
-                db_session.add(new_packet)
-                db_session.commit()
-            except (OperationalError, InterfaceError) as e:
-                logger.error(f"Lost PostgreSQL connection, will attempt to reconnect: {e}")
-                db_session.close()
-                db_session = None
-            except Exception as e:
-                logger.error(f"Failed to write packet to PostgreSQL: {e}")
-                db_session.rollback()
-        except queue.Empty:
-            continue
+
+            # A batch that failed because the connection dropped is retried
+            # before we take anything new off the queue.
+            if not pending_rows:
+                batch = drain_packet_batch(packet_rings, max_rows, max_latency_seconds)
+                if restore_order:
+                    # Each decoder worker has its own ring and workers finish chunks out of
+                    # order; every ring is in stream order, so a stable sort restores it.
+                    batch.sort(key=itemgetter("@timestamp"))
+                for packet_data in batch:
+                    # publish() only buffers; the ConnectionManager coalesces and sends on the main loop.
+                    manager.publish(
+                        json.dumps({"type": "packet_data", "data": packet_data}, default=str),
+                        meta=message_meta("packet_data", packet_data.get("source_ip"), packet_data.get("destination_ip"),
+                                          packet_data.get("source_port"), packet_data.get("destination_port"), packet_data.get("protocol")),
+                    )
+                    try:
+                        pending_rows.append(_packet_to_row(packet_data))
+                    except (KeyError, ValueError, TypeError):
+                        stats["rows_dropped"] += 1
+                # Feeds the in-memory per-second counters behind /v1/cockpit/bandwidth.
+                traffic_aggregator.add_packet_rows(pending_rows)
+
+            if pending_rows:
+                flush_started = time.perf_counter()
+                try:
+                    if use_copy:
+                        try:
+                            copy_packet_rows(db_session, pending_rows)
+                        except (OperationalError, InterfaceError):
+                            raise
+                        except Exception as e:
+                            logger.warning(f"COPY into network_packets failed ({e}); falling back to multi-row INSERT.")
+                            db_session.rollback()
+                            use_copy = False
+                            insert_packet_rows(db_session, pending_rows)
+                    else:
+                        insert_packet_rows(db_session, pending_rows)
+                    flush_ms = (time.perf_counter() - flush_started) * 1000
+                    stats["batches_flushed"] += 1
+                    stats["rows_written"] += len(pending_rows)
+                    stats["last_batch_size"] = len(pending_rows)
+                    stats["max_batch_size"] = max(stats["max_batch_size"], len(pending_rows))
+                    stats["last_flush_ms"] = round(flush_ms, 2)
+                    stats["max_flush_ms"] = round(max(stats["max_flush_ms"], flush_ms), 2)
+                    pending_rows = []
+                except (OperationalError, InterfaceError) as e:
+                    logger.error(f"Lost PostgreSQL connection, will attempt to reconnect and retry {len(pending_rows)} rows: {e}")
+                    db_session.close()
+                    db_session = None
+                except Exception as e:
+                    logger.error(f"Failed to write a batch of {len(pending_rows)} packets to PostgreSQL: {e}")
+                    db_session.rollback()
+                    stats["rows_dropped"] += len(pending_rows)
+                    pending_rows = []
         except Exception as e:
             logger.error(f"An unexpected outer loop error occurred in data handler: {e}", exc_info=True)
             time.sleep(5)
+
+        stats["backlog"] = sum(packet_ring.pending() for packet_ring in packet_rings)
+        stats["ring_dropped"] = sum(packet_ring.dropped for packet_ring in packet_rings)
+        stats["ring_rejected"] = sum(packet_ring.rejected for packet_ring in packet_rings)
+        if time.monotonic() - last_stats_log >= STATS_LOG_INTERVAL_SECONDS:
+            last_stats_log = time.monotonic()
+            logger.info(f"Packet writer stats: {stats}")
     if db_session:
         db_session.close()
-    logger.info("PostgreSQL data handler thread shutting down.")
\ No newline at end of file
+    logger.info("PostgreSQL data handler thread shutting down.")
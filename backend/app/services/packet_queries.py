@@ -0,0 +1,122 @@
+# backend/app/services/packet_queries.py
+#
+# Read queries on network_packets that are shared by several routers and
+# services, written so PostgreSQL can answer them from the table's indexes
+# (see models.NetworkPacket).
+import base64
+from datetime import datetime, timezone
+
+from sqlalchemy import or_, select, tuple_, union
+from sqlalchemy.orm import Session, aliased
+
+from app import models
+
+# Columns returned by the packet list and export endpoints, in export order.
+PACKET_FIELDS = (
+    "id", "timestamp", "source_ip", "destination_ip", "source_mac", "destination_mac",
+    "protocol", "length", "source_port", "destination_port", "ttl", "flags",
+)
+
+
+def to_db_time(value: datetime) -> datetime:
+    """Packet timestamps are stored as naive UTC; naive inputs are taken to be UTC already."""
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def packets_for_ip(db: Session, ip_address: str, limit: int, since: datetime | None = None) -> list[models.NetworkPacket]:
+    """
+    Latest packets sent or received by ip_address, newest first.
+
+    'source_ip = x OR destination_ip = x' can't use either (ip, timestamp) index
+    and ends up scanning every partition. A UNION of one ordered, limited scan
+    per direction reads at most 2 * limit index entries; UNION (not UNION ALL)
+    removes the packets an address sent to itself.
+    """
+    packet = models.NetworkPacket
+    directions = []
+    for ip_column in (packet.source_ip, packet.destination_ip):
+        direction = select(packet).where(ip_column == ip_address)
+        if since is not None:
+            direction = direction.where(packet.timestamp >= since)
+        directions.append(direction.order_by(packet.timestamp.desc()).limit(limit))
+    matches = aliased(packet, union(*directions).subquery())
+    return db.query(matches).order_by(matches.timestamp.desc()).limit(limit).all()
+
+
+# --- Keyset pagination and export ---------------------------------------------
+def encode_cursor(timestamp: datetime, packet_id: int) -> str:
+    """Opaque cursor pointing just past the given (timestamp, id) in newest-first order."""
+    return base64.urlsafe_b64encode(f"{timestamp.isoformat()}|{packet_id}".encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    """Raises ValueError on a malformed cursor."""
+    try:
+        timestamp, packet_id = base64.urlsafe_b64decode(cursor.encode()).decode().split("|")
+        return datetime.fromisoformat(timestamp), int(packet_id)
+    except (UnicodeDecodeError, ValueError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from e
+
+
+def _packet_filters(start: datetime | None, end: datetime | None, port: int | None, protocol: str | None) -> list:
+    packet = models.NetworkPacket
+    filters = []
+    if start is not None:
+        filters.append(packet.timestamp >= start)
+    if end is not None:
+        filters.append(packet.timestamp < end)
+    if port is not None:
+        filters.append(or_(packet.source_port == port, packet.destination_port == port))
+    if protocol:
+        filters.append(packet.protocol == protocol.upper())
+    return filters
+
+
+def _packet_columns():
+    return [getattr(models.NetworkPacket, field) for field in PACKET_FIELDS]
+
+
+def packet_page(db: Session, limit: int, cursor: tuple[datetime, int] | None = None,
+                start: datetime | None = None, end: datetime | None = None, ip: str | None = None,
+                port: int | None = None, protocol: str | None = None) -> list:
+    """
+    One page of packets, newest first, as rows of PACKET_FIELDS. 'cursor' is the
+    (timestamp, id) of the last row of the previous page: the row comparison
+    continues the (timestamp, id) index scan there instead of skipping OFFSET rows.
+    With 'ip', each direction is scanned separately, as in packets_for_ip().
+    """
+    packet = models.NetworkPacket
+    filters = _packet_filters(start, end, port, protocol)
+    if cursor is not None:
+        filters.append(tuple_(packet.timestamp, packet.id) < tuple_(*cursor))
+    ip_columns = (packet.source_ip, packet.destination_ip) if ip else (None,)
+    directions = []
+    for ip_column in ip_columns:
+        direction = select(*_packet_columns()).where(*filters)
+        if ip_column is not None:
+            direction = direction.where(ip_column == ip)
+        directions.append(direction.order_by(packet.timestamp.desc(), packet.id.desc()).limit(limit))
+    if len(directions) == 1:
+        return db.execute(directions[0]).all()
+    matches = union(*directions).subquery()
+    return db.execute(
+        select(matches).order_by(matches.c.timestamp.desc(), matches.c.id.desc()).limit(limit)
+    ).all()
+
+
+def iter_packet_batches(db: Session, batch_size: int, start: datetime | None = None, end: datetime | None = None,
+                        ip: str | None = None, port: int | None = None, protocol: str | None = None):
+    """
+    Yields lists of rows (PACKET_FIELDS) in timestamp order through a server-side
+    cursor, so at most batch_size rows are held in memory at a time.
+    """
+    packet = models.NetworkPacket
+    filters = _packet_filters(start, end, port, protocol)
+    if ip:
+        filters.append(or_(packet.source_ip == ip, packet.destination_ip == ip))
+    statement = select(*_packet_columns()).where(*filters).order_by(packet.timestamp, packet.id)
+    result = db.execute(statement.execution_options(stream_results=True, yield_per=batch_size))
+    for batch in result.partitions():
+        yield batch
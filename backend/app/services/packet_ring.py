@@ -0,0 +1,171 @@
+# backend/app/services/packet_ring.py
+#
+# Fixed-record, shared-memory ring buffer carrying decoded packets from a decoder
+# process to the packet writer thread without pickling.
+#
+# Each ring has exactly ONE producer and ONE consumer, so no lock is needed:
+#   - the producer only ever writes the record slots and the 'head' counter,
+#   - the consumer only ever writes the 'tail' counter.
+# Counters are monotonically increasing 64-bit integers in separate cache lines;
+# a slot is published by writing the record first and bumping 'head' afterwards.
+# When the decoder pool runs N workers, every worker gets its own ring.
+import os
+import socket
+import struct
+from datetime import datetime, timezone
+from multiprocessing import shared_memory
+
+# <timestamp(s) src_ip dst_ip src_port dst_port length ttl proto flags src_mac dst_mac pad>
+# IPv4 addresses are stored as their 4-byte network-order integer (inet_aton).
+RECORD = struct.Struct("<d4s4sHHIBBB6s6sx")
+COUNTER = struct.Struct("<Q")
+HEAD_OFFSET, TAIL_OFFSET, DROPPED_OFFSET, REJECTED_OFFSET = 0, 64, 128, 136
+HEADER_BYTES = 192
+
+PROTOCOL_CODES = {"UNKNOWN": 0, "TCP": 1, "UDP": 2, "ICMP": 3}
+PROTOCOL_NAMES = {code: name for name, code in PROTOCOL_CODES.items()}
+
+# Bits of the 'flags' byte telling which optional fields are present.
+HAS_PORTS, HAS_SOURCE_MAC, HAS_DESTINATION_MAC = 1, 2, 4
+NO_MAC = bytes(6)
+
+
+def ensure_shm_fits(ring_count: int, capacity: int, shm_path: str = "/dev/shm"):
+    """
+    Raises ValueError when 'ring_count' rings of 'capacity' records don't fit in
+    the free space of /dev/shm. The blocks are sparse, so an oversized ring would
+    only fail later, with SIGBUS in whichever process first touches the missing page.
+    """
+    needed = ring_count * (HEADER_BYTES + capacity * RECORD.size)
+    try:
+        stats = os.statvfs(shm_path)
+    except OSError:
+        return
+    free = stats.f_bavail * stats.f_frsize
+    if needed > free:
+        raise ValueError(
+            f"{ring_count} packet ring(s) of {capacity} records need {needed // 2**20} MiB of {shm_path}, "
+            f"only {free // 2**20} MiB free; raise the container's shm_size or lower "
+            f"PACKET_DECODER_WORKERS / PACKET_RING_CAPACITY."
+        )
+
+
+def _mac_to_bytes(mac: str | None) -> bytes | None:
+    try:
+        return bytes.fromhex(mac.replace(":", "")) if mac else None
+    except ValueError:
+        return None
+
+
+def _bytes_to_mac(raw: bytes) -> str:
+    return raw.hex(":")
+
+
+class PacketRing:
+    """
+    Single-producer/single-consumer ring of fixed-size packet records in a
+    multiprocessing.shared_memory block. Create it in the parent with
+    PacketRing(capacity) and pass it to the child process; it pickles by name.
+    """
+
+    def __init__(self, capacity: int = 0, name: str | None = None):
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=HEADER_BYTES + capacity * RECORD.size)
+            self.shm.buf[:HEADER_BYTES] = bytes(HEADER_BYTES)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.capacity = (self.shm.size - HEADER_BYTES) // RECORD.size
+        self.buf = self.shm.buf
+
+    def __reduce__(self):
+        return (self.__class__, (0, self.shm.name))
+
+    def _counter(self, offset: int) -> int:
+        return COUNTER.unpack_from(self.buf, offset)[0]
+
+    def _set_counter(self, offset: int, value: int):
+        COUNTER.pack_into(self.buf, offset, value)
+
+    @property
+    def dropped(self) -> int:
+        """Packets the producer discarded because the ring was full."""
+        return self._counter(DROPPED_OFFSET)
+
+    @property
+    def rejected(self) -> int:
+        """Packets the producer couldn't encode: IPv6 (records hold IPv4 only) or malformed fields."""
+        return self._counter(REJECTED_OFFSET)
+
+    def pending(self) -> int:
+        """Records written but not yet consumed (the backlog)."""
+        return self._counter(HEAD_OFFSET) - self._counter(TAIL_OFFSET)
+
+    # --- Producer side ---
+    def put(self, packet_data: dict) -> bool:
+        """Encodes a decoder packet dict into the next slot. Returns False when it was dropped or rejected."""
+        head = self._counter(HEAD_OFFSET)
+        if head - self._counter(TAIL_OFFSET) >= self.capacity:
+            self._set_counter(DROPPED_OFFSET, self.dropped + 1)
+            return False
+        try:
+            record = self._encode(packet_data)
+        except (OSError, ValueError, TypeError, struct.error):
+            # Not an IPv4 packet or a malformed field
+            self._set_counter(REJECTED_OFFSET, self.rejected + 1)
+            return False
+        RECORD.pack_into(self.buf, HEADER_BYTES + (head % self.capacity) * RECORD.size, *record)
+        self._set_counter(HEAD_OFFSET, head + 1)
+        return True
+
+    @staticmethod
+    def _encode(packet_data: dict) -> tuple:
+        flags = 0
+        source_port, destination_port = packet_data.get("source_port"), packet_data.get("destination_port")
+        if source_port is not None and destination_port is not None:
+            flags |= HAS_PORTS
+        source_mac = _mac_to_bytes(packet_data.get("source_mac"))
+        destination_mac = _mac_to_bytes(packet_data.get("destination_mac"))
+        if source_mac: flags |= HAS_SOURCE_MAC
+        if destination_mac: flags |= HAS_DESTINATION_MAC
+        return (
+            datetime.fromisoformat(packet_data["@timestamp"]).timestamp(),
+            socket.inet_aton(packet_data["source_ip"]), socket.inet_aton(packet_data["destination_ip"]),
+            source_port or 0, destination_port or 0,
+            packet_data.get("length") or 0, min(packet_data.get("ttl") or 0, 255),
+            PROTOCOL_CODES.get(packet_data.get("protocol"), 0), flags,
+            source_mac or NO_MAC, destination_mac or NO_MAC,
+        )
+
+    # --- Consumer side ---
+    def get_batch(self, max_records: int) -> list[dict]:
+        """Decodes and consumes up to max_records records, oldest first."""
+        tail = self._counter(TAIL_OFFSET)
+        count = min(self._counter(HEAD_OFFSET) - tail, max_records)
+        batch = []
+        for index in range(tail, tail + count):
+            (ts, source_ip, destination_ip, source_port, destination_port, length, ttl,
+             proto_code, flags, source_mac, destination_mac) = RECORD.unpack_from(
+                self.buf, HEADER_BYTES + (index % self.capacity) * RECORD.size)
+            has_ports = flags & HAS_PORTS
+            batch.append({
+                "@timestamp": datetime.fromtimestamp(ts, tz=timezone.utc).isoformat(),
+                "source_ip": socket.inet_ntoa(source_ip), "destination_ip": socket.inet_ntoa(destination_ip),
+                "length": length, "ttl": ttl, "protocol": PROTOCOL_NAMES.get(proto_code, "UNKNOWN"),
+                "source_mac": _bytes_to_mac(source_mac) if flags & HAS_SOURCE_MAC else None,
+                "destination_mac": _bytes_to_mac(destination_mac) if flags & HAS_DESTINATION_MAC else None,
+                "source_port": source_port if has_ports else None,
+                "destination_port": destination_port if has_ports else None,
+                "flags": None,
+            })
+        if count:
+            self._set_counter(TAIL_OFFSET, tail + count)
+        return batch
+
+    def close(self):
+        """Detaches from the block; the creating process also unlinks it."""
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
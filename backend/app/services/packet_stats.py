@@ -0,0 +1,75 @@
+# backend/app/services/packet_stats.py
+#
+# Per-minute, per-protocol packet and byte counts in packet_stats_minute. The
+# packet writer (packet_capture.data_handler_thread) adds each batch's totals in
+# the same transaction as the batch itself, so the summary always matches
+# network_packets, and the protocol distribution reads O(minutes in range) rows
+# instead of aggregating the whole packet table.
+from datetime import datetime
+
+from sqlalchemy import func, text
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app import models
+
+
+def minute_totals(rows: list[tuple]) -> dict[tuple, list[int]]:
+    """{(minute, protocol): [packets, bytes]} for rows ordered like packet_capture.PACKET_COLUMNS."""
+    totals = {}
+    for timestamp, _, _, _, _, protocol, length, *_ in rows:
+        # COPY ignores the UTC offset when storing into 'timestamp without time zone'.
+        key = (timestamp.replace(tzinfo=None, second=0, microsecond=0), protocol)
+        counters = totals.setdefault(key, [0, 0])
+        counters[0] += 1
+        counters[1] += length or 0
+    return totals
+
+
+def add_packet_rows(db_session: Session, rows: list[tuple]):
+    """Adds a batch's totals to packet_stats_minute; the caller commits."""
+    totals = minute_totals(rows)
+    if not totals:
+        return
+    stats = models.PacketStatsMinute
+    statement = pg_insert(stats).values([
+        {"minute": minute, "protocol": protocol, "packets": packets, "bytes": byte_count}
+        for (minute, protocol), (packets, byte_count) in totals.items()
+    ])
+    statement = statement.on_conflict_do_update(
+        index_elements=[stats.minute, stats.protocol],
+        set_={"packets": stats.packets + statement.excluded.packets, "bytes": stats.bytes + statement.excluded.bytes},
+    )
+    db_session.execute(statement)
+
+
+def backfill_packet_stats(conn):
+    """
+    Fills an empty summary from the packets already stored (first start after an
+    upgrade). When the summary has rows, the one-time NOT EXISTS check skips the scan.
+    """
+    conn.execute(text(
+        "INSERT INTO packet_stats_minute (minute, protocol, packets, bytes) "
+        "SELECT date_trunc('minute', timestamp), protocol, count(*), coalesce(sum(length), 0) FROM network_packets "
+        "WHERE NOT EXISTS (SELECT 1 FROM packet_stats_minute) GROUP BY 1, 2 ON CONFLICT DO NOTHING"
+    ))
+
+
+def protocol_distribution(db: Session, start: datetime, end: datetime) -> list[dict]:
+    """Bytes per protocol for minutes in [start, end), largest first."""
+    stats = models.PacketStatsMinute
+    total_bytes = func.sum(stats.bytes)
+    rows = (
+        db.query(stats.protocol, total_bytes)
+        .filter(stats.minute >= start, stats.minute < end)
+        .group_by(stats.protocol)
+        .order_by(total_bytes.desc())
+        .all()
+    )
+    return [{"protocol": protocol, "count": int(count)} for protocol, count in rows]
+
+
+def delete_old_packet_stats(db: Session, before: datetime) -> int:
+    deleted = db.query(models.PacketStatsMinute).filter(models.PacketStatsMinute.minute < before).delete(synchronize_session=False)
+    db.commit()
+    return deleted
@@ -3,29 +3,14 @@
 from sqlalchemy.orm import Session
 from sqlalchemy import func
 from app import models, schemas
-from geoip2.database import Reader
-from geoip2.errors import AddressNotFoundError
-import os
-
-# Assume you will place the GeoLite2 database in your project's database folder
-GEOIP_DB_PATH = os.path.join(os.path.dirname(__file__), '..', 'data', 'GeoLite2-Country.mmdb')
-
-# It's efficient to load the reader once at startup.
-try:
-    geoip_reader = Reader(GEOIP_DB_PATH)
-except FileNotFoundError:
-    geoip_reader = None
+from app.services.geoip_service import geoip, is_local
 
 def get_country_from_ip(ip: str):
-    if not geoip_reader or not ip or ip == '127.0.0.1': # Avoid looking up localhost
-        return "Unknown"
-    try:
-        response = geoip_reader.country(ip)
-        return response.country.iso_code
-    except AddressNotFoundError:
-        return "Local" # IPs like 192.168.x.x won't be found, so we label them 'Local'
-    except Exception:
+    if not geoip.available or not ip:
         return "Unknown"
+    if is_local(ip):
+        return "Local" # IPs like 192.168.x.x aren't in the GeoIP database, so we label them 'Local'
+    return geoip.country(ip) or "Unknown"
 
 def get_threat_intel_summary(db: Session):
     """Calculates and returns a summary of threat intelligence data."""
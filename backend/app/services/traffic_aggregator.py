@@ -0,0 +1,140 @@
+# backend/app/services/traffic_aggregator.py
+#
+# In-process, per-second traffic aggregator fed by the packet pipeline
+# (packet_capture.data_handler_thread). It keeps a fixed-size time wheel: one
+# slot per second holding ingress/egress bytes, bytes per protocol and bytes per
+# host. Reading a window walks at most 'window' slots, so /v1/cockpit/bandwidth
+# is answered from memory instead of a date_histogram over Elasticsearch.
+#
+# Direction: a packet sent by a host in LOCAL_NETWORKS is egress ("out"),
+# anything else is ingress ("in"). The Elasticsearch fallback of the bandwidth
+# widget counts Zeek bytes the same way (zeek_rollup.BANDWIDTH_SUMS).
+import ipaddress
+import threading
+import time
+from collections import Counter
+
+from app.config import settings
+
+# Per-second host counters are capped; hosts beyond the cap are added to OTHER_HOSTS.
+MAX_HOSTS_PER_SLOT = 1000
+OTHER_HOSTS = "other"
+
+
+class _Slot:
+    __slots__ = ("second", "in_bytes", "out_bytes", "protocols", "hosts")
+
+    def __init__(self):
+        self.reset(-1)
+
+    def reset(self, second: int):
+        self.second = second
+        self.in_bytes = 0
+        self.out_bytes = 0
+        self.protocols = Counter()
+        self.hosts = Counter()
+
+
+class TrafficAggregator:
+    """
+    Time wheel of 'wheel_seconds' one-second slots. add_packet_rows() is called
+    by the packet writer thread; the read methods are safe to call from any thread.
+    """
+    def __init__(self, wheel_seconds: int, local_networks: list[str]):
+        self.wheel_seconds = wheel_seconds
+        self._slots = [_Slot() for _ in range(wheel_seconds)]
+        self._lock = threading.Lock()
+        self._local_networks = [ipaddress.ip_network(cidr.strip(), strict=False) for cidr in local_networks if cidr.strip()]
+        self._local_cache: dict[str, bool] = {}
+        # When the first packets arrived; windows starting earlier are incomplete.
+        # None until then, so an idle or stopped sniffer never looks like zero traffic.
+        self.started_at: float | None = None
+        self.packets_seen = 0
+        self.packets_too_old = 0
+
+    def _is_local(self, ip: str | None) -> bool:
+        is_local = self._local_cache.get(ip)
+        if is_local is None:
+            try:
+                address = ipaddress.ip_address(ip)
+                is_local = any(address in network for network in self._local_networks)
+            except ValueError:
+                is_local = False
+            if len(self._local_cache) > 100_000:
+                self._local_cache.clear()
+            self._local_cache[ip] = is_local
+        return is_local
+
+    def add_packet_rows(self, rows: list[tuple]):
+        """Adds a batch of packet rows ordered like packet_capture.PACKET_COLUMNS."""
+        now = time.time()
+        oldest_allowed = int(now) - self.wheel_seconds + 1
+        with self._lock:
+            if self.started_at is None and rows:
+                self.started_at = now
+            for timestamp, source_ip, destination_ip, _, _, protocol, length, *_ in rows:
+                second = int(timestamp.timestamp())
+                if second < oldest_allowed:
+                    self.packets_too_old += 1
+                    continue
+                slot = self._slots[second % self.wheel_seconds]
+                if slot.second != second:
+                    if slot.second > second:
+                        self.packets_too_old += 1
+                        continue
+                    slot.reset(second)
+                length = length or 0
+                if self._is_local(source_ip):
+                    slot.out_bytes += length
+                else:
+                    slot.in_bytes += length
+                slot.protocols[protocol] += length
+                for host in (source_ip, destination_ip):
+                    if host in slot.hosts or len(slot.hosts) < MAX_HOSTS_PER_SLOT:
+                        slot.hosts[host] += length
+                    else:
+                        slot.hosts[OTHER_HOSTS] += length
+            self.packets_seen += len(rows)
+
+    def covers(self, window_seconds: int) -> bool:
+        """False until packets arrive and while the window reaches back before the first of them."""
+        started_at = self.started_at
+        return (window_seconds <= self.wheel_seconds and started_at is not None
+                and started_at <= time.time() - window_seconds)
+
+    def _window_slots(self, window_seconds: int):
+        end = int(time.time())
+        for second in range(end - window_seconds + 1, end + 1):
+            slot = self._slots[second % self.wheel_seconds]
+            yield second, (slot if slot.second == second else None)
+
+    def bandwidth(self, window_seconds: int) -> list[dict]:
+        """Per-second {"time", "in", "out"} points for the last window_seconds, zero-filled."""
+        with self._lock:
+            return [{"time": second, "in": slot.in_bytes if slot else 0, "out": slot.out_bytes if slot else 0}
+                    for second, slot in self._window_slots(window_seconds)]
+
+    def protocol_bytes(self, window_seconds: int) -> dict[str, int]:
+        totals = Counter()
+        with self._lock:
+            for _, slot in self._window_slots(window_seconds):
+                if slot:
+                    totals.update(slot.protocols)
+        return dict(totals)
+
+    def top_hosts(self, window_seconds: int, k: int = 10) -> list[dict]:
+        totals = Counter()
+        with self._lock:
+            for _, slot in self._window_slots(window_seconds):
+                if slot:
+                    totals.update(slot.hosts)
+        totals.pop(OTHER_HOSTS, None)
+        return [{"ip": host, "bytes": total} for host, total in totals.most_common(k)]
+
+    def stats(self) -> dict:
+        return {"wheel_seconds": self.wheel_seconds, "started_at": self.started_at,
+                "packets_seen": self.packets_seen, "packets_too_old": self.packets_too_old}
+
+
+# A single, shared instance fed by the packet writer thread.
+traffic_aggregator = TrafficAggregator(settings.TRAFFIC_WHEEL_SECONDS, settings.LOCAL_NETWORKS.split(","))
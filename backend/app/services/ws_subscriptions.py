@@ -0,0 +1,155 @@
+# backend/app/services/ws_subscriptions.py
+#
+# Server-side topic subscriptions and filters for the /api/ws/ws WebSocket.
+#
+# A client narrows what it receives by sending:
+#   {"type": "subscribe", "topics": ["packets", "alerts"],
+#    "filters": {"ips": ["10.0.0.0/8", "192.168.1.20"], "ports": [443],
+#                "protocols": ["TCP"], "severities": [1, 2]},
+#    "max_rate": 50}
+# Every key is optional; an omitted filter matches everything. 'max_rate' caps
+# packet messages per second; matching alerts are always delivered. Filters are
+# compiled once into sets and integer network masks, so matching a message costs
+# the same no matter how many clients are connected, and clients sharing the same
+# subscription share one evaluation (see ConnectionManager.build_frames).
+import ipaddress
+
+# Topic name in the subscription -> "type" of the messages it covers
+TOPICS = {"packets": "packet_data", "alerts": "new_alert"}
+MAX_FILTER_ENTRIES = 256
+
+
+class SubscriptionError(ValueError):
+    """Raised for a malformed subscribe message; the text is sent back to the client."""
+
+
+def _ip_key(ip: str | None):
+    """Converts an address to the (version, int) form used by message metadata."""
+    if not ip:
+        return None
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    return (address.version, int(address))
+
+
+def message_meta(topic: str, source_ip=None, destination_ip=None, source_port=None,
+                 destination_port=None, protocol=None, severity=None) -> tuple:
+    """
+    Builds the compact metadata tuple published alongside a message. It is
+    computed once by the producer and reused by every subscription.
+    """
+    return (topic, _ip_key(source_ip), _ip_key(destination_ip), source_port, destination_port,
+            protocol.upper() if protocol else None, severity)
+
+
+def _as_list(value, name: str) -> list:
+    if value is None:
+        return []
+    if not isinstance(value, list):
+        raise SubscriptionError(f"'{name}' must be a list.")
+    if len(value) > MAX_FILTER_ENTRIES:
+        raise SubscriptionError(f"'{name}' accepts at most {MAX_FILTER_ENTRIES} entries.")
+    return value
+
+
+class Subscription:
+    """A compiled, immutable subscription. Instances with equal 'key' behave identically."""
+
+    def __init__(self, topics=None, ips=None, ports=None, protocols=None, severities=None, max_rate=None):
+        topics = _as_list(topics, "topics") or list(TOPICS)
+        unknown = [t for t in topics if t not in TOPICS]
+        if unknown:
+            raise SubscriptionError(f"Unknown topic(s): {unknown}. Valid topics: {list(TOPICS)}.")
+        self.topics = frozenset(TOPICS[t] for t in topics)
+
+        exact_ips, networks, ip_entries = set(), set(), set()
+        for entry in _as_list(ips, "ips"):
+            try:
+                network = ipaddress.ip_network(str(entry), strict=False)
+            except ValueError:
+                raise SubscriptionError(f"Invalid IP address or CIDR: {entry!r}.")
+            ip_entries.add(str(network.network_address) if network.num_addresses == 1 else str(network))
+            if network.num_addresses == 1:
+                exact_ips.add((network.version, int(network.network_address)))
+            else:
+                networks.add((network.version, int(network.network_address), int(network.netmask)))
+        self.exact_ips = frozenset(exact_ips)
+        self.networks = tuple(sorted(networks))
+        self.ip_entries = sorted(ip_entries)
+
+        try:
+            self.ports = frozenset(int(p) for p in _as_list(ports, "ports"))
+            self.severities = frozenset(int(s) for s in _as_list(severities, "severities"))
+        except (TypeError, ValueError):
+            raise SubscriptionError("'ports' and 'severities' must contain integers.")
+        self.protocols = frozenset(str(p).upper() for p in _as_list(protocols, "protocols"))
+
+        if max_rate is not None:
+            try:
+                max_rate = float(max_rate)
+            except (TypeError, ValueError):
+                raise SubscriptionError("'max_rate' must be a number of messages per second.")
+            if max_rate <= 0:
+                raise SubscriptionError("'max_rate' must be positive.")
+        self.max_rate = max_rate
+
+        self.key = (self.topics, self.exact_ips, self.networks, self.ports, self.protocols, self.severities, self.max_rate)
+        self._has_ip_filter = bool(self.exact_ips or self.networks)
+
+    @classmethod
+    def from_message(cls, payload: dict) -> "Subscription":
+        if not isinstance(payload, dict):
+            raise SubscriptionError("Subscription must be a JSON object.")
+        filters = payload.get("filters") or {}
+        if not isinstance(filters, dict):
+            raise SubscriptionError("'filters' must be an object.")
+        return cls(
+            topics=payload.get("topics"), ips=filters.get("ips"), ports=filters.get("ports"),
+            protocols=filters.get("protocols"), severities=filters.get("severities"),
+            max_rate=payload.get("max_rate"),
+        )
+
+    def _ip_matches(self, ip_key) -> bool:
+        if ip_key is None:
+            return False
+        if ip_key in self.exact_ips:
+            return True
+        version, value = ip_key
+        return any(version == net_version and value & mask == network for net_version, network, mask in self.networks)
+
+    def matches(self, meta: tuple | None) -> bool:
+        """Messages published without metadata are delivered to everyone."""
+        if meta is None:
+            return True
+        topic, source_ip, destination_ip, source_port, destination_port, protocol, severity = meta
+        if topic not in self.topics:
+            return False
+        if self._has_ip_filter and not (self._ip_matches(source_ip) or self._ip_matches(destination_ip)):
+            return False
+        if self.ports and source_port not in self.ports and destination_port not in self.ports:
+            return False
+        if self.protocols and protocol not in self.protocols:
+            return False
+        if self.severities and topic == TOPICS["alerts"] and severity not in self.severities:
+            return False
+        return True
+
+    def describe(self) -> dict:
+        """The normalized subscription, echoed back to the client on success."""
+        topic_names = {message_type: name for name, message_type in TOPICS.items()}
+        return {
+            "topics": sorted(topic_names[t] for t in self.topics),
+            "filters": {
+                "ips": self.ip_entries,
+                "ports": sorted(self.ports),
+                "protocols": sorted(self.protocols),
+                "severities": sorted(self.severities),
+            },
+            "max_rate": self.max_rate,
+        }
+
+
+# Clients that never send a subscribe message receive everything, as before.
+DEFAULT_SUBSCRIPTION = Subscription()
@@ -0,0 +1,170 @@
+# backend/app/services/zeek_conn_store.py
+#
+# Column-oriented, array-backed ring buffer of recent Zeek connections.
+#
+# Replaces the deque of full decoded conn.log dicts in AppState. Every row takes
+# ~60 bytes (timestamp, both IPs packed into 128 bits, ports, protocol and
+# conn_state codes, byte counters), so millions of connections fit in memory and
+# the live cockpit can answer last-N-minutes questions (top talkers, bytes per
+# second, state counts) with numpy instead of querying Elasticsearch.
+import socket
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+# Codes 1..n; 0 means missing or unknown.
+PROTOCOLS = ("tcp", "udp", "icmp")
+CONN_STATES = ("S0", "S1", "SF", "REJ", "S2", "S3", "RSTO", "RSTR", "RSTOS0", "RSTRH", "SH", "SHR", "OTH")
+_PROTOCOL_CODES = {name: code for code, name in enumerate(PROTOCOLS, start=1)}
+_STATE_CODES = {name: code for code, name in enumerate(CONN_STATES, start=1)}
+_IPV4_MAPPED_PREFIX = 0xFFFF << 32
+
+COLUMNS = {
+    "ts": np.float64,
+    "orig_ip_hi": np.uint64, "orig_ip_lo": np.uint64,
+    "resp_ip_hi": np.uint64, "resp_ip_lo": np.uint64,
+    "orig_port": np.uint16, "resp_port": np.uint16,
+    "proto": np.uint8, "conn_state": np.uint8,
+    "orig_bytes": np.uint64, "resp_bytes": np.uint64,
+}
+
+
+def pack_ip(ip: str | None) -> tuple[int, int]:
+    """Packs an address into (high, low) 64-bit halves; IPv4 is stored IPv4-mapped."""
+    if not ip:
+        return 0, 0
+    try:
+        return 0, _IPV4_MAPPED_PREFIX | int.from_bytes(socket.inet_pton(socket.AF_INET, ip), "big")
+    except OSError:
+        pass
+    try:
+        value = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), "big")
+    except OSError:
+        return 0, 0
+    return value >> 64, value & 0xFFFFFFFFFFFFFFFF
+
+
+def unpack_ip(hi: int, lo: int) -> str | None:
+    hi, lo = int(hi), int(lo)
+    if hi == 0 and lo >> 32 == 0xFFFF:
+        return socket.inet_ntop(socket.AF_INET, (lo & 0xFFFFFFFF).to_bytes(4, "big"))
+    if hi == 0 and lo == 0:
+        return None
+    return socket.inet_ntop(socket.AF_INET6, ((hi << 64) | lo).to_bytes(16, "big"))
+
+
+def _zeek_ts(value) -> float:
+    """Zeek writes 'ts' as epoch seconds, or as ISO 8601 with JSON ISO timestamps enabled."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value).replace("Z", "+00:00")).timestamp()
+
+
+def _zeek_row(log: dict) -> tuple:
+    # local.zeek sets Log::default_scope_sep = "_": 'id.orig_h' is logged as 'id_orig_h'.
+    orig_hi, orig_lo = pack_ip(log.get("id_orig_h"))
+    resp_hi, resp_lo = pack_ip(log.get("id_resp_h"))
+    return (
+        _zeek_ts(log.get("ts", time.time())),
+        orig_hi, orig_lo, resp_hi, resp_lo,
+        int(log.get("id_orig_p") or 0), int(log.get("id_resp_p") or 0),
+        _PROTOCOL_CODES.get(log.get("proto"), 0), _STATE_CODES.get(log.get("conn_state"), 0),
+        int(log.get("orig_ip_bytes") or 0), int(log.get("resp_ip_bytes") or 0),
+    )
+
+
+class ZeekConnStore:
+    """
+    Fixed-capacity ring of Zeek connections. Appends overwrite the oldest rows.
+    Thread-safe: the Zeek tailer thread appends while API threads query.
+    """
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 1)
+        self._columns = {name: np.zeros(self.capacity, dtype=dtype) for name, dtype in COLUMNS.items()}
+        self._lock = threading.Lock()
+        self._next = 0
+        self.size = 0
+        self.rows_appended = 0
+        self.rows_rejected = 0
+        # Data is complete for windows starting at or after this time: the store's
+        # creation until it first wraps, then the newest timestamp evicted so far.
+        self.complete_since = time.time()
+
+    # --- Writes -----------------------------------------------------------------
+    def append_batch(self, logs: list[dict]) -> int:
+        """Appends decoded conn.log entries. Malformed entries are counted and skipped."""
+        rows = []
+        for log in logs:
+            try:
+                rows.append(_zeek_row(log))
+            except (TypeError, ValueError):
+                self.rows_rejected += 1
+        if not rows:
+            return 0
+        rows = rows[-self.capacity:]
+        values = list(zip(*rows))
+        with self._lock:
+            slots = (self._next + np.arange(len(rows))) % self.capacity
+            if self.size + len(rows) > self.capacity:
+                # Free slots are filled first; the remaining ones hold the oldest rows.
+                evicted = slots[self.capacity - self.size:]
+                self.complete_since = max(self.complete_since, float(self._columns["ts"][evicted].max()))
+            for (name, dtype), column_values in zip(COLUMNS.items(), values):
+                self._columns[name][slots] = np.asarray(column_values, dtype=dtype)
+            self._next = int((self._next + len(rows)) % self.capacity)
+            self.size = min(self.size + len(rows), self.capacity)
+            self.rows_appended += len(rows)
+        return len(rows)
+
+    # --- Queries ----------------------------------------------------------------
+    def covers(self, seconds: float) -> bool:
+        """True if every connection of the last 'seconds' is still in the store."""
+        return self.complete_since <= time.time() - seconds
+
+    def _select(self, since: float, names: tuple) -> dict[str, np.ndarray]:
+        """Copies the requested columns for rows with ts >= since (one vectorized pass)."""
+        with self._lock:
+            mask = self._columns["ts"][:self.size] >= since
+            return {name: self._columns[name][:self.size][mask] for name in names}
+
+    def top_talkers(self, seconds: int = 300, limit: int = 10) -> list[dict]:
+        """Originating hosts ranked by total bytes (both directions) over the window."""
+        rows = self._select(time.time() - seconds, ("orig_ip_hi", "orig_ip_lo", "orig_bytes", "resp_bytes"))
+        if not len(rows["orig_ip_lo"]):
+            return []
+        keys = np.empty(len(rows["orig_ip_lo"]), dtype=[("hi", np.uint64), ("lo", np.uint64)])
+        keys["hi"], keys["lo"] = rows["orig_ip_hi"], rows["orig_ip_lo"]
+        hosts, inverse = np.unique(keys, return_inverse=True)
+        total_bytes = np.bincount(inverse, weights=rows["orig_bytes"].astype(np.float64) + rows["resp_bytes"])
+        connections = np.bincount(inverse)
+        top = np.argsort(total_bytes)[::-1][:limit]
+        return [{"ip": unpack_ip(hosts[i]["hi"], hosts[i]["lo"]), "bytes": int(total_bytes[i]),
+                 "connections": int(connections[i])} for i in top]
+
+    def bytes_per_second(self, seconds: int = 60) -> list[dict]:
+        """Ingress (responder) and egress (originator) bytes per second, zero-filled, oldest first."""
+        end = int(time.time())
+        start = end - seconds + 1
+        rows = self._select(start, ("ts", "orig_bytes", "resp_bytes"))
+        offsets = (rows["ts"] - start).astype(np.int64)
+        keep = offsets < seconds
+        ingress = np.bincount(offsets[keep], weights=rows["resp_bytes"][keep], minlength=seconds)
+        egress = np.bincount(offsets[keep], weights=rows["orig_bytes"][keep], minlength=seconds)
+        return [{"time": start + i, "in": int(ingress[i]), "out": int(egress[i])} for i in range(seconds)]
+
+    def state_counts(self, seconds: int = 3600) -> list[dict]:
+        """Connections per conn_state over the window, most frequent first."""
+        rows = self._select(time.time() - seconds, ("conn_state",))
+        counts = np.bincount(rows["conn_state"], minlength=len(CONN_STATES) + 1)
+        names = ("UNKNOWN",) + CONN_STATES
+        return [{"name": names[code], "value": int(counts[code])} for code in np.argsort(counts)[::-1] if counts[code]]
+
+    def stats(self) -> dict:
+        return {
+            "capacity": self.capacity, "size": self.size,
+            "rows_appended": self.rows_appended, "rows_rejected": self.rows_rejected,
+            "memory_bytes": sum(column.nbytes for column in self._columns.values()),
+            "complete_since": self.complete_since,
+        }
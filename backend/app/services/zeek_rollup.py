@@ -0,0 +1,409 @@
+# backend/app/services/zeek_rollup.py
+#
+# Pre-aggregated rollups of Zeek conn logs for the traffic timeline, the
+# connection-state widgets and the live bandwidth chart.
+#
+# A background job (ZeekRollupJob) writes summary documents into ROLLUP_INDEX:
+#   resolution "1m"/"1h", kind "protocol_bytes" (key = proto, value = bytes),
+#   kind "conn_state" (key = state, value = connections) and kind "bandwidth"
+#   (ingress/egress bytes; per-minute docs also keep a per-second breakdown).
+#   Direction follows the in-memory traffic aggregator: bytes sent by a host in
+#   LOCAL_NETWORKS are egress, all other bytes ingress.
+# Document ids are deterministic, so recomputing a minute simply overwrites it.
+#
+# Zeek writes a conn.log entry when the connection ends, stamped with its start
+# time, so entries keep landing in minutes behind the watermark. Every pass
+# recomputes the last ZEEK_ROLLUP_LATE_MINUTES, or more when a recent entry
+# lasted longer than that (see ZeekRollupJob._late_window_ms). The bound is
+# ZEEK_ROLLUP_MAX_CONN_AGE_MINUTES: connections lasting longer than that are
+# missing from the rollups and only counted by raw queries.
+#
+# Readers query the rollups for [start, watermark) and the raw Zeek indices only
+# for the live tail [watermark, now], then merge the buckets. When the rollups
+# don't cover the requested range (job disabled, still backfilling) they fall
+# back to raw data for the whole range.
+import asyncio
+import logging
+import time
+from elasticsearch import AsyncElasticsearch
+from elasticsearch.helpers import async_bulk
+
+from app.config import settings
+from app.dependencies import async_es_client
+from app.services.es_index_cache import index_cache
+
+logger = logging.getLogger(__name__)
+
+# Deliberately outside the 'netguard-zeek-*' pattern so raw queries never see rollup docs.
+ROLLUP_INDEX = "netguard-rollup-zeek-conn"
+ZEEK_INDEX_PATTERN = "netguard-zeek-*"
+# Versioned: a change to what the rollups count starts them afresh (the backfill
+# then overwrites the old docs, whose ids are deterministic).
+STATE_DOC_ID = "rollup-state-v2"
+MINUTE_MS = 60 * 1000
+HOUR_MS = 60 * MINUTE_MS
+
+ROLLUP_MAPPINGS = {
+    "dynamic": "strict",
+    "properties": {
+        "@timestamp": {"type": "date"},
+        "resolution": {"type": "keyword"},
+        "kind": {"type": "keyword"},
+        "key": {"type": "keyword"},
+        "value": {"type": "long"},
+        "ingress_bytes": {"type": "long"},
+        "egress_bytes": {"type": "long"},
+        # {"<second offset>": [ingress, egress]}; only ever read back whole.
+        "per_second": {"type": "object", "enabled": False},
+        "covered_from": {"type": "date"},
+        "watermark": {"type": "date"},
+    },
+}
+
+# Filters that reproduce what each widget's raw query counts.
+PROTOCOL_FILTER = [{"exists": {"field": "proto"}}, {"exists": {"field": "total_bytes"}}]
+BANDWIDTH_FILTER = [{"term": {"log_source": "zeek"}}, {"exists": {"field": "uid"}}]
+LOCAL_NETWORK_CIDRS = [cidr.strip() for cidr in settings.LOCAL_NETWORKS.split(",") if cidr.strip()]
+# id_orig_h/id_resp_h are 'ip' fields, so a terms filter matches whole CIDRs.
+# Egress = bytes sent by local hosts (orig bytes of local originators plus resp
+# bytes of local responders); ingress is the rest. See bandwidth_values().
+BANDWIDTH_SUMS = {
+    "orig_bytes": {"sum": {"field": "orig_ip_bytes"}},
+    "resp_bytes": {"sum": {"field": "resp_ip_bytes"}},
+    "local_orig": {"filter": {"terms": {"id_orig_h": LOCAL_NETWORK_CIDRS}},
+                   "aggs": {"bytes": {"sum": {"field": "orig_ip_bytes"}}}},
+    "local_resp": {"filter": {"terms": {"id_resp_h": LOCAL_NETWORK_CIDRS}},
+                   "aggs": {"bytes": {"sum": {"field": "resp_ip_bytes"}}}},
+}
+
+
+def bandwidth_values(bucket: dict) -> tuple[int, int]:
+    """(ingress, egress) bytes of a bucket aggregated with BANDWIDTH_SUMS."""
+    egress = bucket["local_orig"]["bytes"]["value"] + bucket["local_resp"]["bytes"]["value"]
+    ingress = bucket["orig_bytes"]["value"] + bucket["resp_bytes"]["value"] - egress
+    return int(ingress), int(egress)
+
+
+def floor_to(ms: int, step_ms: int) -> int:
+    return ms - ms % step_ms
+
+
+def now_ms() -> int:
+    return int(time.time() * 1000)
+
+
+def _epoch_range(gte: int, lt: int | None = None) -> dict:
+    bounds = {"gte": gte, "format": "epoch_millis"}
+    if lt is not None:
+        bounds["lt"] = lt
+    return {"range": {"@timestamp": bounds}}
+
+
+class ZeekRollupJob:
+    """
+    Maintains the rollups. Minute docs cover [covered_from, watermark); an hour
+    doc is (re)built whenever all of its minutes are covered. New minutes are
+    rolled up first and the retention window is backfilled one hour per pass,
+    newest first, so recent views benefit immediately after a fresh start.
+    """
+    def __init__(self, client: AsyncElasticsearch):
+        self.client = client
+        self.covered_from: int | None = None
+        self.watermark: int | None = None
+        self._task: asyncio.Task | None = None
+        self._last_retention_run = 0.0
+        self.passes = 0
+        self.last_pass_ms = 0.0
+
+    def start(self):
+        """Starts the rollup loop on the running event loop (called from the app lifespan)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def coverage(self) -> tuple[int, int] | None:
+        """Returns (covered_from, watermark) in epoch ms, or None while nothing is rolled up."""
+        if self.covered_from is None or self.watermark is None or self.watermark <= self.covered_from:
+            return None
+        return self.covered_from, self.watermark
+
+    def stats(self) -> dict:
+        return {"covered_from": self.covered_from, "watermark": self.watermark,
+                "passes": self.passes, "last_pass_ms": round(self.last_pass_ms, 2)}
+
+    # --- Loop -----------------------------------------------------------------
+    async def _run(self):
+        while True:
+            try:
+                await self._initialize()
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Zeek rollup job could not initialize, retrying in 30 seconds: {e}")
+                await asyncio.sleep(30)
+        while True:
+            busy = False
+            try:
+                started = time.perf_counter()
+                busy = await self._roll_forward()
+                if not busy:
+                    busy = await self._backfill_step()
+                await self._apply_retention()
+                await self._save_state()
+                self.passes += 1
+                self.last_pass_ms = (time.perf_counter() - started) * 1000
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Zeek rollup pass failed: {e}", exc_info=True)
+            # Catch-up and backfill run back to back; steady state waits for the next minute.
+            await asyncio.sleep(1 if busy else settings.ZEEK_ROLLUP_INTERVAL_SECONDS)
+
+    async def _initialize(self):
+        if not await index_cache.index_exists(self.client, ROLLUP_INDEX):
+            await self.client.options(ignore_status=400).indices.create(
+                index=ROLLUP_INDEX, mappings=ROLLUP_MAPPINGS,
+                settings={"number_of_shards": 1, "number_of_replicas": 0})
+            index_cache.invalidate(ROLLUP_INDEX)
+        target = self._target_watermark()
+        state = await self.client.options(ignore_status=404).get(index=ROLLUP_INDEX, id=STATE_DOC_ID)
+        source = state.get("_source") if state.get("found") else None
+        if source and source["watermark"] > target - settings.ZEEK_ROLLUP_RETENTION_HOURS * HOUR_MS:
+            self.covered_from, self.watermark = source["covered_from"], source["watermark"]
+            logger.info(f"Zeek rollups resume at watermark {self.watermark}.")
+        else:
+            self.covered_from = self.watermark = target
+            logger.info("Zeek rollups start fresh; the retention window will be backfilled.")
+
+    async def _late_window_ms(self) -> int:
+        """
+        How far behind the watermark to recompute: the longest duration among the
+        connections started in the last ZEEK_ROLLUP_MAX_CONN_AGE_MINUTES (rounded up
+        to whole minutes), at least ZEEK_ROLLUP_LATE_MINUTES and at most the max age.
+        A connection that just ended is searchable by now and started at most its
+        duration ago, so its minute is always inside the window.
+        """
+        late_ms = settings.ZEEK_ROLLUP_LATE_MINUTES * MINUTE_MS
+        max_age_ms = settings.ZEEK_ROLLUP_MAX_CONN_AGE_MINUTES * MINUTE_MS
+        if max_age_ms <= late_ms:
+            return late_ms
+        response = await self.client.search(
+            index=ZEEK_INDEX_PATTERN, size=0, query=_epoch_range(self.watermark - max_age_ms),
+            aggs={"longest": {"max": {"field": "duration"}}})
+        longest_ms = int((response.get("aggregations", {}).get("longest", {}).get("value") or 0) * 1000)
+        return min(max(late_ms, floor_to(longest_ms + MINUTE_MS - 1, MINUTE_MS) + MINUTE_MS), max_age_ms)
+
+    def _target_watermark(self) -> int:
+        return floor_to(now_ms() - settings.ZEEK_ROLLUP_SETTLE_SECONDS * 1000, MINUTE_MS)
+
+    async def _roll_forward(self) -> bool:
+        """Rolls up newly settled minutes (plus the late window). Returns True while catching up."""
+        target = self._target_watermark()
+        if target <= self.watermark:
+            return False
+        start = max(self.watermark - await self._late_window_ms(), self.covered_from)
+        end = min(target, self.watermark + HOUR_MS)
+        await self._roll_range(start, end)
+        # Hour docs are built before the watermark moves, so readers never ask for one that isn't there yet.
+        await self._rebuild_hours(start, end, self.covered_from, end)
+        self.watermark = end
+        return end < target
+
+    async def _backfill_step(self) -> bool:
+        """Backfills one hour (or the partial hour before covered_from). Returns True if more remains."""
+        limit = floor_to(now_ms() - settings.ZEEK_ROLLUP_RETENTION_HOURS * HOUR_MS, MINUTE_MS)
+        if self.covered_from <= limit:
+            return False
+        end = self.covered_from
+        start = max(floor_to(end - 1, HOUR_MS), limit)
+        await self._roll_range(start, end)
+        await self._rebuild_hours(start, end, start, self.watermark)
+        self.covered_from = start
+        return start > limit
+
+    async def _apply_retention(self):
+        if time.monotonic() - self._last_retention_run < 3600:
+            return
+        self._last_retention_run = time.monotonic()
+        cutoff = floor_to(now_ms() - settings.ZEEK_ROLLUP_RETENTION_HOURS * HOUR_MS, HOUR_MS)
+        await self.client.delete_by_query(
+            index=ROLLUP_INDEX, conflicts="proceed", wait_for_completion=False,
+            query={"bool": {"filter": [{"exists": {"field": "resolution"}}, {"range": {"@timestamp": {"lt": cutoff}}}]}})
+        self.covered_from = max(self.covered_from, cutoff)
+
+    async def _save_state(self):
+        await self.client.index(index=ROLLUP_INDEX, id=STATE_DOC_ID,
+                                document={"kind": "state", "covered_from": self.covered_from, "watermark": self.watermark})
+
+    # --- Rollup computation -----------------------------------------------------
+    async def _roll_range(self, start: int, end: int):
+        """Recomputes the minute docs for [start, end), at most one hour at a time."""
+        if end <= start:
+            return
+        query = {
+            "size": 0,
+            "query": _epoch_range(start, end),
+            "aggs": {"per_minute": {
+                "date_histogram": {"field": "@timestamp", "fixed_interval": "1m", "min_doc_count": 1},
+                "aggs": {
+                    "protocols": {"filter": {"bool": {"filter": PROTOCOL_FILTER}}, "aggs": {
+                        "by_protocol": {"terms": {"field": "proto", "size": 50},
+                                        "aggs": {"total_bytes": {"sum": {"field": "total_bytes"}}}}}},
+                    "by_state": {"terms": {"field": "conn_state", "size": 50}},
+                    "bandwidth": {"filter": {"bool": {"filter": BANDWIDTH_FILTER}}, "aggs": {
+                        **BANDWIDTH_SUMS,
+                        "per_second": {"date_histogram": {"field": "@timestamp", "fixed_interval": "1s", "min_doc_count": 1},
+                                       "aggs": BANDWIDTH_SUMS}}},
+                },
+            }},
+        }
+        response = await self.client.search(index=ZEEK_INDEX_PATTERN, body=query)
+        actions = []
+        for minute in response.get("aggregations", {}).get("per_minute", {}).get("buckets", []):
+            ts = minute["key"]
+            for bucket in minute["protocols"]["by_protocol"]["buckets"]:
+                actions.append(self._doc("1m", ts, "protocol_bytes", bucket["key"], value=bucket["total_bytes"]["value"]))
+            for bucket in minute["by_state"]["buckets"]:
+                actions.append(self._doc("1m", ts, "conn_state", bucket["key"], value=bucket["doc_count"]))
+            bandwidth = minute["bandwidth"]
+            if bandwidth["doc_count"]:
+                per_second = {str((b["key"] - ts) // 1000): list(bandwidth_values(b))
+                              for b in bandwidth["per_second"]["buckets"]}
+                ingress, egress = bandwidth_values(bandwidth)
+                actions.append(self._doc("1m", ts, "bandwidth", "all", ingress_bytes=ingress,
+                                         egress_bytes=egress, per_second=per_second))
+        if actions:
+            # wait_for: readers switch to the new watermark right after this returns.
+            await async_bulk(self.client, actions, refresh="wait_for")
+
+    async def _rebuild_hours(self, start: int, end: int, covered_from: int, watermark: int):
+        """Rebuilds the hour docs overlapping [start, end) whose minutes all lie in [covered_from, watermark)."""
+        hour = max(floor_to(start, HOUR_MS), covered_from)
+        if hour % HOUR_MS:
+            hour = floor_to(hour, HOUR_MS) + HOUR_MS
+        while hour < end and hour + HOUR_MS <= watermark:
+            await self._build_hour(hour)
+            hour += HOUR_MS
+
+    async def _build_hour(self, hour: int):
+        query = {
+            "size": 0,
+            "query": {"bool": {"filter": [{"term": {"resolution": "1m"}}, _epoch_range(hour, hour + HOUR_MS)]}},
+            "aggs": {"by_kind": {"terms": {"field": "kind", "size": 10}, "aggs": {"by_key": {
+                "terms": {"field": "key", "size": 100},
+                "aggs": {"value": {"sum": {"field": "value"}}, "ingress_bytes": {"sum": {"field": "ingress_bytes"}},
+                         "egress_bytes": {"sum": {"field": "egress_bytes"}}}}}}},
+        }
+        response = await self.client.search(index=ROLLUP_INDEX, body=query)
+        actions = []
+        for kind in response.get("aggregations", {}).get("by_kind", {}).get("buckets", []):
+            for bucket in kind["by_key"]["buckets"]:
+                if kind["key"] == "bandwidth":
+                    actions.append(self._doc("1h", hour, "bandwidth", bucket["key"], ingress_bytes=bucket["ingress_bytes"]["value"],
+                                             egress_bytes=bucket["egress_bytes"]["value"]))
+                else:
+                    actions.append(self._doc("1h", hour, kind["key"], bucket["key"], value=bucket["value"]["value"]))
+        if actions:
+            await async_bulk(self.client, actions, refresh="wait_for")
+
+    @staticmethod
+    def _doc(resolution: str, ts: int, kind: str, key: str, **fields) -> dict:
+        source = {"@timestamp": ts, "resolution": resolution, "kind": kind, "key": key}
+        source.update({name: int(value) if isinstance(value, float) else value for name, value in fields.items()})
+        return {"_index": ROLLUP_INDEX, "_id": f"{resolution}:{kind}:{key}:{ts}", "_source": source}
+
+
+rollup_job = ZeekRollupJob(async_es_client)
+
+
+# --- Readers -------------------------------------------------------------------
+def split_range(start: int) -> int | None:
+    """
+    Returns the watermark up to which [start, ...) can be served from rollups,
+    or None if the raw indices must be queried for the whole range.
+    """
+    if not settings.ZEEK_ROLLUP_ENABLED:
+        return None
+    coverage = rollup_job.coverage()
+    if coverage is None or start < coverage[0]:
+        return None
+    return coverage[1]
+
+
+def _segments_query(kind: str, start: int, end: int, interval_minutes: int) -> dict:
+    """Selects 1h docs for whole hours inside [start, end) when the interval allows it, 1m docs elsewhere."""
+    segments = [("1m", start, end)]
+    first_hour, last_hour = floor_to(start + HOUR_MS - 1, HOUR_MS), floor_to(end, HOUR_MS)
+    if interval_minutes % 60 == 0 and first_hour < last_hour:
+        segments = [("1m", start, first_hour), ("1h", first_hour, last_hour), ("1m", last_hour, end)]
+    should = [{"bool": {"filter": [{"term": {"resolution": resolution}}, _epoch_range(gte, lt)]}}
+              for resolution, gte, lt in segments if gte < lt]
+    return {"bool": {"filter": [{"term": {"kind": kind}}], "should": should, "minimum_should_match": 1}}
+
+
+async def rollup_histogram(client: AsyncElasticsearch, kind: str, start: int, end: int,
+                           interval_minutes: int, terms_size: int = 10) -> dict[int, dict[str, float]]:
+    """Returns {bucket_ms: {key: value}} for [start, end) from the rollup docs."""
+    query = {
+        "size": 0,
+        "query": _segments_query(kind, start, end, interval_minutes),
+        "aggs": {"over_time": {
+            "date_histogram": {"field": "@timestamp", "fixed_interval": f"{interval_minutes}m", "min_doc_count": 1},
+            "aggs": {"by_key": {"terms": {"field": "key", "size": terms_size}, "aggs": {"value": {"sum": {"field": "value"}}}}},
+        }},
+    }
+    response = await client.search(index=ROLLUP_INDEX, body=query)
+    return {
+        bucket["key"]: {b["key"]: b["value"]["value"] for b in bucket["by_key"]["buckets"]}
+        for bucket in response.get("aggregations", {}).get("over_time", {}).get("buckets", [])
+    }
+
+
+async def rollup_terms(client: AsyncElasticsearch, kind: str, start: int, end: int, size: int = 20) -> dict[str, float]:
+    """Returns {key: value} summed over [start, end) from the rollup docs."""
+    query = {
+        "size": 0,
+        "query": _segments_query(kind, start, end, interval_minutes=60),
+        "aggs": {"by_key": {"terms": {"field": "key", "size": size}, "aggs": {"value": {"sum": {"field": "value"}}}}},
+    }
+    response = await client.search(index=ROLLUP_INDEX, body=query)
+    return {b["key"]: b["value"]["value"] for b in response.get("aggregations", {}).get("by_key", {}).get("buckets", [])}
+
+
+async def rollup_bandwidth_seconds(client: AsyncElasticsearch, start: int, end: int) -> dict[int, tuple[int, int]]:
+    """Returns {second_ms: (ingress, egress)} for [start, end) from the per-minute bandwidth docs."""
+    query = {"bool": {"filter": [{"term": {"kind": "bandwidth"}}, {"term": {"resolution": "1m"}},
+                                 _epoch_range(floor_to(start, MINUTE_MS), end)]}}
+    response = await client.search(index=ROLLUP_INDEX, query=query, size=(end - start) // MINUTE_MS + 2)
+    seconds = {}
+    for hit in response.get("hits", {}).get("hits", []):
+        minute = hit["_source"]
+        for offset, (ingress, egress) in minute.get("per_second", {}).items():
+            second = minute["@timestamp"] + int(offset) * 1000
+            if start <= second < end:
+                seconds[second] = (ingress, egress)
+    return seconds
+
+
+def merge_buckets(*parts: dict[int, dict[str, float]]) -> dict[int, dict[str, float]]:
+    """Adds up per-bucket series from several sources (rollups and the raw tail)."""
+    merged: dict[int, dict[str, float]] = {}
+    for part in parts:
+        for bucket, series in part.items():
+            target = merged.setdefault(bucket, {})
+            for key, value in series.items():
+                target[key] = target.get(key, 0) + value
+    return merged
+
+
+def fill_buckets(buckets: dict[int, dict[str, float]], interval_minutes: int) -> list[tuple[int, dict[str, float]]]:
+    """Orders the buckets and adds empty ones between the first and last, like date_histogram does."""
+    if not buckets:
+        return []
+    step = interval_minutes * MINUTE_MS
+    return [(key, buckets.get(key, {})) for key in range(min(buckets), max(buckets) + step, step)]
@@ -1,5 +1,8 @@
 import threading
-from collections import deque
+
+from app.config import settings
+from app.services.zeek_conn_store import ZeekConnStore
+
 class AppState:
     def __init__(self):
         # Admin privileges check result
@@ -8,8 +11,8 @@ class AppState:
         # We use a dictionary for network_hosts for efficient lookups by IP.
         # It maps an IP address to a host object. e.g., {'192.168.1.1': HostData}
         self.network_hosts = {}
-        self.zeek_conn_logs = deque(maxlen=1000)
-        self.zeek_lock = threading.Lock()
+        # Recent Zeek connections in columnar form, fed by zeek_parser (has its own lock).
+        self.zeek_conn_store = ZeekConnStore(max(settings.ZEEK_CONN_STORE_CAPACITY, 1))
 # last_scan_time is still useful for the UI
         self.last_scan_time = None
 
@@ -17,6 +20,22 @@ class AppState:
         # from the scanner thread and the API router thread, preventing crashes.
         self.hosts_lock = threading.Lock()
 
+        # Counters published by the packet writer thread (see packet_capture.data_handler_thread).
+        self.packet_writer_stats = {
+            "batches_flushed": 0, "rows_written": 0, "rows_dropped": 0,
+            "last_batch_size": 0, "max_batch_size": 0,
+            "last_flush_ms": 0.0, "max_flush_ms": 0.0,
+            "backlog": 0, "ring_dropped": 0, "ring_rejected": 0,
+        }
+
+        # Counters published by the eve.json tailer (see log_parser.start_log_monitoring).
+        # lag_bytes is how far the processed offset trails the end of the file.
+        self.alert_ingest_stats = {
+            "file_size": 0, "processed_offset": 0, "lag_bytes": 0,
+            "lines_processed": 0, "alert_candidates": 0, "alerts_written": 0, "alerts_dropped": 0,
+            "batches_flushed": 0, "last_batch_size": 0, "last_flush_ms": 0.0,
+        }
+
 # A single, global instance of our application state that is imported everywhere
 app_state = AppState()
 app_state.vulnerability_scan_in_progress = False
@@ -0,0 +1,98 @@
+# backend/benchmarks/ek_decoder_benchmark.py
+#
+# Throughput benchmark for the tshark EK JSON decoder.
+#
+# Record a sample from the sensor with:
+#     tshark -i <iface> -l -T ek -c 200000 > capture.ek.json
+# and run from the 'backend' directory:
+#     python -m benchmarks.ek_decoder_benchmark capture.ek.json --workers 1 2 4 8
+# Without a file, a synthetic capture is generated instead.
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services.ek_decoder import decode_ek_chunk, decode_ek_line
+
+CHUNK_BYTES = 1024 * 1024
+
+
+def synthetic_ek_lines(count: int) -> bytes:
+    """Generates 'count' packets in tshark EK format (index line + document)."""
+    rng = random.Random(42)
+    lines = []
+    base_ms = int(time.time() * 1000)
+    for i in range(count):
+        transport = rng.choice(["tcp", "udp"])
+        layers = {
+            "frame": {"frame_frame_len": str(rng.randint(60, 1514))},
+            "eth": {"eth_eth_src": "02:42:ac:11:00:02", "eth_eth_dst": "02:42:ac:11:00:03"},
+            "ip": {"ip_ip_src": f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}",
+                   "ip_ip_dst": f"192.168.1.{rng.randint(1, 254)}", "ip_ip_ttl": "64"},
+            transport: {f"{transport}_{transport}_srcport": str(rng.randint(1024, 65535)),
+                        f"{transport}_{transport}_dstport": str(rng.choice([53, 80, 443, 22]))},
+        }
+        lines.append(json.dumps({"index": {"_index": "packets-2025-01-01", "_type": "doc"}}))
+        lines.append(json.dumps({"timestamp": str(base_ms + i), "layers": layers}))
+    return ("\n".join(lines) + "\n").encode()
+
+
+def split_chunks(data: bytes, chunk_bytes: int = CHUNK_BYTES) -> list[bytes]:
+    """Splits the capture into line-aligned chunks, as the pipe reader would."""
+    chunks, start = [], 0
+    while start < len(data):
+        end = data.rfind(b"\n", start, start + chunk_bytes)
+        if end <= start:
+            end = data.find(b"\n", start + chunk_bytes)
+            if end == -1: end = len(data)
+        chunks.append(data[start:end])
+        start = end + 1
+    return chunks
+
+
+def bench_single_line(data: bytes) -> tuple[int, float]:
+    """Baseline: the original one-line-at-a-time decode."""
+    started = time.perf_counter()
+    decoded = sum(1 for line in data.splitlines() if decode_ek_line(line))
+    return decoded, time.perf_counter() - started
+
+
+def bench_pool(chunks: list[bytes], workers: int) -> tuple[int, float]:
+    with multiprocessing.Pool(workers) as pool:
+        started = time.perf_counter()
+        decoded = sum(len(batch) for batch in pool.imap(decode_ek_chunk, chunks))
+        return decoded, time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the tshark EK JSON decoder pool.")
+    parser.add_argument("capture", nargs="?", help="Recorded 'tshark -T ek' output. Omit to use synthetic data.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--synthetic-packets", type=int, default=200_000)
+    args = parser.parse_args()
+
+    if args.capture:
+        with open(args.capture, "rb") as f:
+            data = f.read()
+        print(f"Loaded {len(data) / 1e6:.1f} MB from {args.capture}")
+    else:
+        data = synthetic_ek_lines(args.synthetic_packets)
+        print(f"Generated {args.synthetic_packets} synthetic packets ({len(data) / 1e6:.1f} MB)")
+
+    decoded, elapsed = bench_single_line(data)
+    print(f"{'single-line':>12}: {decoded} packets in {elapsed:.2f}s -> {decoded / elapsed:,.0f} packets/s")
+
+    chunks = split_chunks(data)
+    for workers in args.workers:
+        decoded, elapsed = bench_pool(chunks, workers)
+        pps = decoded / elapsed
+        print(f"{f'{workers} worker(s)':>12}: {decoded} packets in {elapsed:.2f}s -> {pps:,.0f} packets/s ({pps / workers:,.0f} per core)")
+
+
+if __name__ == "__main__":
+    main()
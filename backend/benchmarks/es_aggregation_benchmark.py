@@ -0,0 +1,137 @@
+# backend/benchmarks/es_aggregation_benchmark.py
+#
+# Compares the old painless-script aggregations of the Zeek protocol
+# distribution / traffic timeline with the plain field aggregations over the
+# ingest-time 'app_protocol' and 'total_bytes' fields, on a synthetic index.
+#
+# Run from the 'backend' directory against a test cluster:
+#     ELASTICSEARCH_URI=https://localhost:9200 ELASTIC_USER=elastic ELASTIC_PASSWORD=... \
+#     ELASTICSEARCH_SSL_CA_CERTS=ca.crt python -m benchmarks.es_aggregation_benchmark --docs 2000000
+# With --use-pipeline the documents are indexed through the installed
+# 'netguard-zeek-enrich' pipeline (run setup-elastic.sh first) instead of having
+# the fields computed here, which also checks the pipeline itself.
+import argparse
+import os
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+from elasticsearch import Elasticsearch, helpers
+
+BENCH_INDEX = "netguard-bench-zeek"
+WELL_KNOWN_PORTS = {80: "HTTP", 443: "HTTPS", 21: "FTP", 22: "SSH", 23: "TELNET", 25: "SMTP",
+                    53: "DNS", 110: "POP3", 143: "IMAP", 3389: "RDP", 445: "SMB"}
+MAPPINGS = {"properties": {
+    "@timestamp": {"type": "date"}, "id_orig_h": {"type": "ip"}, "id_orig_p": {"type": "long"},
+    "id_resp_h": {"type": "ip"}, "id_resp_p": {"type": "long"}, "proto": {"type": "keyword"},
+    "conn_state": {"type": "keyword"}, "orig_ip_bytes": {"type": "long"}, "resp_ip_bytes": {"type": "long"},
+    "app_protocol": {"type": "keyword"}, "total_bytes": {"type": "long"},
+}}
+
+SCRIPTED_PROTOCOL = """
+    def final_protocol = "UNKNOWN";
+    if (doc.containsKey('proto') && !doc['proto'].empty) { final_protocol = doc['proto'].value.toUpperCase(); }
+    int port = 0;
+    if (doc.containsKey('id_orig_p') && !doc['id_orig_p'].empty) { port = (int) doc['id_orig_p'].value; }
+    else if (doc.containsKey('id_resp_p') && !doc['id_resp_p'].empty) { port = (int) doc['id_resp_p'].value; }
+    if (port == 80) return "HTTP"; if (port == 443) return "HTTPS"; if (port == 21) return "FTP";
+    if (port == 22) return "SSH"; if (port == 23) return "TELNET"; if (port == 25) return "SMTP";
+    if (port == 53) return "DNS"; if (port == 110) return "POP3"; if (port == 143) return "IMAP";
+    if (port == 3389) return "RDP"; if (port == 445) return "SMB";
+    return final_protocol;
+"""
+SCRIPTED_BYTES = {"script": {"source": "doc['orig_ip_bytes'].value + doc['resp_ip_bytes'].value", "lang": "painless"}}
+TIME_FILTER = {"range": {"@timestamp": {"gte": "now-1h"}}}
+
+QUERIES = {
+    "protocol distribution": (
+        {"size": 0, "query": {"bool": {"filter": [TIME_FILTER]}}, "aggs": {"protocol_traffic": {
+            "terms": {"script": {"lang": "painless", "source": SCRIPTED_PROTOCOL}, "size": 5, "order": {"total_bytes": "desc"}},
+            "aggs": {"total_bytes": {"sum": SCRIPTED_BYTES}}}}},
+        {"size": 0, "query": {"bool": {"filter": [TIME_FILTER]}}, "aggs": {"protocol_traffic": {
+            "terms": {"field": "app_protocol", "size": 5, "order": {"total_bytes": "desc"}},
+            "aggs": {"total_bytes": {"sum": {"field": "total_bytes"}}}}}},
+    ),
+    "traffic timeline": (
+        {"size": 0, "query": {"bool": {"filter": [TIME_FILTER]}}, "aggs": {"traffic_over_time": {
+            "date_histogram": {"field": "@timestamp", "fixed_interval": "1m"},
+            "aggs": {"by_protocol": {"terms": {"field": "proto"}, "aggs": {"total_bytes": {"sum": SCRIPTED_BYTES}}}}}}},
+        {"size": 0, "query": {"bool": {"filter": [TIME_FILTER]}}, "aggs": {"traffic_over_time": {
+            "date_histogram": {"field": "@timestamp", "fixed_interval": "1m"},
+            "aggs": {"by_protocol": {"terms": {"field": "proto"}, "aggs": {"total_bytes": {"sum": {"field": "total_bytes"}}}}}}}},
+    ),
+}
+
+
+def make_client() -> Elasticsearch:
+    ca_certs = os.getenv("ELASTICSEARCH_SSL_CA_CERTS")
+    return Elasticsearch(
+        hosts=[os.getenv("ELASTICSEARCH_URI", "https://localhost:9200")],
+        basic_auth=(os.getenv("ELASTIC_USER", "elastic"), os.getenv("ELASTIC_PASSWORD", "")),
+        ca_certs=ca_certs, verify_certs=bool(ca_certs), request_timeout=300,
+    )
+
+
+def synthetic_docs(count: int, compute_fields: bool):
+    rng = random.Random(7)
+    now = datetime.now(timezone.utc)
+    for _ in range(count):
+        proto = rng.choice(["tcp", "tcp", "tcp", "udp", "icmp"])
+        resp_port = rng.choice([80, 443, 443, 53, 22, 3389, 8080, 5432])
+        doc = {
+            "@timestamp": (now - timedelta(seconds=rng.uniform(0, 3600))).isoformat(),
+            "id_orig_h": f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}", "id_orig_p": rng.randint(1024, 65535),
+            "id_resp_h": f"192.168.1.{rng.randint(1, 254)}", "id_resp_p": resp_port,
+            "proto": proto, "conn_state": rng.choice(["SF", "S0", "REJ", "RSTO"]),
+            "orig_ip_bytes": rng.randint(40, 100_000), "resp_ip_bytes": rng.randint(40, 1_000_000),
+        }
+        if compute_fields:
+            # Mirrors the 'netguard-zeek-enrich' pipeline in setup-elastic.sh
+            doc["app_protocol"] = WELL_KNOWN_PORTS.get(doc["id_orig_p"], proto.upper())
+            doc["total_bytes"] = doc["orig_ip_bytes"] + doc["resp_ip_bytes"]
+        yield {"_index": BENCH_INDEX, "_source": doc}
+
+
+def time_query(es: Elasticsearch, body: dict, runs: int) -> tuple[list[int], dict]:
+    took, response = [], None
+    for _ in range(runs):
+        response = es.search(index=BENCH_INDEX, body=body, request_cache=False)
+        took.append(response["took"])
+    return took, response["aggregations"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scripted vs. ingest-time field aggregations on Zeek data.")
+    parser.add_argument("--docs", type=int, default=500_000)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--use-pipeline", action="store_true", help="Index through the installed netguard-zeek-enrich pipeline.")
+    parser.add_argument("--keep-index", action="store_true")
+    args = parser.parse_args()
+
+    es = make_client()
+    es.options(ignore_status=404).indices.delete(index=BENCH_INDEX)
+    es.indices.create(index=BENCH_INDEX, mappings=MAPPINGS, settings={"number_of_shards": 1, "number_of_replicas": 0})
+    started = time.perf_counter()
+    helpers.bulk(es, synthetic_docs(args.docs, compute_fields=not args.use_pipeline), chunk_size=5000,
+                 pipeline="netguard-zeek-enrich" if args.use_pipeline else None)
+    es.indices.refresh(index=BENCH_INDEX)
+    es.indices.forcemerge(index=BENCH_INDEX, max_num_segments=1)
+    print(f"Indexed {args.docs} synthetic conn docs in {time.perf_counter() - started:.1f}s")
+
+    try:
+        for name, (scripted, field_based) in QUERIES.items():
+            scripted_took, scripted_aggs = time_query(es, scripted, args.runs)
+            field_took, field_aggs = time_query(es, field_based, args.runs)
+            same = scripted_aggs == field_aggs
+            print(f"{name}: scripted median {statistics.median(scripted_took)} ms (max {max(scripted_took)}), "
+                  f"fields median {statistics.median(field_took)} ms (max {max(field_took)}), "
+                  f"{statistics.median(scripted_took) / max(statistics.median(field_took), 1):.1f}x, "
+                  f"results {'identical' if same else 'DIFFER'}")
+    finally:
+        if not args.keep_index:
+            es.indices.delete(index=BENCH_INDEX)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# backend/benchmarks/eve_parser_benchmark.py
+#
+# CPU benchmark for the eve.json alert parser: the old path (json.loads on every
+# line) against the byte-level pre-filter with the standard json module and with
+# the fastest installed backend (orjson / simdjson).
+#
+# Copy a recorded eve.json from a sensor and run from the 'backend' directory:
+#     python -m benchmarks.eve_parser_benchmark /var/log/suricata/eve.json
+# Without a file, a synthetic mix (1 alert per --alert-ratio events) is generated.
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app.services import eve_decoder
+from app.services.eve_decoder import JSON_BACKEND, filter_alert_candidates, parse_alert_line
+
+
+def synthetic_eve_lines(count: int, alert_ratio: int) -> list[bytes]:
+    rng = random.Random(42)
+    lines = []
+    for i in range(count):
+        event = {
+            "timestamp": "2025-01-01T12:00:00.000000+0000", "flow_id": rng.getrandbits(50), "in_iface": "eth0",
+            "src_ip": f"10.0.{rng.randint(0, 255)}.{rng.randint(1, 254)}", "src_port": rng.randint(1024, 65535),
+            "dest_ip": f"192.168.1.{rng.randint(1, 254)}", "dest_port": rng.choice([53, 80, 443, 22]), "proto": "TCP",
+        }
+        if i % alert_ratio == 0:
+            event["event_type"] = "alert"
+            event["alert"] = {"action": "allowed", "gid": 1, "signature_id": 2010935, "rev": 3,
+                              "signature": "ET SCAN Suspicious inbound to MSSQL port 1433", "category": "Potentially Bad Traffic", "severity": 2}
+        else:
+            event["event_type"] = rng.choice(["flow", "dns", "http", "tls", "stats"])
+            event[event["event_type"]] = {"pkts_toserver": rng.randint(1, 100), "bytes_toserver": rng.randint(60, 100000),
+                                          "state": "closed", "reason": "timeout", "alerted": False}
+        lines.append(json.dumps(event, separators=(",", ":")).encode())
+    return lines
+
+
+def baseline(lines: list[bytes]) -> int:
+    """What log_parser did before: decode every line, then look at event_type."""
+    alerts = 0
+    for line in lines:
+        if json.loads(line).get("event_type") == "alert":
+            alerts += 1
+    return alerts
+
+
+def prefiltered(lines: list[bytes]) -> int:
+    """What log_parser.process_log_lines does now."""
+    alerts = 0
+    for line in filter_alert_candidates(lines):
+        if parse_alert_line(line):
+            alerts += 1
+    return alerts
+
+
+def timed(name: str, fn, lines: list[bytes], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        alerts = fn(lines)
+        best = min(best, time.perf_counter() - started)
+    print(f"{name:<32} {len(lines) / best:>12,.0f} lines/s  ({best * 1e6 / len(lines):.2f} us/line, {alerts} alerts)")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the eve.json alert pre-filter and JSON backends.")
+    parser.add_argument("eve_file", nargs="?", help="Recorded eve.json (default: synthetic events).")
+    parser.add_argument("--events", type=int, default=200_000, help="Synthetic events to generate.")
+    parser.add_argument("--alert-ratio", type=int, default=500, help="One synthetic alert per this many events.")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.eve_file:
+        with open(args.eve_file, "rb") as f:
+            lines = [line.strip() for line in f if line.strip()]
+    else:
+        lines = synthetic_eve_lines(args.events, args.alert_ratio)
+    print(f"{len(lines)} eve.json lines, {len(filter_alert_candidates(lines))} alert candidates\n")
+
+    base = timed("json.loads on every line", baseline, lines, args.repeat)
+    fast_loads = eve_decoder.json_loads
+    eve_decoder.json_loads = json.loads
+    try:
+        best = timed("pre-filter + json", prefiltered, lines, args.repeat)
+    finally:
+        eve_decoder.json_loads = fast_loads
+    if JSON_BACKEND != "json":
+        best = timed(f"pre-filter + {JSON_BACKEND}", prefiltered, lines, args.repeat)
+    else:
+        print("(install orjson to also measure a faster JSON backend)")
+    print(f"\nSpeed-up of the active configuration: {base / best:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
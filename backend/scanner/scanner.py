@@ -1,9 +1,15 @@
 import os
 import sys
 import nmap
+import hashlib
+import ipaddress
 import logging
+import threading
 import time
-from datetime import datetime, timezone
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 
 # Add project root to path to allow importing from the 'app' module
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -11,13 +17,98 @@ sys.path.append(project_root)
 
 # Imports from YOUR application code
 from app.database import SessionLocal
-from app.models import Host, NetworkPort, Vulnerability
-from sqlalchemy import select, update, delete, text
+from app.models import Host, HostScanState, NetworkPort, Vulnerability
+from sqlalchemy import select, text
+from scheduler import PRIORITY_ALERTED, PRIORITY_NEW, PRIORITY_STALE, ScanScheduler, parse_rate_limits
 
 # Configure logging for this specific service
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - SCANNER - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Hosts scanned in parallel (one nmap process and one DB session each; keep it
+# below the engine's 15 pooled connections) and the time nmap may spend on a
+# single host per stage before giving up on it.
+SCAN_CONCURRENCY = int(os.environ.get("SCAN_CONCURRENCY", 8))
+SCAN_HOST_TIMEOUT_SECONDS = int(os.environ.get("SCAN_HOST_TIMEOUT_SECONDS", 900))
+# Host discovery pings the targets in shards of this prefix length (IPv4), with
+# up to SCAN_DISCOVERY_CONCURRENCY nmap -sn processes at once.
+SCAN_DISCOVERY_SHARD_PREFIX = int(os.environ.get("SCAN_DISCOVERY_SHARD_PREFIX", 24))
+SCAN_DISCOVERY_CONCURRENCY = int(os.environ.get("SCAN_DISCOVERY_CONCURRENCY", 4))
+# Scheduling (see scheduler.py): every 'up' host gets a port check at least every
+# SCAN_RECHECK_SECONDS, hosts seen in Suricata alerts of the last SCAN_ALERT_WINDOW_HOURS
+# every SCAN_ALERT_RECHECK_SECONDS; discovery runs every SCAN_DISCOVERY_INTERVAL_SECONDS.
+SCAN_RECHECK_SECONDS = int(os.environ.get("SCAN_RECHECK_SECONDS", 1800))
+SCAN_ALERT_RECHECK_SECONDS = int(os.environ.get("SCAN_ALERT_RECHECK_SECONDS", 300))
+SCAN_ALERT_WINDOW_HOURS = float(os.environ.get("SCAN_ALERT_WINDOW_HOURS", 1))
+SCAN_DISCOVERY_INTERVAL_SECONDS = int(os.environ.get("SCAN_DISCOVERY_INTERVAL_SECONDS", 1800))
+SCAN_PLAN_INTERVAL_SECONDS = int(os.environ.get("SCAN_PLAN_INTERVAL_SECONDS", 60))
+# At most this many nmap processes run at once (discovery and host stages
+# together), and each stage may start at most N scans per minute.
+SCAN_NMAP_BUDGET = int(os.environ.get("SCAN_NMAP_BUDGET", SCAN_CONCURRENCY + SCAN_DISCOVERY_CONCURRENCY))
+SCAN_STAGE_RATES = os.environ.get("SCAN_STAGE_RATES", "portcheck=120,ports=30,vulns=20")
+# Queue depth and job latency are logged and written here every minute.
+SCAN_STATUS_FILE = os.environ.get("SCAN_STATUS_FILE", "/tmp/netguard-scanner-status.json")
+NMAP_SLOTS = threading.BoundedSemaphore(SCAN_NMAP_BUDGET)
+STAGE_RATE_LIMITS = parse_rate_limits(SCAN_STAGE_RATES)
+# Hosts whose open ports haven't changed are deep-scanned (-sV -O, vuln scripts) again after this long.
+SCAN_DEEP_MAX_AGE_HOURS = float(os.environ.get("SCAN_DEEP_MAX_AGE_HOURS", 24))
+
+
+class StageTimer:
+    """
+    Collects scan stage durations across the worker threads. It lives as long as
+    the scheduler, so only the last 'keep' durations of each stage are kept and
+    summarized; the counters are running totals.
+    """
+    def __init__(self, keep: int = 1000):
+        self._lock = threading.Lock()
+        self.durations = defaultdict(lambda: deque(maxlen=keep))
+        self.counters = Counter()
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.durations[name].append(time.monotonic() - started)
+
+    def count(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def summary(self) -> str:
+        with self._lock:
+            parts = [f"{name}={value}" for name, value in sorted(self.counters.items())]
+            durations = {name: list(values) for name, values in self.durations.items()}
+        for name, values in durations.items():
+            values = sorted(values)
+            parts.append(f"{name}: last n={len(values)} total={sum(values):.1f}s "
+                         f"p50={values[len(values) // 2]:.1f}s max={values[-1]:.1f}s")
+        return "; ".join(parts) or "no stages ran"
+
+
+@contextmanager
+def nmap_slot(stage: str):
+    """Waits for the stage's rate limit, then holds one of the SCAN_NMAP_BUDGET nmap process slots."""
+    limiter = STAGE_RATE_LIMITS.get(stage)
+    if limiter:
+        limiter.acquire()
+    with NMAP_SLOTS:
+        yield
+
+
+def run_host_nmap(host_ip: str, arguments: str, stage: str) -> nmap.PortScanner:
+    """
+    Runs one per-host nmap stage. nmap abandons the host after SCAN_HOST_TIMEOUT_SECONDS;
+    the process itself is killed (PortScannerTimeout) if it overruns that by a minute.
+    """
+    nm = nmap.PortScanner()
+    with nmap_slot(stage):
+        nm.scan(hosts=host_ip, arguments=f"{arguments} --host-timeout {SCAN_HOST_TIMEOUT_SECONDS}s",
+                timeout=SCAN_HOST_TIMEOUT_SECONDS + 60)
+    return nm
 
 
 def wait_for_db_tables(max_retries=15, delay=10):
@@ -90,42 +181,154 @@ def parse_vulnerability_scripts(host_data: dict, host_ip: str, host_id: int):
                         ))
     return vulnerabilities
 
-def discover_hosts(db, cidr: str) -> list[str]:
+def discovery_shards(targets: str) -> list[str]:
     """
-    Performs a fast ping scan to find live hosts.
+    Splits the scan targets (comma or space separated) into shards of at most
+    /SCAN_DISCOVERY_SHARD_PREFIX. IPv6 networks and nmap range/hostname syntax
+    are kept as single shards.
     """
-    logger.info("--- Stage 1: Host Discovery ---")
-    logger.info(f"Pinging hosts in CIDR: {cidr}...")
-    nm = nmap.PortScanner()
-    nm.scan(hosts=cidr, arguments='-sn -T4')
-    live_hosts_ips = sorted(nm.all_hosts())
-    logger.info(f"Discovery complete. Found {len(live_hosts_ips)} live host(s): {live_hosts_ips}")
+    shards = []
+    for target in targets.replace(",", " ").split():
+        try:
+            network = ipaddress.ip_network(target, strict=False)
+        except ValueError:
+            shards.append(target)
+            continue
+        if network.version == 4 and network.prefixlen < SCAN_DISCOVERY_SHARD_PREFIX:
+            shards.extend(str(subnet) for subnet in network.subnets(new_prefix=SCAN_DISCOVERY_SHARD_PREFIX))
+        else:
+            shards.append(str(network))
+    return shards
 
-    db.execute(update(Host).values(status="down"))
+def is_network(shard: str) -> bool:
+    try:
+        ipaddress.ip_network(shard, strict=False)
+        return True
+    except ValueError:
+        return False
 
-    for ip in live_hosts_ips:
-        host = db.scalars(select(Host).where(Host.ip_address == ip)).first()
-        if host:
-            host.status = 'up'
-        else:
-            logger.info(f"New host found: {ip}. Creating new record.")
-            host = Host(ip_address=ip, status='up', hostname='N/A', os_name='Unknown')
-            db.add(host)
-    
+def apply_discovery_results(db, live_hosts_ips: list[str], network: str | None) -> list[str]:
+    """
+    Marks the live hosts 'up' (creating the unknown ones) and the other known
+    hosts inside 'network' 'down', with two set-based statements in one
+    transaction so readers never see a half-applied shard. Without a network
+    (nmap range syntax) nothing is marked down here; see mark_unseen_hosts_down().
+    Returns the IPs of the newly created hosts.
+    """
+    started = time.monotonic()
+    # The whole live set travels as one array parameter, whatever its size.
+    # xmax = 0 is true only for rows this statement inserted.
+    rows = db.execute(text(
+        "INSERT INTO hosts (ip_address, status, hostname, os_name, last_seen) "
+        "SELECT ip, 'up', 'N/A', 'Unknown', now() FROM unnest(CAST(:ips AS varchar[])) AS ip "
+        "ON CONFLICT (ip_address) DO UPDATE SET status = 'up', last_seen = now() "
+        "RETURNING ip_address, (xmax = 0) AS inserted"
+    ), {"ips": live_hosts_ips}).all()
+    went_down = 0
+    if network:
+        # last_seen keeps the time the host was last seen up.
+        went_down = db.execute(text(
+            "UPDATE hosts SET status = 'down' "
+            "WHERE status <> 'down' AND CAST(ip_address AS inet) <<= CAST(:network AS inet) "
+            "AND NOT (ip_address = ANY(CAST(:ips AS varchar[])))"
+        ), {"ips": live_hosts_ips, "network": network}).rowcount
+    db.commit()
+    new_hosts = sorted(ip for ip, inserted in rows if inserted)
+    logger.info(f"Discovery results for {network or 'targets'} applied in {(time.monotonic() - started) * 1000:.0f} ms: "
+                f"{len(rows)} up ({len(new_hosts)} new), {went_down} went down.")
+    return new_hosts
+
+def mark_unseen_hosts_down(db, live_hosts_ips: list[str], failed_networks: list[str]) -> int:
+    """
+    End of a sweep: marks down every host that no shard reported live (including
+    hosts outside the current targets), except inside shards whose scan failed.
+    """
+    went_down = db.execute(text(
+        "UPDATE hosts SET status = 'down' "
+        "WHERE status <> 'down' AND NOT (ip_address = ANY(CAST(:ips AS varchar[]))) "
+        "AND NOT (CAST(ip_address AS inet) <<= ANY(CAST(:failed AS inet[])))"
+    ), {"ips": live_hosts_ips, "failed": failed_networks}).rowcount
     db.commit()
+    return went_down
+
+def ping_sweep(shard: str) -> list[str]:
+    nm = nmap.PortScanner()
+    with nmap_slot("discovery"):
+        nm.scan(hosts=shard, arguments='-sn -T4')
+    return sorted(nm.all_hosts())
+
+def discover_hosts(db, targets: str, on_live_hosts=None) -> list[str]:
+    """
+    Performs a fast ping scan to find live hosts. The targets are split into
+    shards pinged by up to SCAN_DISCOVERY_CONCURRENCY nmap processes; each shard's
+    results are written, and passed to on_live_hosts(ips), as soon as it completes.
+    """
+    logger.info("--- Stage 1: Host Discovery ---")
+    shards = discovery_shards(targets)
+    logger.info(f"Pinging hosts in {targets} as {len(shards)} shard(s)...")
+    started = time.monotonic()
+    live_hosts_ips, failed = [], []
+    with ThreadPoolExecutor(max_workers=SCAN_DISCOVERY_CONCURRENCY, thread_name_prefix="discovery") as pool:
+        futures = {pool.submit(ping_sweep, shard): shard for shard in shards}
+        for future in as_completed(futures):
+            shard = futures[future]
+            try:
+                shard_live = future.result()
+            except Exception as e:
+                logger.error(f"Discovery of shard {shard} failed; its hosts keep their status. Error: {e}")
+                failed.append(shard)
+                continue
+            new_hosts = apply_discovery_results(db, shard_live, shard if is_network(shard) else None)
+            if new_hosts:
+                logger.info(f"New host(s) found: {new_hosts}")
+            live_hosts_ips.extend(shard_live)
+            if on_live_hosts and shard_live:
+                on_live_hosts(shard_live)
+
+    if all(is_network(shard) for shard in failed):
+        went_down = mark_unseen_hosts_down(db, live_hosts_ips, failed)
+        if went_down:
+            logger.info(f"{went_down} host(s) outside the live set marked down.")
+    logger.info(f"Discovery complete in {time.monotonic() - started:.1f}s. Found {len(live_hosts_ips)} live host(s).")
     return live_hosts_ips
 
-def scan_ports_and_details(db, host_ip: str):
+def open_ports_fingerprint(host_data) -> str:
+    """sha256 of the host's sorted open "proto/port" list, to detect a changed attack surface."""
+    open_ports = sorted(
+        f"{proto}/{port}" for proto in host_data.all_protocols() if proto in ['tcp', 'udp']
+        for port, data in host_data[proto].items() if data['state'] == 'open'
+    )
+    return hashlib.sha256(",".join(open_ports).encode()).hexdigest()
+
+def check_open_ports(host_ip: str) -> str | None:
+    """
+    Cheap stage: a plain port scan (same default port set as the deep scan, without
+    version/OS detection). Returns the open-ports fingerprint, or None if the host is gone.
+    """
+    nm = run_host_nmap(host_ip, '-T4 -Pn', 'portcheck')
+    if host_ip not in nm.all_hosts():
+        return None
+    return open_ports_fingerprint(nm[host_ip])
+
+def needs_deep_scan(state: HostScanState, fingerprint: str, now: datetime) -> bool:
+    return (
+        state.last_deep_scan is None
+        or state.port_fingerprint != fingerprint
+        or now - state.last_deep_scan > timedelta(hours=SCAN_DEEP_MAX_AGE_HOURS)
+    )
+
+def scan_ports_and_details(db, host_ip: str) -> dict | None:
     """
-    Performs a service and OS scan on a single host.
+    Performs a service and OS scan on a single host and applies the open ports as
+    a diff against the stored ones. Returns {"proto/port": service}, or None if
+    the host went offline.
     """
     logger.info(f"--- Stage 2: Port & OS Scan for {host_ip} ---")
-    nm = nmap.PortScanner()
-    nm.scan(hosts=host_ip, arguments='-sV -O -T4 -Pn')
+    nm = run_host_nmap(host_ip, '-sV -O -T4 -Pn', 'ports')
 
     if host_ip not in nm.all_hosts():
         logger.warning(f"Host {host_ip} went offline during port scan. Skipping.")
-        return
+        return None
 
     host_data = nm[host_ip]
     host = db.scalars(select(Host).where(Host.ip_address == host_ip)).one()
@@ -135,32 +338,42 @@ def scan_ports_and_details(db, host_ip: str):
     host.vendor = next(iter(host_data.get('vendor', {}).values()), None)
     host.os_name = next((match['name'] for match in host_data.get('osmatch', []) if 'name' in match), "Unknown OS")
 
-    db.execute(delete(NetworkPort).where(NetworkPort.host_id == host.id))
-    db.flush()
-
-    ports_added_count = 0
+    found = {}
     for proto in host_data.all_protocols():
         if proto in ['tcp', 'udp']:
             for port, data in host_data[proto].items():
                 if data['state'] == 'open':
-                    db.add(NetworkPort(
-                        host_ip=host_ip, port_number=int(port), protocol=proto,
-                        service_name=f"{data.get('product', '')} {data.get('version', '')}".strip() or data.get('name', 'unknown'),
-                        timestamp=datetime.now(timezone.utc), host_id=host.id
-                    ))
-                    ports_added_count += 1
-    
-    if ports_added_count > 0:
-        logger.info(f"Found and saved {ports_added_count} open ports for {host_ip}.")
+                    found[(int(port), proto)] = f"{data.get('product', '')} {data.get('version', '')}".strip() or data.get('name', 'unknown')
+
+    # Only the ports that opened, closed or changed service are written.
+    now = datetime.now(timezone.utc)
+    existing = {(p.port_number, p.protocol): p for p in db.scalars(select(NetworkPort).where(NetworkPort.host_id == host.id))}
+    removed = changed = 0
+    for key, network_port in existing.items():
+        if key not in found:
+            db.delete(network_port)
+            removed += 1
+        elif network_port.service_name != found[key]:
+            network_port.service_name, network_port.timestamp = found[key], now
+            changed += 1
+    added = [key for key in found if key not in existing]
+    for port, proto in added:
+        db.add(NetworkPort(
+            host_ip=host_ip, port_number=port, protocol=proto, service_name=found[(port, proto)],
+            timestamp=now, host_id=host.id
+        ))
+
+    logger.info(f"{len(found)} open ports on {host_ip}: {len(added)} new, {changed} changed, {removed} closed.")
     db.commit()
+    return {f"{proto}/{port}": service for (port, proto), service in sorted(found.items())}
 
 def scan_vulnerabilities(db, host_ip: str):
     """
-    Performs a vulnerability scan on a single host.
+    Performs a vulnerability scan on a single host and applies the findings as a
+    diff against the stored Nmap findings.
     """
     logger.info(f"--- Stage 3: Vulnerability Scan for {host_ip} ---")
-    nm = nmap.PortScanner()
-    nm.scan(hosts=host_ip, arguments='-sV --script vuln -T4 -Pn')
+    nm = run_host_nmap(host_ip, '-sV --script vuln -T4 -Pn', 'vulns')
     
     if host_ip not in nm.all_hosts():
         logger.warning(f"Host {host_ip} went offline during vulnerability scan. Skipping.")
@@ -169,59 +382,148 @@ def scan_vulnerabilities(db, host_ip: str):
     host_data = nm[host_ip]
     host = db.scalars(select(Host).where(Host.ip_address == host_ip)).one()
 
-    db.execute(delete(Vulnerability).where(Vulnerability.host_id == host.id, Vulnerability.source == 'Nmap'))
-    db.flush()
-
-    new_vulns = parse_vulnerability_scripts(host_data, host_ip, host.id)
-    if new_vulns:
-        db.add_all(new_vulns)
-        logger.info(f"Found and saved {len(new_vulns)} potential vulnerabilities on {host_ip}.")
+    found = {(v.port, v.cve): v for v in parse_vulnerability_scripts(host_data, host_ip, host.id)}
+    existing = {
+        (v.port, v.cve): v for v in
+        db.scalars(select(Vulnerability).where(Vulnerability.host_id == host.id, Vulnerability.source == 'Nmap'))
+    }
+    resolved = 0
+    for key, vulnerability in existing.items():
+        if key not in found:
+            db.delete(vulnerability)
+            resolved += 1
+        else:
+            current = found[key]
+            vulnerability.severity, vulnerability.service, vulnerability.description = current.severity, current.service, current.description
+    new_vulns = [v for key, v in found.items() if key not in existing]
+    db.add_all(new_vulns)
+    if found or resolved:
+        logger.info(f"{len(found)} potential vulnerabilities on {host_ip}: {len(new_vulns)} new, {resolved} resolved.")
 
     db.commit()
 
 
+def scan_host(host_ip: str, timer: StageTimer):
+    """
+    Runs the per-host stages for one host. Called from the worker pool, so it uses
+    its own DB session; a failure only rolls back this host's changes.
 
+    A cheap port check runs first; the version/OS and vuln stages only run when
+    the open ports changed or the last deep scan is older than SCAN_DEEP_MAX_AGE_HOURS.
+    """
+    db = SessionLocal()
+    started = time.monotonic()
+    try:
+        host = db.scalars(select(Host).where(Host.ip_address == host_ip)).one()
+        state = db.get(HostScanState, host.id) or HostScanState(host_id=host.id)
+        with timer.stage("portcheck"):
+            fingerprint = check_open_ports(host_ip)
+        now = datetime.now(timezone.utc)
+        state.last_port_check = now
+        if fingerprint is None:
+            # Recorded anyway, so the scheduler waits a full re-check interval before retrying.
+            db.add(state)
+            db.commit()
+            logger.warning(f"Host {host_ip} went offline during port check. Skipping.")
+            return
+        if not needs_deep_scan(state, fingerprint, now):
+            db.add(state)
+            db.commit()
+            timer.count("unchanged")
+            logger.info(f"Host {host_ip} unchanged since its deep scan at {state.last_deep_scan:%Y-%m-%d %H:%M}. Skipping.")
+            return
+        with timer.stage("ports"):
+            services = scan_ports_and_details(db, host_ip)
+        if services is None:
+            return
+        with timer.stage("vulns"):
+            scan_vulnerabilities(db, host_ip)
+        # Recorded last, so a failed stage makes the next cycle deep-scan again.
+        state.port_fingerprint, state.services, state.last_deep_scan = fingerprint, services, now
+        db.add(state)
+        db.commit()
+        timer.count("deep_scanned")
+        logger.info(f"✅ Successfully completed all scans for {host_ip} in {time.monotonic() - started:.1f}s.")
+    except nmap.PortScannerTimeout:
+        logger.warning(f"nmap timed out on host {host_ip}. Rolling back changes for this host.")
+        db.rollback()
+    except Exception as e:
+        logger.error(f"An error occurred while scanning host {host_ip}. Rolling back changes for this host. Error: {e}", exc_info=True)
+        db.rollback()
+    finally:
+        db.close()
 
 
-
-def run_scan_cycle():
+def plan_scan_jobs() -> list[tuple[str, int, float]]:
     """
-    Main orchestrated scan cycle.
+    Returns the due hosts for the scheduler as (ip, priority, staleness): 'up' hosts
+    never scanned, hosts involved in Suricata alerts of the last SCAN_ALERT_WINDOW_HOURS
+    whose last port check is older than SCAN_ALERT_RECHECK_SECONDS, and every other
+    host whose last port check is older than SCAN_RECHECK_SECONDS.
     """
-    cidr = os.environ.get("SCAN_TARGET_CIDR")
-    if not cidr:
-        logger.error("FATAL: SCAN_TARGET_CIDR environment variable not set. Exiting.")
-        return
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        rows = db.execute(text(
+            "SELECT ip_address, last_port_check, is_new, alerted FROM ("
+            "  SELECT h.ip_address, s.last_port_check, s.host_id IS NULL AS is_new,"
+            "    EXISTS (SELECT 1 FROM security_alerts a WHERE a.timestamp >= :alert_since"
+            "            AND (a.source_ip = h.ip_address OR a.destination_ip = h.ip_address)) AS alerted"
+            "  FROM hosts h LEFT JOIN host_scan_state s ON s.host_id = h.id"
+            "  WHERE h.status = 'up'"
+            ") candidates "
+            "WHERE is_new OR last_port_check IS NULL OR last_port_check < :stale_before "
+            "OR (alerted AND last_port_check < :alerted_before)"
+        ), {
+            # security_alerts.timestamp is naive UTC.
+            "alert_since": (now - timedelta(hours=SCAN_ALERT_WINDOW_HOURS)).replace(tzinfo=None),
+            "stale_before": now - timedelta(seconds=SCAN_RECHECK_SECONDS),
+            "alerted_before": now - timedelta(seconds=SCAN_ALERT_RECHECK_SECONDS),
+        }).all()
+    finally:
+        db.close()
+    jobs = []
+    for ip, last_port_check, is_new, alerted in rows:
+        priority = PRIORITY_NEW if is_new or last_port_check is None else PRIORITY_ALERTED if alerted else PRIORITY_STALE
+        jobs.append((ip, priority, last_port_check.timestamp() if last_port_check else 0.0))
+    return jobs
 
-    logger.info("--- Starting New Scan Cycle ---")
+def run_discovery(on_live_hosts, timer: StageTimer):
+    cidr = os.environ.get("SCAN_TARGET_CIDR")
     db = SessionLocal()
     try:
-        live_hosts_ips = discover_hosts(db, cidr)
-        for ip in live_hosts_ips:
-            try:
-                scan_ports_and_details(db, ip)
-                scan_vulnerabilities(db, ip)
-                logger.info(f"✅ Successfully completed all scans for {ip}.")
-            except Exception as e:
-                 logger.error(f"An error occurred while scanning host {ip}. Rolling back changes for this host. Error: {e}", exc_info=True)
-                 db.rollback()
-        
-    except Exception as e:
-        logger.error(f"A critical error occurred in the main scan cycle. Error: {e}", exc_info=True)
+        with timer.stage("discovery"):
+            discover_hosts(db, cidr, on_live_hosts=on_live_hosts)
+    except Exception:
         db.rollback()
+        raise
     finally:
         db.close()
-        logger.info("--- Scan Cycle Complete ---")
 
 if __name__ == "__main__":
     logger.info("Scanner service started. Waiting for dependent services...")
     time.sleep(15) 
     
+    if not os.environ.get("SCAN_TARGET_CIDR"):
+        logger.error("FATAL: SCAN_TARGET_CIDR environment variable not set. Exiting.")
+        sys.exit(1)
+
     # NEW: Wait for DB tables to be created by the main app
     if not wait_for_db_tables():
         sys.exit(1) # Exit if tables are not found after retries
-    
-    while True:
-        run_scan_cycle()
-        logger.info("Scanner is sleeping for 30 minutes...")
-        time.sleep(1800)
\ No newline at end of file
+
+    # Instead of fixed 30-minute cycles, hosts are scanned continuously in priority
+    # order (new, recently alerted, stalest) as they become due.
+    timer = StageTimer()
+    scheduler = ScanScheduler(
+        run_job=lambda host_ip: scan_host(host_ip, timer),
+        plan_jobs=plan_scan_jobs,
+        discover=lambda on_live_hosts: run_discovery(on_live_hosts, timer),
+        workers=SCAN_CONCURRENCY,
+        plan_interval=SCAN_PLAN_INTERVAL_SECONDS,
+        discovery_interval=SCAN_DISCOVERY_INTERVAL_SECONDS,
+        cooldown=SCAN_ALERT_RECHECK_SECONDS,
+        status_path=SCAN_STATUS_FILE,
+        describe_stages=timer.summary,
+    )
+    scheduler.run(threading.Event())
@@ -0,0 +1,249 @@
+# backend/scanner/scheduler.py
+#
+# Scheduling for the scanner service: a priority queue of per-host scan jobs
+# drained by a fixed pool of worker threads, fed by periodic planning from the
+# database, plus token-bucket rate limits for the nmap stages.
+#
+# The queue is rebuilt from persisted state (hosts, host_scan_state,
+# security_alerts) on every planning round, so a restart loses nothing: a host
+# stays due until its scan has been recorded.
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# Lower value = scanned first.
+PRIORITY_NEW = 0        # never scanned
+PRIORITY_ALERTED = 1    # involved in recent Suricata alerts
+PRIORITY_STALE = 2      # routine re-check, stalest first
+PRIORITY_NAMES = {PRIORITY_NEW: "new", PRIORITY_ALERTED: "alerted", PRIORITY_STALE: "stale"}
+
+
+class RateLimiter:
+    """Token bucket allowing 'per_minute' acquisitions per minute, in bursts of up to 10 seconds' worth."""
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60
+        self.capacity = max(1.0, self.rate * 10)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Blocks until a token is available."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def parse_rate_limits(spec: str) -> dict[str, RateLimiter]:
+    """'portcheck=120,vulns=20' -> {stage: RateLimiter(per_minute)}; stages at 0 are unlimited."""
+    limits = {}
+    for item in spec.replace(" ", "").split(","):
+        if not item:
+            continue
+        stage, _, per_minute = item.partition("=")
+        try:
+            per_minute = float(per_minute)
+        except ValueError:
+            logger.warning(f"Ignoring malformed scan rate limit '{item}' (expected stage=per_minute).")
+            continue
+        if per_minute > 0:
+            limits[stage] = RateLimiter(per_minute)
+    return limits
+
+
+def _percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"p50": None, "p95": None, "max": None}
+    values = sorted(values)
+    return {
+        "p50": round(values[len(values) // 2], 1),
+        "p95": round(values[min(len(values) - 1, int(len(values) * 0.95))], 1),
+        "max": round(values[-1], 1),
+    }
+
+
+class ScanScheduler:
+    """
+    Runs 'run_job(ip)' for due hosts on 'workers' threads, most urgent first.
+
+    - plan_jobs() returns the due hosts as (ip, priority, staleness) tuples; it
+      runs every plan_interval seconds, after each discovery shard and when the
+      queue runs dry (at most every MIN_REPLAN_SECONDS).
+    - discover(on_live_hosts) runs every discovery_interval seconds on its own thread.
+    A host is never queued twice, queued while it is being scanned, or queued
+    again within 'cooldown' seconds of its last job (so a host that keeps failing
+    or timing out isn't retried on every round); submitting it again with a more
+    urgent priority moves it up.
+    """
+    MIN_REPLAN_SECONDS = 15
+
+    def __init__(self, run_job, plan_jobs, discover, workers: int, plan_interval: float,
+                 discovery_interval: float, cooldown: float, report_interval: float = 60,
+                 status_path: str | None = None, describe_stages=None):
+        self.run_job = run_job
+        self.plan_jobs = plan_jobs
+        self.discover = discover
+        self.workers = workers
+        self.plan_interval = plan_interval
+        self.discovery_interval = discovery_interval
+        self.cooldown = cooldown
+        self.report_interval = report_interval
+        self.status_path = status_path
+        self.describe_stages = describe_stages
+        self._heap = []
+        self._queued: dict[str, tuple[int, float]] = {}  # ip -> (priority, enqueued at)
+        self._running: set[str] = set()
+        self._finished_at: dict[str, float] = {}
+        self._sequence = itertools.count()
+        self._lock = threading.Lock()
+        self._job_available = threading.Condition(self._lock)
+        self._plan_requested = threading.Event()
+        # (priority, seconds waited in the queue, seconds running) of recent jobs.
+        self._latencies = deque(maxlen=1000)
+        self.completed = 0
+        self.failed = 0
+
+    # --- Queue ----------------------------------------------------------------
+    def submit(self, ip: str, priority: int, staleness: float = 0.0) -> bool:
+        with self._lock:
+            if ip in self._running or time.monotonic() - self._finished_at.get(ip, -self.cooldown) < self.cooldown:
+                return False
+            current = self._queued.get(ip)
+            if current and current[0] <= priority:
+                return False
+            # A superseded heap entry stays behind and is skipped when popped.
+            self._queued[ip] = (priority, current[1] if current else time.monotonic())
+            heapq.heappush(self._heap, (priority, staleness, next(self._sequence), ip))
+            self._job_available.notify()
+            return True
+
+    def _next_job(self, stop_event: threading.Event):
+        with self._lock:
+            while not stop_event.is_set():
+                while self._heap:
+                    priority, _, _, ip = heapq.heappop(self._heap)
+                    queued = self._queued.get(ip)
+                    if queued is None or queued[0] != priority:
+                        continue
+                    del self._queued[ip]
+                    self._running.add(ip)
+                    return ip, priority, queued[1]
+                self._plan_requested.set()
+                self._job_available.wait(1.0)
+        return None
+
+    def _worker(self, stop_event: threading.Event):
+        while True:
+            job = self._next_job(stop_event)
+            if job is None:
+                return
+            ip, priority, enqueued_at = job
+            started = time.monotonic()
+            failed = False
+            try:
+                self.run_job(ip)
+            except Exception as e:
+                failed = True
+                logger.error(f"Scan job for {ip} failed: {e}", exc_info=True)
+            finally:
+                finished = time.monotonic()
+                with self._lock:
+                    self._running.discard(ip)
+                    self._finished_at[ip] = finished
+                    self._latencies.append((priority, started - enqueued_at, finished - started))
+                    self.completed += 1
+                    self.failed += failed
+
+    # --- Planning and discovery -------------------------------------------------
+    def plan(self) -> int:
+        with self._lock:
+            cooled_down = time.monotonic() - self.cooldown
+            self._finished_at = {ip: at for ip, at in self._finished_at.items() if at > cooled_down}
+        submitted = 0
+        for ip, priority, staleness in self.plan_jobs():
+            submitted += self.submit(ip, priority, staleness)
+        return submitted
+
+    def _discovery_loop(self, stop_event: threading.Event):
+        while not stop_event.is_set():
+            started = time.monotonic()
+            try:
+                self.discover(lambda host_ips: self._plan_requested.set())
+            except Exception as e:
+                logger.error(f"Host discovery failed: {e}", exc_info=True)
+            self._plan_requested.set()
+            stop_event.wait(max(0.0, self.discovery_interval - (time.monotonic() - started)))
+
+    # --- Metrics ------------------------------------------------------------------
+    def stats(self) -> dict:
+        with self._lock:
+            depth = {name: 0 for name in PRIORITY_NAMES.values()}
+            for priority, _ in self._queued.values():
+                depth[PRIORITY_NAMES[priority]] += 1
+            latencies = list(self._latencies)
+            stats = {"queue_depth": len(self._queued), "queued_by_priority": depth,
+                     "running": len(self._running), "completed": self.completed, "failed": self.failed}
+        stats["wait_seconds"] = _percentiles([wait for _, wait, _ in latencies])
+        stats["run_seconds"] = _percentiles([run for _, _, run in latencies])
+        stats["wait_seconds_by_priority"] = {
+            name: _percentiles([wait for p, wait, _ in latencies if p == priority])
+            for priority, name in PRIORITY_NAMES.items()
+        }
+        return stats
+
+    def report(self):
+        stats = self.stats()
+        logger.info(
+            f"Scan queue: {stats['queue_depth']} queued {stats['queued_by_priority']}, {stats['running']} running, "
+            f"{stats['completed']} done ({stats['failed']} failed); wait p50/max "
+            f"{stats['wait_seconds']['p50']}/{stats['wait_seconds']['max']}s, run p50/max "
+            f"{stats['run_seconds']['p50']}/{stats['run_seconds']['max']}s"
+            + (f"; stages: {self.describe_stages()}" if self.describe_stages else "")
+        )
+        if self.status_path:
+            try:
+                temp_path = f"{self.status_path}.tmp"
+                with open(temp_path, "w") as f:
+                    json.dump({**stats, "updated_at": time.time()}, f)
+                os.replace(temp_path, self.status_path)
+            except OSError as e:
+                logger.warning(f"Could not write scanner status to {self.status_path}: {e}")
+
+    # --- Main loop ------------------------------------------------------------------
+    def run(self, stop_event: threading.Event):
+        """Starts the workers and the discovery thread, then plans and reports until stop_event is set."""
+        for index in range(self.workers):
+            threading.Thread(target=self._worker, args=(stop_event,), name=f"host-scan-{index}", daemon=True).start()
+        threading.Thread(target=self._discovery_loop, args=(stop_event,), name="discovery", daemon=True).start()
+        last_plan = -self.plan_interval
+        next_report = 0.0
+        while not stop_event.is_set():
+            now = time.monotonic()
+            since_plan = now - last_plan
+            if since_plan >= self.plan_interval or (self._plan_requested.is_set() and since_plan >= self.MIN_REPLAN_SECONDS):
+                self._plan_requested.clear()
+                last_plan = now
+                try:
+                    submitted = self.plan()
+                    if submitted:
+                        logger.info(f"Queued {submitted} scan job(s).")
+                except Exception as e:
+                    logger.error(f"Scan planning failed: {e}", exc_info=True)
+            if now >= next_report:
+                self.report()
+                next_report = now + self.report_interval
+            stop_event.wait(1.0)
@@ -45,12 +45,22 @@ echo "Creating/Updating Suricata index template..."
 curl -X PUT $CURL_OPTS "${ES_URL}/_index_template/netguard-suricata-template" -H "Content-Type: application/json" -d'
 { "index_patterns": ["netguard-suricata-*"], "template": { "settings": { "index.lifecycle.name": "netguard-delete-after-30-days", "index.lifecycle.rollover_alias": "suricata-logs" }, "mappings": { "properties": { "@timestamp": { "type": "date" }, "src_ip": { "type": "ip" }, "dest_ip": { "type": "ip" }, "proto": { "type": "keyword" }, "event_type": { "type": "keyword" } } } } }'
 
-# 3. Create the Zeek Index Template
+# 3. Create the Zeek enrichment ingest pipeline
+# Precomputes 'app_protocol' (well-known port -> application name, else the
+# transport protocol) and 'total_bytes' (orig_ip_bytes + resp_ip_bytes) once at
+# index time, so dashboard aggregations run on plain doc-values fields instead
+# of per-document painless scripts.
+echo "Creating/Updating Zeek enrichment ingest pipeline..."
+curl -X PUT $CURL_OPTS "${ES_URL}/_ingest/pipeline/netguard-zeek-enrich" -H "Content-Type: application/json" -d'
+{ "description": "NetGuard: precompute app_protocol and total_bytes for Zeek conn logs", "processors": [ { "script": { "lang": "painless", "ignore_failure": true, "source": "String proto = ctx.proto == null ? \"UNKNOWN\" : ctx.proto.toString().toUpperCase(); def rawPort = ctx.id_orig_p != null ? ctx.id_orig_p : ctx.id_resp_p; int port = rawPort == null ? 0 : Integer.parseInt(rawPort.toString()); Map names = [80: \"HTTP\", 443: \"HTTPS\", 21: \"FTP\", 22: \"SSH\", 23: \"TELNET\", 25: \"SMTP\", 53: \"DNS\", 110: \"POP3\", 143: \"IMAP\", 3389: \"RDP\", 445: \"SMB\"]; ctx.app_protocol = names.containsKey(port) ? names[port] : proto; if (ctx.orig_ip_bytes != null && ctx.resp_ip_bytes != null) { ctx.total_bytes = Long.parseLong(ctx.orig_ip_bytes.toString()) + Long.parseLong(ctx.resp_ip_bytes.toString()); }" } } ] }'
+echo ""
+
+# 4. Create the Zeek Index Template
 echo "Creating/Updating Zeek index template..."
 curl -X PUT $CURL_OPTS "${ES_URL}/_index_template/netguard-zeek-template" -H "Content-Type: application/json" -d'
-{ "index_patterns": ["netguard-zeek-*"], "template": { "settings": { "index.lifecycle.name": "netguard-delete-after-30-days", "index.lifecycle.rollover_alias": "zeek-logs" }, "mappings": { "properties": { "@timestamp": { "type": "date" }, "id_orig_h": { "type": "ip" }, "id_orig_p": { "type": "long" }, "id_resp_h": { "type": "ip" }, "id_resp_p": { "type": "long" }, "proto": { "type": "keyword" }, "conn_state": { "type": "keyword" }, "service": { "type": "keyword" } } } } }'
+{ "index_patterns": ["netguard-zeek-*"], "template": { "settings": { "index.lifecycle.name": "netguard-delete-after-30-days", "index.lifecycle.rollover_alias": "zeek-logs", "index.default_pipeline": "netguard-zeek-enrich" }, "mappings": { "properties": { "@timestamp": { "type": "date" }, "id_orig_h": { "type": "ip" }, "id_orig_p": { "type": "long" }, "id_resp_h": { "type": "ip" }, "id_resp_p": { "type": "long" }, "proto": { "type": "keyword" }, "conn_state": { "type": "keyword" }, "service": { "type": "keyword" }, "app_protocol": { "type": "keyword" }, "total_bytes": { "type": "long" } } } } }'
 
-# 4. Bootstrap the Suricata Alias
+# 5. Bootstrap the Suricata Alias
 SURICATA_ALIAS_EXISTS=$(curl -s -o /dev/null -w "%{http_code}" $CURL_OPTS "${ES_URL}/_alias/suricata-logs")
 if [ "$SURICATA_ALIAS_EXISTS" -eq "404" ]; then
   echo "Bootstrapping Suricata rollover alias."
@@ -60,7 +70,7 @@ else
   echo "Suricata rollover alias already exists."
 fi
 
-# 5. Bootstrap the Zeek Alias
+# 6. Bootstrap the Zeek Alias
 ZEEK_ALIAS_EXISTS=$(curl -s -o /dev/null -w "%{http_code}" $CURL_OPTS "${ES_URL}/_alias/zeek-logs")
 if [ "$ZEEK_ALIAS_EXISTS" -eq "404" ]; then
   echo "Bootstrapping Zeek rollover alias."
@@ -70,4 +80,13 @@ else
   echo "Zeek rollover alias already exists."
 fi
 
+# 7. Attach the enrichment pipeline to Zeek indices created before it existed
+# (the template only applies to new indices).
+echo "Applying Zeek enrichment pipeline and mappings to existing Zeek indices..."
+curl -s -X PUT $CURL_OPTS "${ES_URL}/netguard-zeek-*/_settings" -H "Content-Type: application/json" -d'
+{ "index.default_pipeline": "netguard-zeek-enrich" }'
+curl -s -X PUT $CURL_OPTS "${ES_URL}/netguard-zeek-*/_mapping" -H "Content-Type: application/json" -d'
+{ "properties": { "app_protocol": { "type": "keyword" }, "total_bytes": { "type": "long" } } }'
+echo ""
+
 echo "Elasticsearch setup is complete."
@@ -53,9 +53,12 @@ export const DataProvider = ({ children }) => {
 
     useEffect(() => { fetchAndSet("/api/packets?limit=50", setPackets, "Packets"); }, []);
     useEffect(() => {
-        if (lastJsonMessage && lastJsonMessage.type === 'packet_data') {
-            const newPacket = lastJsonMessage.data;
-            setPackets(p => [newPacket, ...p].slice(0, MAX_PACKETS_IN_LIST));
+        if (!lastJsonMessage) return;
+        // The server coalesces messages into {type: 'batch', messages: [...]} frames.
+        const messages = lastJsonMessage.type === 'batch' ? lastJsonMessage.messages : [lastJsonMessage];
+        const newPackets = messages.filter(m => m.type === 'packet_data').map(m => m.data).reverse();
+        if (newPackets.length > 0) {
+            setPackets(p => [...newPackets, ...p].slice(0, MAX_PACKETS_IN_LIST));
         }
     }, [lastJsonMessage]);
     